@@ -0,0 +1,81 @@
+"""
+Compare the speed of canonicalize_url with the previous (uncached)
+implementation on generated URL corpora
+
+usage:
+
+    python bench-canonicalize.py [number of pages]
+
+"""
+
+import sys
+import cgi
+import time
+import random
+import urllib
+import urlparse
+
+from scrapy.utils.url import canonicalize_url, safe_url_string, parse_url, \
+    _unquotepath, _canonicalize_cache
+
+
+def original_canonicalize_url(url, keep_blank_values=True, keep_fragments=False):
+    scheme, netloc, path, params, query, fragment = parse_url(url)
+    keyvals = cgi.parse_qsl(query, keep_blank_values)
+    keyvals.sort()
+    query = urllib.urlencode(keyvals)
+    path = safe_url_string(_unquotepath(path)) or '/'
+    fragment = '' if not keep_fragments else fragment
+    return urlparse.urlunparse((scheme, netloc.lower(), path, params, query, fragment))
+
+
+def item_url(rnd, i):
+    kind = rnd.random()
+    if kind < 0.5:
+        return 'http://www.example.com/products/item-%d.html' % i
+    elif kind < 0.8:
+        return 'http://www.example.com/catalog?page=%d&sort=price&id=%d' % (i % 50, i)
+    else:
+        return 'http://www.example.com/search/caf%%C3%%A9%%20%d?q=a+b' % i
+
+
+def link_extraction_corpus(pages):
+    """Links found in the pages of a site: the same navigation links on
+    every page and some links to items"""
+    rnd = random.Random(0)
+    nav = ['http://www.example.com/section/%d/' % i for i in range(40)] + \
+        ['http://www.example.com/list?cat=%d&page=1' % i for i in range(20)]
+    urls = []
+    for page in xrange(pages):
+        urls.extend(nav)
+        urls.extend(item_url(rnd, page * 40 + i) for i in range(40))
+    return urls
+
+
+def fingerprint_corpus(pages):
+    """Urls of unique requests"""
+    rnd = random.Random(1)
+    return [item_url(rnd, i) for i in xrange(pages * 100)]
+
+
+def bench(name, func, urls):
+    _canonicalize_cache.__init__(_canonicalize_cache.limit)
+    start = time.time()
+    for url in urls:
+        func(url)
+    elapsed = time.time() - start
+    print "%-40s %6.2f us/url" % (name, elapsed / len(urls) * 1e6)
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for corpus, urls in [('link extraction', link_extraction_corpus(pages)),
+                         ('unique requests', fingerprint_corpus(pages))]:
+        assert all(canonicalize_url(u) == original_canonicalize_url(u) for u in urls)
+        print "%s (%d urls)" % (corpus, len(urls))
+        bench('  original', original_canonicalize_url, urls)
+        bench('  canonicalize_url', canonicalize_url, urls)
+
+
+if __name__ == '__main__':
+    main()
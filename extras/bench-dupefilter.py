@@ -0,0 +1,87 @@
+"""
+Compare memory usage and resume time of the duplicates filters which
+support persistence in a job directory
+
+usage:
+
+    python bench-dupefilter.py [number of fingerprints]
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import resource
+import subprocess
+
+from scrapy.dupefilter import RFPDupeFilter, BinaryRFPDupeFilter, BloomRFPDupeFilter
+
+
+FILTERS = {
+    'RFPDupeFilter': RFPDupeFilter,
+    'BinaryRFPDupeFilter': BinaryRFPDupeFilter,
+    'BloomRFPDupeFilter': BloomRFPDupeFilter,
+}
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def get_filter(name, jobdir):
+    # fingerprints are passed directly instead of requests
+    class BenchDupeFilter(FILTERS[name]):
+        def request_fingerprint(self, request):
+            return request
+    return BenchDupeFilter(jobdir)
+
+
+def populate(name, jobdir, count):
+    df = get_filter(name, jobdir)
+    for i in xrange(count):
+        df.request_seen(hashlib.sha1(str(i)).hexdigest())
+    df.close('shutdown')
+
+
+def resume(name, jobdir, count):
+    before = rss_mb()
+    start = time.time()
+    df = get_filter(name, jobdir)
+    elapsed = time.time() - start
+    mem = rss_mb() - before
+    assert df.request_seen(hashlib.sha1(str(count - 1)).hexdigest())
+    disk = sum(os.path.getsize(os.path.join(jobdir, x)) for x in os.listdir(jobdir))
+    print "%-20s resume: %7.2fs  memory: %8.1f MB  disk: %8.1f MB" % \
+        (name, elapsed, mem, disk / 1024. / 1024)
+    df.close('finished')
+
+
+def main():
+    if len(sys.argv) == 4:
+        action, name, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+        globals()[action](name, os.environ['JOBDIR'], count)
+        return
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print "%d fingerprints" % count
+    for name in sorted(FILTERS):
+        jobdir = tempfile.mkdtemp()
+        env = dict(os.environ, JOBDIR=jobdir)
+        try:
+            for action in ('populate', 'resume'):
+                subprocess.check_call([sys.executable, __file__, action, name,
+                    str(count)], env=env)
+        finally:
+            shutil.rmtree(jobdir)
+
+
+if __name__ == '__main__':
+    main()
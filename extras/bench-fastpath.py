@@ -0,0 +1,99 @@
+"""
+Measure the CPU time per request saved by the SYNC_FASTPATH setting:
+
+* through the default downloader and spider middlewares, with a download
+  handler and a spider callback that return right away, for one request at a
+  time (where every reactor hop is a reactor iteration) and for many at once
+  (where they share reactor iterations). The best of three runs is reported
+* in ``scrapy bench`` (much noisier, as most of its time goes to extracting
+  and scheduling links)
+
+usage:
+
+    python bench-fastpath.py [requests] [seconds per scrapy bench run]
+
+"""
+
+import re
+import sys
+import time
+import subprocess
+
+from twisted.internet import reactor, defer
+
+from scrapy.core.downloader.middleware import DownloaderMiddlewareManager
+from scrapy.core.spidermw import SpiderMiddlewareManager
+from scrapy.http import Request, Response
+from scrapy.spider import Spider
+from scrapy.utils.defer import defer_result
+from scrapy.utils.test import get_crawler
+
+
+@defer.inlineCallbacks
+def bench_chains(nrequests, fastpath, concurrency):
+    crawler = get_crawler({'LOG_ENABLED': False, 'SYNC_FASTPATH': fastpath})
+    spider = Spider('bench')
+    crawler.stats.open_spider(spider)
+    dlmw = DownloaderMiddlewareManager.from_crawler(crawler)
+    spmw = SpiderMiddlewareManager.from_crawler(crawler)
+
+    def download_func(request, spider):
+        return defer.succeed(Response(request.url, request=request))
+
+    def call_spider(response, request, spider):
+        return defer_result([], fastpath)
+
+    def process(i):
+        request = Request('http://www%d.example.com/' % (i % 100))
+        d = dlmw.download(download_func, request, spider)
+        d.addCallback(lambda response: spmw.scrape_response(
+            call_spider, response, request, spider))
+        return d
+
+    start = time.clock()
+    for i in xrange(0, nrequests, concurrency):
+        yield defer.DeferredList([process(j) for j in xrange(i, i + concurrency)])
+    defer.returnValue((time.clock() - start) * 1000000 / nrequests)
+
+
+def bench_scrapy(fastpath, seconds):
+    # the CPU time per response is logged (to stderr) once the crawl is over
+    cmd = [sys.executable, '-m', 'scrapy.cmdline', 'bench', '-s', 'LOG_LEVEL=INFO',
+           '-s', 'CLOSESPIDER_TIMEOUT=%s' % seconds, '-s', 'SYNC_FASTPATH=%d' % fastpath]
+    output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+    m = re.search(r'(\d+) responses, ([\d.]+) ms', output)
+    responses, cpu = int(m.group(1)), float(m.group(2)) * 1000
+    print "scrapy bench, SYNC_FASTPATH=%d: %d responses, %.1f us cpu/response" % \
+        (fastpath, responses, cpu)
+    return cpu
+
+
+def report(name, slow, fast):
+    print "%s: saved %.1f us cpu/request (%.1f%%)" % \
+        (name, slow - fast, (slow - fast) * 100 / slow)
+
+
+@defer.inlineCallbacks
+def main(nrequests, seconds):
+    try:
+        for concurrency in (1, 100):
+            cpu = {}
+            for fastpath in (False, True) * 3:
+                run = yield bench_chains(nrequests, fastpath, concurrency)
+                cpu[fastpath] = min(run, cpu.get(fastpath, run))
+            for fastpath in (False, True):
+                print "middleware chains, concurrency %d, SYNC_FASTPATH=%d: " \
+                    "%.1f us cpu/request" % (concurrency, fastpath, cpu[fastpath])
+            report("middleware chains, concurrency %d" % concurrency,
+                   cpu[False], cpu[True])
+    finally:
+        reactor.stop()
+    if seconds:
+        report("scrapy bench", bench_scrapy(False, seconds), bench_scrapy(True, seconds))
+
+
+if __name__ == '__main__':
+    nrequests = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    reactor.callWhenRunning(main, nrequests, seconds)
+    reactor.run()
@@ -0,0 +1,68 @@
+"""
+Measure the downloader CPU overhead of many download slots with a download
+delay, using a download handler that returns responses right away
+
+usage:
+
+    python bench-slots.py [number of slots] [requests per slot] [delay]
+
+The delay must be longer than the time it takes to enqueue the requests,
+otherwise they don't wait for it.
+
+"""
+
+import sys
+import time
+
+from twisted.internet import reactor, defer
+
+from scrapy.core.downloader import Downloader
+from scrapy.http import Request, Response
+from scrapy.spider import Spider
+from scrapy.utils.test import get_crawler
+
+
+class InstantHandlers(object):
+
+    def download_request(self, request, spider):
+        return defer.succeed(Response(request.url))
+
+
+def bench(nslots, nrequests, delay):
+    crawler = get_crawler({'DOWNLOAD_DELAY': delay,
+                           'RANDOMIZE_DOWNLOAD_DELAY': False})
+    downloader = Downloader(crawler)
+    downloader.handlers = InstantHandlers()
+    spider = Spider('bench')
+
+    start = time.clock()
+    dfds = []
+    for i in xrange(nrequests):
+        for s in xrange(nslots):
+            request = Request('http://www%d.example.com/%d' % (s, i))
+            dfds.append(downloader._enqueue_request(request, spider))
+    print "enqueue %d requests: %.2fs cpu, %d delayed reactor calls" % \
+        (len(dfds), time.clock() - start, len(reactor.getDelayedCalls()))
+
+    def report(_):
+        print "download all requests: %.2fs cpu" % (time.clock() - start)
+        for slot in downloader.slots.itervalues():
+            slot.lastseen -= 3600
+        gcstart = time.clock()
+        downloader._slot_gc()
+        print "collect %d idle slots: %.2fs cpu" % (nslots, time.clock() - gcstart)
+        gcstart = time.clock()
+        downloader._slot_gc()
+        print "slot gc without slots: %.4fs cpu" % (time.clock() - gcstart)
+        downloader.close()
+        reactor.stop()
+
+    defer.DeferredList(dfds).addCallback(report)
+
+
+if __name__ == '__main__':
+    nslots = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nrequests = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+    reactor.callWhenRunning(bench, nslots, nrequests, delay)
+    reactor.run()
@@ -0,0 +1,91 @@
+"""
+Compare the speed and disk usage of the scheduler disk queues, including
+request (de)serialization
+
+usage:
+
+    python bench-squeue.py [number of requests]
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from scrapy.http import Request
+from scrapy.spider import Spider
+from scrapy.settings import default_settings
+from scrapy.squeue import PickleLifoDiskQueue, MarshalLifoDiskQueue, CompactLifoDiskQueue
+from scrapy.utils.reqser import request_to_dict, request_from_dict, RequestCodec
+from scrapy.utils.request import request_fingerprint
+
+
+class BenchSpider(Spider):
+    name = 'bench'
+
+    def parse_item(self, response):
+        pass
+
+
+def get_requests(spider, count):
+    headers = default_settings.DEFAULT_REQUEST_HEADERS
+    for i in xrange(count):
+        url = 'http://www%d.example.com/category/%d/item.html?id=%d&sort=asc' % \
+            (i % 100, i % 1000, i)
+        meta = {'depth': i % 5, 'download_slot': 'www%d.example.com' % (i % 100)}
+        # requests coming back from the downloader (retries, redirects)
+        # already have the default headers
+        yield Request(url, callback=spider.parse_item, meta=meta,
+            headers=headers if i % 10 == 0 else None)
+
+
+def bench(name, qclass, spider, requests):
+    qdir = tempfile.mkdtemp()
+    path = os.path.join(qdir, 'q')
+    if getattr(qclass, 'request_codec', False):
+        codec = RequestCodec(os.path.join(qdir, 'names.json'),
+            default_settings.DEFAULT_REQUEST_HEADERS)
+        encode = lambda r: codec.encode(r, spider)
+        decode = lambda d: codec.decode(d, spider)
+    else:
+        encode = lambda r: request_to_dict(r, spider)
+        decode = lambda d: request_from_dict(d, spider)
+    try:
+        q = qclass(path)
+        start = time.time()
+        for r in requests:
+            q.push(encode(r))
+        pushtime = time.time() - start
+        size = os.path.getsize(path)
+        start = time.time()
+        d = q.pop()
+        while d:
+            decode(d)
+            d = q.pop()
+        poptime = time.time() - start
+        q.close()
+    finally:
+        shutil.rmtree(qdir)
+    n = len(requests)
+    print "%-22s push: %6.1f us/req  pop: %6.1f us/req  disk: %6.1f bytes/req" % \
+        (name, pushtime / n * 1e6, poptime / n * 1e6, float(size) / n)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    spider = BenchSpider()
+    requests = list(get_requests(spider, count))
+    # the dupefilter fingerprints requests before they are enqueued
+    for r in requests:
+        request_fingerprint(r)
+    print "%d requests" % count
+    for name, qclass in [('PickleLifoDiskQueue', PickleLifoDiskQueue),
+                         ('MarshalLifoDiskQueue', MarshalLifoDiskQueue),
+                         ('CompactLifoDiskQueue', CompactLifoDiskQueue)]:
+        bench(name, qclass, spider, requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,8 @@ def get_commands():
         'list-resources': cmd_list_resources,
         'get-global-stats': cmd_get_global_stats,
         'get-spider-stats': cmd_get_spider_stats,
+        'start-profiler': cmd_start_profiler,
+        'stop-profiler': cmd_stop_profiler,
     }
 
 def cmd_help(args, opts):
@@ -65,6 +67,16 @@ def cmd_get_global_stats(args, opts):
     for name, value in stats.items():
         print("%-40s %s" % (name, value))
 
+def cmd_start_profiler(args, opts):
+    """start-profiler - start the sampling profiler"""
+    jsonrpc_call(opts, 'profiler', 'start')
+
+def cmd_stop_profiler(args, opts):
+    """stop-profiler - stop the sampling profiler, and list its dumps"""
+    jsonrpc_call(opts, 'profiler', 'stop')
+    for x in json_get(opts, 'profiler')['dumps']:
+        print(x)
+
 def get_wsurl(opts, path):
     return urljoin("http://%s:%s/"% (opts.host, opts.port), path)
 
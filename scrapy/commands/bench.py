@@ -1,3 +1,6 @@
+import time
+
+from scrapy import log, signals
 from scrapy.command import ScrapyCommand
 from scrapy.tests.spiders import FollowAllSpider
 from scrapy.tests.mockserver import MockServer
@@ -18,4 +21,28 @@ class Command(ScrapyCommand):
             spider = FollowAllSpider(total=100000)
             crawler = self.crawler_process.create_crawler()
             crawler.crawl(spider)
+            timer = _CPUTimeReport(crawler)
+            crawler.signals.connect(timer.engine_started, signals.engine_started)
+            crawler.signals.connect(timer.engine_stopped, signals.engine_stopped)
             self.crawler_process.start()
+
+
+class _CPUTimeReport(object):
+    """Log the CPU time spent per response while the engine was running"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.start = None
+
+    def engine_started(self):
+        self.start = time.clock()
+
+    def engine_stopped(self):
+        if self.start is None:
+            return
+        cputime = time.clock() - self.start
+        responses = self.crawler.stats.get_value('response_received_count', 0)
+        if responses:
+            log.msg(format="%(responses)d responses, %(cputime).3f ms of CPU "
+                    "time per response", level=log.INFO, responses=responses,
+                    cputime=cputime * 1000 / responses)
@@ -1,6 +1,7 @@
 from scrapy.command import ScrapyCommand
 from scrapy.utils.conf import arglist_to_dict
 from scrapy.exceptions import UsageError
+from scrapy.workers import WorkerPool
 
 class Command(ScrapyCommand):
 
@@ -20,6 +21,8 @@ class Command(ScrapyCommand):
             help="dump scraped items into FILE (use - for stdout)")
         parser.add_option("-t", "--output-format", metavar="FORMAT", default="jsonlines", \
             help="format to use for dumping items with -o (default: %default)")
+        parser.add_option("-w", "--workers", type="int", default=1, metavar="N", \
+            help="run the spider in N processes, sharding sites among them (default: %default)")
 
     def process_options(self, args, opts):
         ScrapyCommand.process_options(self, args, opts)
@@ -36,6 +39,8 @@ class Command(ScrapyCommand):
             if opts.output_format not in valid_output_formats:
                 raise UsageError('Invalid/unrecognized output format: %s, Expected %s' % (opts.output_format, valid_output_formats))
             self.settings.overrides['FEED_FORMAT'] = opts.output_format
+        if opts.workers < 1:
+            raise UsageError("Invalid --workers value, use a positive number", print_help=False)
 
     def run(self, args, opts):
         if len(args) < 1:
@@ -46,5 +51,11 @@ class Command(ScrapyCommand):
 
         crawler = self.crawler_process.create_crawler()
         spider = crawler.spiders.create(spname, **opts.spargs)
+        if opts.workers > 1:
+            spider.set_crawler(crawler)
+            pool = WorkerPool(self.settings, spider, opts.spargs, opts.workers)
+            pool.start()
+            self.exitcode = pool.exitcode
+            return
         crawler.crawl(spider)
         self.crawler_process.start()
@@ -0,0 +1,31 @@
+"""
+CPUStats extension
+
+See documentation in docs/topics/extensions.rst
+"""
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.telnet import update_telnet_vars
+
+
+class CPUStats(object):
+
+    def __init__(self, timer, stats):
+        self.timer = timer
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if crawler.cputimer is None:
+            raise NotConfigured
+        o = cls(crawler.cputimer, crawler.stats)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(o.update_telnet_vars, signal=update_telnet_vars)
+        return o
+
+    def spider_closed(self, spider):
+        self.timer.flush(self.stats, spider=spider)
+
+    def update_telnet_vars(self, telnet_vars):
+        telnet_vars['cpu'] = self.timer.print_times
@@ -0,0 +1,135 @@
+"""
+Adjust the concurrency of every download slot to what its site can sustain,
+with an additive increase, multiplicative decrease (AIMD) policy.
+
+See documentation in docs/topics/downloader-middleware.rst
+"""
+
+import weakref
+from time import time
+
+from twisted.internet.defer import TimeoutError as UserTimeoutError
+from twisted.internet.error import TimeoutError as ServerTimeoutError, \
+        TCPTimedOutError
+
+from scrapy import log
+from scrapy.exceptions import NotConfigured
+
+
+class _SlotState(object):
+    """Responses of the current window of a slot, which ends once it has as
+    many responses as the slot concurrency (about one round trip, if the slot
+    is busy)"""
+
+    def __init__(self, maxconcurrency):
+        self.maxconcurrency = maxconcurrency
+        self.throughput = 0
+        self.reset()
+
+    def reset(self, skip=0):
+        self.started = time()
+        self.responses = 0
+        self.measured = 0
+        self.latency = 0
+        # responses to ignore before the window starts
+        self.skip = skip
+
+
+class AutoConcurrencyMiddleware(object):
+
+    BACKOFF_HTTP_CODES = (429, 503)
+    BACKOFF_EXCEPTIONS = (ServerTimeoutError, UserTimeoutError, TCPTimedOutError)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('AUTOCONCURRENCY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.start = settings.getint('AUTOCONCURRENCY_START')
+        self.minconcurrency = settings.getint('AUTOCONCURRENCY_MIN')
+        self.maxconcurrency = settings.getint('AUTOCONCURRENCY_MAX')
+        self.target_latency = settings.getfloat('AUTOCONCURRENCY_TARGET_LATENCY')
+        self.backoff = settings.getfloat('AUTOCONCURRENCY_BACKOFF')
+        self.debug = settings.getbool('AUTOCONCURRENCY_DEBUG')
+        # slots are collected by the downloader once idle, with their state
+        self._states = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request, spider):
+        key, slot = self.crawler.engine.downloader._get_slot(request, spider)
+        if slot not in self._states:
+            state = self._states[slot] = _SlotState(
+                self.maxconcurrency or slot.concurrency)
+            slot.concurrency = self._bound(self.start, state)
+
+    def process_response(self, request, response, spider):
+        key, slot, state = self._get_state(request)
+        if state is None:
+            return response
+        if response.status in self.BACKOFF_HTTP_CODES:
+            self._update(key, slot, state, spider,
+                         backoff='status %d' % response.status)
+        else:
+            self._update(key, slot, state, spider,
+                         latency=request.meta.get('download_latency'))
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot, state = self._get_state(request)
+        if state is not None and isinstance(exception, self.BACKOFF_EXCEPTIONS):
+            self._update(key, slot, state, spider,
+                         backoff=exception.__class__.__name__)
+
+    def _get_state(self, request):
+        # responses from the cache never got to a slot
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key)
+        return key, slot, self._states.get(slot) if slot is not None else None
+
+    def _update(self, key, slot, state, spider, latency=None, backoff=None):
+        # the responses of the requests sent before backing off don't tell
+        # anything new, so they don't back off again
+        if state.skip:
+            state.skip -= 1
+            if not state.skip:
+                state.reset()
+            return
+        if backoff:
+            state.throughput = 0
+            state.reset(skip=len(slot.transferring))
+            self._set_concurrency(key, slot, state, spider,
+                                  int(slot.concurrency * self.backoff), backoff)
+            return
+
+        state.responses += 1
+        if latency is not None:
+            state.measured += 1
+            state.latency += latency
+        if state.responses < slot.concurrency:
+            return
+
+        throughput = state.responses / max(time() - state.started, 0.001)
+        concurrency, reason = slot.concurrency, 'hold'
+        if state.measured:
+            latency = state.latency / state.measured
+            if latency > self.target_latency:
+                concurrency, reason = concurrency - 1, 'latency %.3fs' % latency
+            elif throughput > state.throughput:
+                concurrency, reason = concurrency + 1, \
+                    'throughput %.2f/s' % throughput
+        state.throughput = throughput
+        state.reset()
+        self._set_concurrency(key, slot, state, spider, concurrency, reason)
+
+    def _set_concurrency(self, key, slot, state, spider, concurrency, reason):
+        old, slot.concurrency = slot.concurrency, self._bound(concurrency, state)
+        if self.debug:
+            log.msg(format="Slot %(slot)s concurrency: %(old)d -> %(new)d (%(reason)s)",
+                    level=log.INFO, spider=spider, slot=key, old=old,
+                    new=slot.concurrency, reason=reason)
+
+    def _bound(self, concurrency, state):
+        return max(self.minconcurrency, min(concurrency, state.maxconcurrency))
@@ -1,30 +1,43 @@
-import zlib
-
-from scrapy.utils.gz import gunzip, is_gzipped
+from scrapy.utils.gz import decompress, is_gzipped, DecompressionMaxSizeExceeded
 from scrapy.http import Response, TextResponse
 from scrapy.responsetypes import responsetypes
-from scrapy.exceptions import NotConfigured
+from scrapy.exceptions import NotConfigured, IgnoreRequest
+from scrapy import log
 
 
 class HttpCompressionMiddleware(object):
     """This middleware allows compressed (gzip, deflate) traffic to be
     sent/received from web sites"""
-    
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+
     @classmethod
     def from_crawler(cls, crawler):
         if not crawler.settings.getbool('COMPRESSION_ENABLED'):
             raise NotConfigured
-        return cls()
-    
+        return cls(crawler.settings.getint('DOWNLOAD_MAXSIZE'))
+
     def process_request(self, request, spider):
         request.headers.setdefault('Accept-Encoding', 'gzip,deflate')
+        # download handlers supporting it decompress the body while it's
+        # received, see HTTP11DownloadHandler
+        request.meta['_decompress'] = True
 
     def process_response(self, request, response, spider):
         if isinstance(response, Response):
             content_encoding = response.headers.getlist('Content-Encoding')
             if content_encoding and not is_gzipped(response):
                 encoding = content_encoding.pop()
-                decoded_body = self._decode(response.body, encoding.lower())
+                maxsize = request.meta.get('download_maxsize', self.maxsize)
+                try:
+                    decoded_body = self._decode(response.body, encoding.lower(), maxsize)
+                except DecompressionMaxSizeExceeded:
+                    log.msg(format="Ignoring response %(response)r: decompressed "
+                            "size larger than download max size (%(maxsize)s)",
+                            level=log.WARNING, spider=spider, response=response,
+                            maxsize=maxsize)
+                    raise IgnoreRequest()
                 respcls = responsetypes.from_args(headers=response.headers, \
                     url=response.url)
                 kwargs = dict(cls=respcls, body=decoded_body)
@@ -38,19 +51,7 @@ class HttpCompressionMiddleware(object):
 
         return response
 
-    def _decode(self, body, encoding):
-        if encoding == 'gzip' or encoding == 'x-gzip':
-            body = gunzip(body)
-
-        if encoding == 'deflate':
-            try:
-                body = zlib.decompress(body)
-            except zlib.error:
-                # ugly hack to work with raw deflate content that may
-                # be sent by microsoft servers. For more information, see:
-                # http://carsten.codimi.de/gzip.yaws/
-                # http://www.port80software.com/200ok/archive/2005/10/31/868.aspx
-                # http://www.gzip.org/zlib/zlib_faq.html#faq38
-                body = zlib.decompress(body, -15)
+    def _decode(self, body, encoding, maxsize=0):
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            body = decompress(body, encoding, maxsize)
         return body
-
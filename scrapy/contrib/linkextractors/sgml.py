@@ -149,7 +149,7 @@ class SgmlLinkExtractor(BaseSgmlLinkExtractor):
         if self.deny_extensions:
             allowed &= not url_has_any_extension(parsed_url, self.deny_extensions)
         if allowed and self.canonicalize:
-            link.url = canonicalize_url(parsed_url)
+            link.url = canonicalize_url(link.url)
         return allowed
 
     def matches(self, url):
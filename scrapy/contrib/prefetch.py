@@ -0,0 +1,66 @@
+"""
+Prefetch extension
+
+Resolves the host names of scheduled requests (and optionally connects to
+them) before the requests reach the downloader.
+
+See documentation in docs/topics/extensions.rst
+"""
+
+from twisted.internet import reactor
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.datatypes import LocalCache
+from scrapy.utils.httpobj import urlparse_cached
+
+
+class Prefetch(object):
+
+    def __init__(self, crawler):
+        if not crawler.settings.getbool('PREFETCH_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.connect = crawler.settings.getbool('PREFETCH_CONNECT')
+        self.concurrency = crawler.settings.getint('PREFETCH_CONCURRENCY')
+        self.timeout = crawler.settings.getfloat('DNS_TIMEOUT')
+        self.pending = 0
+        # hosts already prefetched
+        self.seen = LocalCache(crawler.settings.getint('DNSCACHE_SIZE') or 10000)
+        crawler.signals.connect(self.request_scheduled, signal=signals.request_scheduled)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def request_scheduled(self, request, spider):
+        if self.pending >= self.concurrency or request.meta.get('proxy'):
+            return
+        host = urlparse_cached(request).hostname
+        if not host or host in self.seen:
+            return
+        self.seen[host] = True
+        self.pending += 1
+        self.stats.inc_value('prefetch/dns', spider=spider)
+        d = reactor.resolve(host, (self.timeout,))
+        if self.connect:
+            d.addCallback(self._preconnect, request, spider)
+        d.addErrback(self._prefetch_failed, spider)
+        d.addBoth(self._prefetch_done)
+
+    def _preconnect(self, _, request, spider):
+        # only hosts without a download slot, a slot that exists already is
+        # either downloading (and has its connections) or delayed
+        downloader = self.crawler.engine.downloader
+        if downloader._get_slot_key(request, spider) in downloader.slots:
+            return
+        self.stats.inc_value('prefetch/connect', spider=spider)
+        return downloader.handlers.preconnect(request)
+
+    def _prefetch_failed(self, failure, spider):
+        # the download of the request will report the error
+        self.stats.inc_value('prefetch/error', spider=spider)
+
+    def _prefetch_done(self, _):
+        self.pending -= 1
@@ -0,0 +1,173 @@
+"""
+SamplingProfiler extension
+
+See documentation in docs/topics/extensions.rst
+"""
+
+import os
+import sys
+import glob
+import thread
+import threading
+from time import sleep, strftime
+
+from twisted.internet import task
+
+from scrapy import log, signals
+
+
+def _label(func):
+    filename, lineno, name = func
+    return '%s %s:%d' % (name, filename, lineno)
+
+
+def write_callgrind(samples, f):
+    """Write the given stack samples in the callgrind format (as read by
+    kcachegrind), with the samples as cost"""
+    selfcost = {}
+    # caller -> callee -> samples in which callee was called by caller
+    calls = {}
+    for stack, count in samples.iteritems():
+        selfcost[stack[-1]] = selfcost.get(stack[-1], 0) + count
+        for edge in set(zip(stack, stack[1:])):
+            caller, callee = edge
+            callees = calls.setdefault(caller, {})
+            callees[callee] = callees.get(callee, 0) + count
+    f.write('events: Samples\n')
+    f.write('summary: %d\n\n' % sum(samples.itervalues()))
+    for func in set(selfcost) | set(calls):
+        f.write('fl=%s\nfn=%s\n' % (func[0], _label(func)))
+        f.write('%d %d\n' % (func[1], selfcost.get(func, 0)))
+        for callee, count in calls.get(func, {}).iteritems():
+            f.write('cfl=%s\ncfn=%s\n' % (callee[0], _label(callee)))
+            f.write('calls=%d %d\n' % (count, callee[1]))
+            f.write('%d %d\n' % (func[1], count))
+        f.write('\n')
+
+
+def write_folded(samples, f):
+    """Write the given stack samples as folded stacks, one per line (as read
+    by flamegraph.pl)"""
+    for stack, count in samples.iteritems():
+        frames = ['%s (%s:%d)' % (name, filename, lineno)
+                  for filename, lineno, name in stack]
+        f.write('%s %d\n' % (';'.join(frames), count))
+
+
+class SamplingProfiler(object):
+    """Sample the stack of the reactor thread from another thread, and dump
+    the samples periodically to callgrind and folded stacks files"""
+
+    def __init__(self, stats, directory, interval=0.01, dump_interval=600,
+                 max_dumps=10):
+        self.stats = stats
+        self.directory = directory
+        self.interval = interval
+        self.dump_interval = dump_interval
+        self.max_dumps = max_dumps
+        self.running = False
+        # stack (tuple of (filename, firstlineno, name), outermost first)
+        # -> number of samples
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._dumped = 0
+        self._task = task.LoopingCall(self.dump)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        o = cls(crawler.stats, settings['PROFILER_DIR'],
+                settings.getfloat('PROFILER_INTERVAL'),
+                settings.getfloat('PROFILER_DUMP_INTERVAL'),
+                settings.getint('PROFILER_MAX_DUMPS'))
+        if settings.getbool('PROFILER_ENABLED'):
+            crawler.signals.connect(o.start, signal=signals.engine_started)
+        crawler.signals.connect(o.stop, signal=signals.engine_stopped)
+        return o
+
+    def start(self):
+        """Start sampling the thread calling this method (the reactor one)"""
+        if self.running:
+            return False
+        self.running = True
+        self._thread = threading.Thread(target=self._sample,
+                                        args=(thread.get_ident(),),
+                                        name='SamplingProfiler')
+        self._thread.daemon = True
+        self._thread.start()
+        if self.dump_interval:
+            self._task.start(self.dump_interval, now=False)
+        log.msg(format="Sampling profiler started, dumping to %(directory)s",
+                level=log.INFO, directory=self.directory)
+        return True
+
+    def stop(self):
+        """Stop sampling, and dump the samples not dumped yet"""
+        if not self.running:
+            return False
+        self.running = False
+        self._thread.join()
+        self._thread = None
+        if self._task.running:
+            self._task.stop()
+        self.dump()
+        log.msg("Sampling profiler stopped", level=log.INFO)
+        return True
+
+    def status(self):
+        with self._lock:
+            samples = sum(self.samples.itervalues())
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'samples': samples,
+            'dumps': self._dumps(),
+        }
+
+    def dump(self):
+        """Write the samples taken since the last dump, and return the paths
+        of the written files"""
+        with self._lock:
+            samples, self.samples = self.samples, {}
+        if not samples:
+            return []
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # several dumps can be written in the same second
+        self._dumped += 1
+        prefix = os.path.join(self.directory, 'profile-%d-%s-%d' %
+                              (os.getpid(), strftime('%Y%m%d-%H%M%S'), self._dumped))
+        with open(prefix + '.callgrind', 'w') as f:
+            write_callgrind(samples, f)
+        with open(prefix + '.folded', 'w') as f:
+            write_folded(samples, f)
+        self.stats.inc_value('profiler/samples', sum(samples.itervalues()))
+        self.stats.inc_value('profiler/dumps')
+        if self.max_dumps:
+            for old in self._dumps()[:-self.max_dumps]:
+                for path in (old, old[:-len('.callgrind')] + '.folded'):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return [prefix + '.callgrind', prefix + '.folded']
+
+    def _dumps(self):
+        # other processes (or crawlers) may dump to the same directory
+        paths = glob.glob(os.path.join(self.directory, 'profile-%d-*.callgrind'
+                                       % os.getpid()))
+        return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+    def _sample(self, thread_id):
+        while self.running:
+            sleep(self.interval)
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if not stack:
+                continue
+            stack = tuple(reversed(stack))
+            with self._lock:
+                self.samples[stack] = self.samples.get(stack, 0) + 1
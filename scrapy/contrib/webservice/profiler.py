@@ -0,0 +1,19 @@
+from scrapy.contrib.profiler import SamplingProfiler
+from scrapy.webservice import JsonRpcResource
+
+class ProfilerResource(JsonRpcResource):
+
+    ws_name = 'profiler'
+
+    def __init__(self, crawler):
+        JsonRpcResource.__init__(self, crawler)
+
+    def render_GET(self, txrequest):
+        profiler = self.get_target()
+        return profiler.status() if profiler else None
+
+    def get_target(self):
+        # the extensions aren't loaded yet when the web service is created
+        for ext in self.crawler.extensions.middlewares:
+            if isinstance(ext, SamplingProfiler):
+                return ext
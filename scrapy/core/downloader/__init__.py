@@ -1,15 +1,20 @@
+import heapq
 import random
 import warnings
 from time import time
-from collections import deque
+from itertools import count
+from collections import deque, OrderedDict
 
 from twisted.internet import reactor, defer, task
 
 from scrapy.utils.defer import mustbe_deferred
 from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.request import request_fingerprint
+from scrapy.utils.timings import add_timing
 from scrapy.resolver import dnscache
 from scrapy.exceptions import ScrapyDeprecationWarning
 from scrapy import signals
+from scrapy.http import Response
 from .middleware import DownloaderMiddlewareManager
 from .handlers import DownloadHandlers
 
@@ -25,7 +30,9 @@ class Slot(object):
         self.queue = deque()
         self.transferring = set()
         self.lastseen = 0
-        self.latercall = None
+        # time when the downloader will process the queue of the slot again,
+        # if it's waiting for the download delay
+        self.readyat = None
 
     def free_transfer_slots(self):
         return self.concurrency - len(self.transferring)
@@ -36,8 +43,7 @@ class Slot(object):
         return self.delay
 
     def close(self):
-        if self.latercall and self.latercall.active():
-            self.latercall.cancel()
+        self.readyat = None
 
 
 def _get_concurrency_delay(concurrency, spider, settings):
@@ -68,6 +74,7 @@ class Downloader(object):
     def __init__(self, crawler):
         self.settings = crawler.settings
         self.signals = crawler.signals
+        self.stats = crawler.stats
         self.slots = {}
         self.active = set()
         self.handlers = DownloadHandlers(crawler)
@@ -75,6 +82,18 @@ class Downloader(object):
         self.domain_concurrency = self.settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
         self.ip_concurrency = self.settings.getint('CONCURRENT_REQUESTS_PER_IP')
         self.middleware = DownloaderMiddlewareManager.from_crawler(crawler)
+        self.coalesce = self.settings.getbool('DOWNLOADER_COALESCE')
+        self.coalesce_headers = self.settings.getlist('DOWNLOADER_COALESCE_HEADERS')
+        # requests being downloaded (by key) and the ones waiting for them
+        self._inflight = {}
+        # (ready time, sequence, slot, spider) heap of the delayed slots,
+        # processed by a single reactor call scheduled for the earliest one
+        self._timers = []
+        self._timerseq = count()
+        self._timer = None
+        self._timerat = None
+        # slots without active requests, least recently used first
+        self._idle_slots = OrderedDict()
         self._slot_gc_loop = task.LoopingCall(self._slot_gc)
         self._slot_gc_loop.start(60)
 
@@ -84,7 +103,8 @@ class Downloader(object):
             return response
 
         self.active.add(request)
-        dfd = self.middleware.download(self._enqueue_request, request, spider)
+        download_func = self._coalesce_request if self.coalesce else self._enqueue_request
+        dfd = self.middleware.download(download_func, request, spider)
         return dfd.addBoth(_deactivate)
 
     def needs_backout(self):
@@ -109,22 +129,58 @@ class Downloader(object):
 
         return key
 
+    def _coalesce_request(self, request, spider):
+        """Download the request, unless an identical one is being downloaded
+        already, in which case its response (or failure) is used"""
+        if request.meta.get('dont_coalesce'):
+            return self._enqueue_request(request, spider)
+        key = (request_fingerprint(request, self.coalesce_headers),
+               request.meta.get('proxy'))
+        waiters = self._inflight.get(key)
+        if waiters is not None:
+            self.stats.inc_value('downloader/coalesced_count', spider=spider)
+            deferred = defer.Deferred()
+            waiters.append((request, deferred))
+            return deferred
+
+        waiters = self._inflight[key] = []
+        def _fanout(result):
+            del self._inflight[key]
+            for waiter, deferred in waiters:
+                # as if the waiter had been downloaded along with the request
+                for k in ('download_slot', 'download_latency'):
+                    if k in request.meta:
+                        waiter.meta[k] = request.meta[k]
+                if isinstance(result, Response):
+                    # every request gets its own response object, as the
+                    # engine ties them together
+                    deferred.callback(result.replace(
+                        flags=result.flags + ['coalesced']))
+                else:
+                    deferred.errback(result)
+            return result
+        return self._enqueue_request(request, spider).addBoth(_fanout)
+
     def _enqueue_request(self, request, spider):
         key, slot = self._get_slot(request, spider)
         request.meta['download_slot'] = key
 
         def _deactivate(response):
             slot.active.remove(request)
+            if not slot.active:
+                self._idle_slots[key] = slot
             return response
 
+        if not slot.active:
+            self._idle_slots.pop(key, None)
         slot.active.add(request)
         deferred = defer.Deferred().addBoth(_deactivate)
-        slot.queue.append((request, deferred))
+        slot.queue.append((request, deferred, time()))
         self._process_queue(spider, slot)
         return deferred
 
     def _process_queue(self, spider, slot):
-        if slot.latercall and slot.latercall.active():
+        if slot.readyat is not None or not slot.queue:
             return
 
         # Delay queue processing if a download_delay is configured
@@ -133,20 +189,52 @@ class Downloader(object):
         if delay:
             penalty = delay - now + slot.lastseen
             if penalty > 0:
-                slot.latercall = reactor.callLater(penalty, self._process_queue, spider, slot)
+                self._schedule_slot(spider, slot, now + penalty)
                 return
 
         # Process enqueued requests if there are free slots to transfer for this slot
         while slot.queue and slot.free_transfer_slots() > 0:
             slot.lastseen = now
-            request, deferred = slot.queue.popleft()
+            request, deferred, queued_at = slot.queue.popleft()
+            add_timing(request, 'slot_queue', now - queued_at)
             dfd = self._download(slot, request, spider)
             dfd.chainDeferred(deferred)
             # prevent burst if inter-request delays were configured
             if delay:
-                self._process_queue(spider, slot)
+                if slot.queue:
+                    self._schedule_slot(spider, slot, now + slot.download_delay())
                 break
 
+    def _schedule_slot(self, spider, slot, readyat):
+        if slot.readyat is not None:
+            return
+        slot.readyat = readyat
+        heapq.heappush(self._timers, (readyat, next(self._timerseq), slot, spider))
+        self._schedule_timer()
+
+    def _schedule_timer(self):
+        if not self._timers:
+            return
+        readyat = self._timers[0][0]
+        if self._timer and self._timer.active():
+            if self._timerat <= readyat:
+                return
+            self._timer.cancel()
+        self._timerat = readyat
+        self._timer = reactor.callLater(max(0, readyat - time()), self._run_timers)
+
+    def _run_timers(self):
+        self._timer = None
+        now = time()
+        timers = self._timers
+        while timers and timers[0][0] <= now:
+            readyat, _, slot, spider = heapq.heappop(timers)
+            # skip the slots closed since they were scheduled
+            if slot.readyat == readyat:
+                slot.readyat = None
+                self._process_queue(spider, slot)
+        self._schedule_timer()
+
     def _download(self, slot, request, spider):
         # The order is very important for the following deferreds. Do not change!
 
@@ -178,11 +266,18 @@ class Downloader(object):
 
     def close(self):
         self._slot_gc_loop.stop()
+        if self._timer and self._timer.active():
+            self._timer.cancel()
         for slot in self.slots.itervalues():
             slot.close()
 
     def _slot_gc(self, age=60):
+        # only idle slots are checked, from the least recently used one
         mintime = time() - age
-        for key, slot in self.slots.items():
-            if not slot.active and slot.lastseen + slot.delay < mintime:
+        while self._idle_slots:
+            key, slot = next(self._idle_slots.iteritems())
+            if slot.lastseen + slot.delay >= mintime:
+                break
+            del self._idle_slots[key]
+            if self.slots.get(key) is slot:
                 self.slots.pop(key).close()
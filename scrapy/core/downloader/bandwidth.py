@@ -0,0 +1,100 @@
+"""
+Byte rate limits for the downloads, with token buckets.
+
+See documentation in docs/topics/settings.rst
+"""
+
+from time import time
+
+from twisted.internet import task
+
+from scrapy.utils.datatypes import GenerationalCache
+
+
+class TokenBucket(object):
+    """Token bucket which gets ``rate`` tokens (bytes) per second, holding at
+    most ``burst`` of them (one second worth of them, by default).
+
+    Taking more tokens than available leaves the bucket in debt, so a large
+    chunk of data can always be taken and only the next ones wait for it.
+    """
+
+    def __init__(self, rate, burst=None, clock=time):
+        self.rate = float(rate)
+        self.burst = burst or self.rate
+        self.tokens = self.burst
+        self._clock = clock
+        self._updated = clock()
+
+    def consume(self, amount):
+        """Take amount tokens, and return the seconds to wait until the
+        bucket isn't in debt anymore"""
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class BandwidthLimiter(object):
+    """Limit the bytes per second received by all the downloads (``rate``)
+    and by the downloads of every slot (``slot_rate``), and keep the current
+    rates in the stats"""
+
+    # seconds between updates of the rates in the stats
+    interval = 1.0
+
+    def __init__(self, rate=0, slot_rate=0, stats=None, clock=time):
+        self.bucket = TokenBucket(rate, clock=clock) if rate else None
+        self.slot_rate = slot_rate
+        self.slot_buckets = GenerationalCache(10000)
+        self._clock = clock
+        self._stats = stats
+        self._bytes = 0
+        self._slot_bytes = {}
+        self._started = clock()
+        self._task = task.LoopingCall(self._update_stats)
+
+    @classmethod
+    def from_settings(cls, settings, stats=None):
+        rate = settings.getint('BANDWIDTH_LIMIT')
+        slot_rate = settings.getint('BANDWIDTH_LIMIT_PER_SLOT')
+        if rate or slot_rate:
+            return cls(rate, slot_rate, stats)
+
+    def start(self):
+        self._task.start(self.interval, now=False)
+
+    def stop(self):
+        if self._task.running:
+            self._task.stop()
+
+    def consume(self, amount, slot=None):
+        """Account for amount bytes received by a download of the given slot,
+        and return the seconds to wait before receiving more"""
+        self._bytes += amount
+        delay = self.bucket.consume(amount) if self.bucket else 0
+        if self.slot_rate and slot is not None:
+            self._slot_bytes[slot] = self._slot_bytes.get(slot, 0) + amount
+            bucket = self.slot_buckets.get(slot)
+            if bucket is None:
+                bucket = self.slot_buckets[slot] = TokenBucket(self.slot_rate,
+                                                               clock=self._clock)
+            delay = max(delay, bucket.consume(amount))
+        if delay and self._stats is not None:
+            self._stats.inc_value('bandwidth/throttled')
+        return delay
+
+    def _update_stats(self):
+        now = self._clock()
+        elapsed = max(now - self._started, 0.001)
+        rate = self._bytes / elapsed
+        slot_rate = max(self._slot_bytes.itervalues()) / elapsed \
+            if self._slot_bytes else 0
+        self._started, self._bytes, self._slot_bytes = now, 0, {}
+        if self._stats is not None:
+            self._stats.set_value('bandwidth/rate', int(rate))
+            self._stats.max_value('bandwidth/rate_max', int(rate))
+            if self.slot_rate:
+                self._stats.set_value('bandwidth/slot_rate', int(slot_rate))
+                self._stats.max_value('bandwidth/slot_rate_max', int(slot_rate))
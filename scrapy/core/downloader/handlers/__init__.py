@@ -21,7 +21,10 @@ class DownloadHandlers(object):
                 continue
             cls = load_object(clspath)
             try:
-                dh = cls(crawler.settings)
+                if hasattr(cls, 'from_crawler'):
+                    dh = cls.from_crawler(crawler)
+                else:
+                    dh = cls(crawler.settings)
             except NotConfigured as ex:
                 self._notconfigured[scheme] = str(ex)
             else:
@@ -39,6 +42,14 @@ class DownloadHandlers(object):
             raise NotSupported("Unsupported URL scheme '%s': %s" % (scheme, msg))
         return handler(request, spider)
 
+    def preconnect(self, request):
+        """Ask the handler of the request to open a connection for it ahead of
+        its download. Handlers without a ``preconnect`` method are skipped."""
+        handler = self._handlers.get(urlparse_cached(request).scheme)
+        if hasattr(handler, 'preconnect'):
+            return handler.preconnect(request)
+        return defer.succeed(False)
+
     @defer.inlineCallbacks
     def _close(self, *_a, **_kw):
         for dh in self._handlers.values():
@@ -1,44 +1,180 @@
 """Download handlers for http and https schemes"""
 
 import re
+import tempfile
 
 from time import time
 from cStringIO import StringIO
+from collections import OrderedDict
 from urlparse import urldefrag
 
 from zope.interface import implements
 from twisted.internet import defer, reactor, protocol
+from twisted.internet.abstract import isIPAddress
 from twisted.web.http_headers import Headers as TxHeaders
-from twisted.web.iweb import IBodyProducer
+from twisted.web.iweb import IBodyProducer, UNKNOWN_LENGTH
 from twisted.internet.error import TimeoutError
 from twisted.web.http import PotentialDataLoss
+from twisted.python.failure import Failure
 from scrapy.xlib.tx import Agent, ProxyAgent, ResponseDone, \
-    HTTPConnectionPool, TCP4ClientEndpoint
+    HTTPConnectionPool, TCP4ClientEndpoint, client as txclient
 
+from scrapy import log
 from scrapy.http import Headers
+from scrapy.http.mappedbody import MappedBody
 from scrapy.responsetypes import responsetypes
 from scrapy.core.downloader.webclient import _parse
+from scrapy.core.downloader.bandwidth import BandwidthLimiter
+from scrapy.utils.gz import Decompressor, DecompressionMaxSizeExceeded
 from scrapy.utils.misc import load_object
+from scrapy.utils.timings import add_timing, get_timings
 
 
 class HTTP11DownloadHandler(object):
 
-    def __init__(self, settings):
-        self._pool = HTTPConnectionPool(reactor, persistent=True)
+    def __init__(self, settings, stats=None):
+        self._pool = ScrapyHTTPConnectionPool(reactor, persistent=True, stats=stats)
         self._pool.maxPersistentPerHost = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        self._pool.maxIdle = settings.getint('DOWNLOAD_POOL_MAXIDLE')
+        self._pool.cachedConnectionTimeout = settings.getfloat('DOWNLOAD_POOL_IDLE_TIMEOUT')
         self._pool._factory.noisy = False
         self._contextFactoryClass = load_object(settings['DOWNLOADER_CLIENTCONTEXTFACTORY'])
         self._contextFactory = self._contextFactoryClass()
+        self._maxsize = settings.getint('DOWNLOAD_MAXSIZE')
+        self._warnsize = settings.getint('DOWNLOAD_WARNSIZE')
+        self._mmapsize = settings.getint('DOWNLOAD_MMAPSIZE')
+        self._stats = stats
+        self._limiter = BandwidthLimiter.from_settings(settings, stats)
+        if self._limiter is not None:
+            self._limiter.start()
+        self._agent = ScrapyAgent(contextFactory=self._contextFactory,
+            pool=self._pool, maxsize=self._maxsize, warnsize=self._warnsize,
+            mmapsize=self._mmapsize, stats=self._stats,
+            resolve=settings.getbool('DNSCACHE_ENABLED'), limiter=self._limiter)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
 
     def download_request(self, request, spider):
         """Return a deferred for the HTTP download"""
-        agent = ScrapyAgent(contextFactory=self._contextFactory, pool=self._pool)
-        return agent.download_request(request)
+        return self._agent.download_request(request, spider)
+
+    def preconnect(self, request):
+        """Open a connection for the request and leave it idle in the pool"""
+        return self._agent.preconnect(request)
 
     def close(self):
+        if self._limiter is not None:
+            self._limiter.stop()
         return self._pool.closeCachedConnections()
 
 
+class ScrapyHTTPConnectionPool(HTTPConnectionPool):
+    """A connection pool that records stats about its connections and limits
+    the number of idle connections kept for all hosts (maxIdle), closing the
+    least recently used ones first.
+    """
+
+    maxIdle = 0
+
+    def __init__(self, reactor, persistent=True, stats=None):
+        HTTPConnectionPool.__init__(self, reactor, persistent)
+        self._stats = stats
+        # idle connections (and their keys), least recently used first
+        self._idle = OrderedDict()
+        # request whose connection time is recorded, if a new connection
+        # is opened by the next getConnection call
+        self.timedRequest = None
+
+    def getConnection(self, key, endpoint):
+        request, self.timedRequest = self.timedRequest, None
+        connections = self._connections.get(key)
+        while connections:
+            connection = connections.pop(0)
+            self._forget(key, connection)
+            if connection.state == "QUIESCENT":
+                self._inc_stats('downloader/pool/reused')
+                if self.retryAutomatically:
+                    newConnection = lambda: self._retryConnection(key, endpoint)
+                    connection = txclient._RetryingHTTP11ClientProtocol(
+                        connection, newConnection)
+                self._set_idle_stats()
+                return defer.succeed(connection)
+            # closed by the server while it was idle
+            self._inc_stats('downloader/pool/broken')
+        self._set_idle_stats()
+        d = self._newConnection(key, endpoint)
+        if request is not None:
+            d.addCallback(self._cb_connected, request, time())
+        return d
+
+    def _cb_connected(self, connection, request, start_time):
+        add_timing(request, 'connect', time() - start_time)
+        return connection
+
+    def _retryConnection(self, key, endpoint):
+        # a reused connection failed before getting a response
+        self._inc_stats('downloader/pool/broken')
+        return self._newConnection(key, endpoint)
+
+    def _newConnection(self, key, endpoint):
+        self._inc_stats('downloader/pool/opened')
+        return HTTPConnectionPool._newConnection(self, key, endpoint)
+
+    def _putConnection(self, key, connection):
+        if connection.state != "QUIESCENT":
+            return HTTPConnectionPool._putConnection(self, key, connection)
+        connections = self._connections.setdefault(key, [])
+        if len(connections) >= self.maxPersistentPerHost:
+            self._evict(key, connections[0], 'max_per_host')
+        elif self.maxIdle and len(self._idle) >= self.maxIdle:
+            lru = next(iter(self._idle))
+            self._evict(self._idle[lru], lru, 'max_idle')
+        self._connections.setdefault(key, []).append(connection)
+        self._idle[connection] = key
+        self._timeouts[connection] = self._reactor.callLater(
+            self.cachedConnectionTimeout, self._removeConnection, key, connection)
+        self._set_idle_stats()
+
+    def _removeConnection(self, key, connection):
+        self._evict(key, connection, 'idle_timeout')
+        self._set_idle_stats()
+
+    def _evict(self, key, connection, reason):
+        connection.transport.loseConnection()
+        self._connections[key].remove(connection)
+        self._forget(key, connection)
+        self._inc_stats('downloader/pool/evicted/%s' % reason)
+
+    def _forget(self, key, connection):
+        timeout = self._timeouts.pop(connection)
+        if timeout.active():
+            timeout.cancel()
+        del self._idle[connection]
+        if not self._connections[key]:
+            del self._connections[key]
+
+    def closeCachedConnections(self):
+        self._idle.clear()
+        return HTTPConnectionPool.closeCachedConnections(self)
+
+    def idleConnections(self):
+        """Return the number of idle connections of every key (usually, a
+        host) with some of them"""
+        return dict((key, len(conns)) for key, conns in self._connections.items())
+
+    def _inc_stats(self, key):
+        if self._stats is not None:
+            self._stats.inc_value(key)
+
+    def _set_idle_stats(self):
+        if self._stats is not None:
+            self._stats.set_value('downloader/pool/idle', len(self._idle))
+            self._stats.set_value('downloader/pool/idle_hosts',
+                                  len(self._connections))
+
+
 class TunnelError(Exception):
     """An HTTP CONNECT tunnel could not be established by the proxy."""
 
@@ -46,10 +182,9 @@ class TunnelError(Exception):
 class TunnelingTCP4ClientEndpoint(TCP4ClientEndpoint):
     """An endpoint that tunnels through proxies to allow HTTPS downloads. To
     accomplish that, this endpoint sends an HTTP CONNECT to the proxy.
-    The HTTP CONNECT is always sent when using this endpoint, I think this could
-    be improved as the CONNECT will be redundant if the connection associated
-    with this endpoint comes from the pool and a CONNECT has already been issued
-    for it.
+    The endpoint is only used to open new connections, tunneled connections
+    are kept in the pool by L{TunnelingAgent} and reused without sending
+    another CONNECT.
     """
 
     _responseMatcher = re.compile('HTTP/1\.. 200')
@@ -118,12 +253,22 @@ class TunnelingAgent(Agent):
         super(TunnelingAgent, self).__init__(reactor, contextFactory,
             connectTimeout, bindAddress, pool)
         self._proxyConf = proxyConf
+        # newer Twisted versions keep it as a policy, under another name
+        self._contextFactory = contextFactory
 
     def _getEndpoint(self, scheme, host, port):
         return TunnelingTCP4ClientEndpoint(self._reactor, host, port,
             self._proxyConf, self._contextFactory, self._connectTimeout,
             self._bindAddress)
 
+    def _requestWithEndpoint(self, key, endpoint, method, parsedURI,
+                             headers, bodyProducer, requestPath):
+        # tunnels are pooled by proxy and target, so they are never mistaken
+        # for direct connections or tunnels through another proxy
+        key = ('tunnel',) + key + self._proxyConf + (self._bindAddress,)
+        return super(TunnelingAgent, self)._requestWithEndpoint(key,
+            endpoint, method, parsedURI, headers, bodyProducer, requestPath)
+
 
 class ScrapyAgent(object):
 
@@ -131,11 +276,20 @@ class ScrapyAgent(object):
     _ProxyAgent = ProxyAgent
     _TunnelingAgent = TunnelingAgent
 
-    def __init__(self, contextFactory=None, connectTimeout=10, bindAddress=None, pool=None):
+    def __init__(self, contextFactory=None, connectTimeout=10, bindAddress=None,
+                 pool=None, maxsize=0, warnsize=0, mmapsize=0, stats=None,
+                 resolve=False, limiter=None):
         self._contextFactory = contextFactory
         self._connectTimeout = connectTimeout
         self._bindAddress = bindAddress
         self._pool = pool
+        self._maxsize = maxsize
+        self._warnsize = warnsize
+        self._mmapsize = mmapsize
+        self._stats = stats
+        self._resolve = resolve
+        self._limiter = limiter
+        self._agents = {}
 
     def _get_agent(self, request, timeout):
         bindaddress = request.meta.get('bindaddress') or self._bindAddress
@@ -147,18 +301,56 @@ class ScrapyAgent(object):
             if  scheme == 'https' and not omitConnectTunnel:
                 proxyConf = (proxyHost, proxyPort,
                              request.headers.get('Proxy-Authorization', None))
-                return self._TunnelingAgent(reactor, proxyConf,
-                    contextFactory=self._contextFactory, connectTimeout=timeout,
-                    bindAddress=bindaddress, pool=self._pool)
+                key = ('tunnel', proxyConf, bindaddress, timeout)
+                return self._cached_agent(key, self._TunnelingAgent, reactor,
+                    proxyConf, contextFactory=self._contextFactory,
+                    connectTimeout=timeout, bindAddress=bindaddress,
+                    pool=self._pool)
             else:
-                endpoint = TCP4ClientEndpoint(reactor, proxyHost, proxyPort,
-                    timeout=timeout, bindAddress=bindaddress)
-                return self._ProxyAgent(endpoint)
+                key = ('proxy', proxyHost, proxyPort, bindaddress, timeout)
+                if key not in self._agents:
+                    # the agent is reused, so its endpoint identifies the
+                    # connections to the proxy in the pool
+                    endpoint = TCP4ClientEndpoint(reactor, proxyHost, proxyPort,
+                        timeout=timeout, bindAddress=bindaddress)
+                    self._agents[key] = self._ProxyAgent(endpoint, pool=self._pool)
+                return self._agents[key]
+
+        key = ('direct', bindaddress, timeout)
+        return self._cached_agent(key, self._Agent, reactor,
+            contextFactory=self._contextFactory, connectTimeout=timeout,
+            bindAddress=bindaddress, pool=self._pool)
+
+    def _cached_agent(self, key, agentcls, *args, **kwargs):
+        agent = self._agents.get(key)
+        if agent is None:
+            agent = self._agents[key] = agentcls(*args, **kwargs)
+        return agent
+
+    def preconnect(self, request):
+        """Open a connection to the host of the request, so its download
+        doesn't have to wait for it. The returned deferred fires with
+        ``True`` if a connection was added to the pool or ``False`` if there
+        was an idle one already (or the request goes through a proxy).
+        """
+        if request.meta.get('proxy') or self._pool is None:
+            return defer.succeed(False)
+        timeout = request.meta.get('download_timeout') or self._connectTimeout
+        agent = self._get_agent(request, timeout)
+        scheme, _, host, port, _ = _parse(request.url)
+        key = (scheme, host, port)
+        if self._pool._connections.get(key):
+            return defer.succeed(False)
+        d = self._pool.getConnection(key, agent._getEndpoint(scheme, host, port))
+        d.addCallback(self._cb_preconnected, key)
+        return d
 
-        return self._Agent(reactor, contextFactory=self._contextFactory,
-            connectTimeout=timeout, bindAddress=bindaddress, pool=self._pool)
+    def _cb_preconnected(self, connection, key):
+        self._pool._inc_stats('downloader/pool/preconnected')
+        self._pool._putConnection(key, connection)
+        return True
 
-    def download_request(self, request):
+    def download_request(self, request, spider=None):
         timeout = request.meta.get('download_timeout') or self._connectTimeout
         agent = self._get_agent(request, timeout)
 
@@ -169,40 +361,140 @@ class ScrapyAgent(object):
         bodyproducer = _RequestBodyProducer(request.body) if request.body else None
 
         start_time = time()
-        d = agent.request(method, url, headers, bodyproducer)
+        d = self._resolve_host(request)
+        d.addCallback(self._cb_request, agent, request, method, url, headers,
+                      bodyproducer)
         # set download latency
         d.addCallback(self._cb_latency, request, start_time)
         # response body is ready to be consumed
-        d.addCallback(self._cb_bodyready, request)
-        d.addCallback(self._cb_bodydone, request, url)
+        d.addCallback(self._cb_bodyready, request, spider)
+        d.addCallback(self._cb_bodydone, request, url, start_time)
         # check download timeout
-        self._timeout_cl = reactor.callLater(timeout, d.cancel)
-        d.addBoth(self._cb_timeout, request, url, timeout)
+        timeout_cl = reactor.callLater(timeout, d.cancel)
+        d.addBoth(self._cb_timeout, request, url, timeout, timeout_cl)
+        return d
+
+    def _resolve_host(self, request):
+        """Resolve the host of the request before connecting to it, to
+        record the time spent in the lookup apart from the connection time.
+
+        Only done when the timings of the request are collected and the
+        resolver caches its results, so the lookup made when connecting
+        doesn't go to the network again, and only when the request will open
+        a new connection to its host.
+        """
+        if not self._resolve or get_timings(request) is None \
+                or request.meta.get('proxy') or self._pool is None:
+            return defer.succeed(None)
+        scheme, _, host, port, _ = _parse(request.url)
+        if isIPAddress(host) or self._pool._connections.get((scheme, host, port)):
+            return defer.succeed(None)
+        start_time = time()
+        d = reactor.resolve(host)
+        d.addCallback(lambda _: add_timing(request, 'dns', time() - start_time))
         return d
 
-    def _cb_timeout(self, result, request, url, timeout):
-        if self._timeout_cl.active():
-            self._timeout_cl.cancel()
+    def _cb_request(self, _, agent, request, method, url, headers, bodyproducer):
+        if self._pool is None:
+            return agent.request(method, url, headers, bodyproducer)
+        self._pool.timedRequest = request
+        try:
+            return agent.request(method, url, headers, bodyproducer)
+        finally:
+            self._pool.timedRequest = None
+
+    def _cb_timeout(self, result, request, url, timeout, timeout_cl):
+        if timeout_cl.active():
+            timeout_cl.cancel()
             return result
         raise TimeoutError("Getting %s took longer than %s seconds." % (url, timeout))
 
     def _cb_latency(self, result, request, start_time):
-        request.meta['download_latency'] = time() - start_time
+        latency = request.meta['download_latency'] = time() - start_time
+        # time to first byte of the response, once connected
+        timings = get_timings(request)
+        if timings is not None:
+            timings['ttfb'] = latency - timings.get('dns', 0) - \
+                timings.get('connect', 0)
         return result
 
-    def _cb_bodyready(self, txresponse, request):
+    def _cb_bodyready(self, txresponse, request, spider):
         # deliverBody hangs for responses without body
         if txresponse.length == 0:
             return txresponse, '', None
 
-        def _cancel(_):
+        maxsize = request.meta.get('download_maxsize', self._maxsize)
+        warnsize = request.meta.get('download_warnsize', self._warnsize)
+        mmapsize = request.meta.get('download_mmapsize', self._mmapsize)
+        expected_size = txresponse.length
+        if expected_size == UNKNOWN_LENGTH:
+            expected_size = -1
+
+        if maxsize and expected_size > maxsize:
+            log.msg(format="Cancelling download of %(url)s: expected response "
+                    "size (%(size)s) larger than download max size (%(maxsize)s)",
+                    level=log.ERROR, spider=spider, url=request.url,
+                    size=expected_size, maxsize=maxsize)
+            self._inc_stats('downloader/response_maxsize/cancelled', spider)
             txresponse._transport._producer.loseConnection()
+            raise defer.CancelledError()
+
+        if warnsize and expected_size > warnsize:
+            log.msg(format="Expected response size (%(size)s) larger than "
+                    "download warn size (%(warnsize)s) in %(url)s",
+                    level=log.WARNING, spider=spider, url=request.url,
+                    size=expected_size, warnsize=warnsize)
+
+        def _cancel(_):
+            _loseConnection(txresponse)
+
+        def _maxsize_reached(size):
+            log.msg(format="Cancelling download of %(url)s: received response "
+                    "size (%(size)s) larger than download max size (%(maxsize)s)",
+                    level=log.ERROR, spider=spider, url=request.url,
+                    size=size, maxsize=maxsize)
+            self._inc_stats('downloader/response_maxsize/aborted', spider)
+            d.cancel()
 
         d = defer.Deferred(_cancel)
-        txresponse.deliverBody(_ResponseReader(d, txresponse, request))
+        reader = _ResponseReader(d, txresponse, request, maxsize, warnsize,
+            _maxsize_reached, spider, self._get_decompressor(txresponse,
+            request, maxsize), self._limiter)
+        if mmapsize and expected_size > mmapsize:
+            reader.spill()
+        elif mmapsize:
+            reader.spill_at(mmapsize)
+        txresponse.deliverBody(reader)
         return d
 
-    def _cb_bodydone(self, result, request, url):
+    def _get_decompressor(self, txresponse, request, maxsize):
+        """Return a Decompressor for the body of the response if it's
+        encoded and its request comes from the HttpCompressionMiddleware,
+        whose work is done here while the body is received"""
+        if not request.meta.get('_decompress'):
+            return
+        headers = txresponse.headers
+        encodings = headers.getRawHeaders('Content-Encoding')
+        if not encodings or encodings[-1].lower() not in ('gzip', 'x-gzip', 'deflate'):
+            return
+        ctype = (headers.getRawHeaders('Content-Type') or [''])[0]
+        if ctype in ('application/x-gzip', 'application/gzip'):
+            return
+        encoding = encodings.pop().lower()
+        if encodings:
+            headers.setRawHeaders('Content-Encoding', encodings)
+        else:
+            headers.removeHeader('Content-Encoding')
+        return Decompressor(encoding, maxsize)
+
+    def _inc_stats(self, key, spider):
+        if self._stats is not None:
+            self._stats.inc_value(key, spider=spider)
+
+    def _cb_bodydone(self, result, request, url, start_time):
+        download_time = time() - start_time
+        add_timing(request, 'body', download_time - request.meta['download_latency'])
+        add_timing(request, 'download', download_time)
         txresponse, body, flags = result
         status = int(txresponse.code)
         headers = Headers(txresponse.headers.getAllRawHeaders())
@@ -210,6 +502,13 @@ class ScrapyAgent(object):
         return respcls(url=url, status=status, headers=headers, body=body, flags=flags)
 
 
+def _loseConnection(txresponse):
+    # the response transport is gone once the whole body was received
+    producer = txresponse._transport._producer
+    if producer is not None:
+        producer.loseConnection()
+
+
 class _RequestBodyProducer(object):
     implements(IBodyProducer)
 
@@ -230,23 +529,139 @@ class _RequestBodyProducer(object):
 
 class _ResponseReader(protocol.Protocol):
 
-    def __init__(self, finished, txresponse, request):
+    def __init__(self, finished, txresponse, request, maxsize=0, warnsize=0,
+                 maxsize_reached=None, spider=None, decompressor=None,
+                 limiter=None):
         self._finished = finished
         self._txresponse = txresponse
         self._request = request
         self._bodybuf = StringIO()
+        self._maxsize = maxsize
+        self._warnsize = warnsize
+        self._maxsize_reached = maxsize_reached
+        self._spider = spider
+        self._bytes_received = 0
+        self._warned = False
+        self._spillsize = 0
+        self._spilled = False
+        # the compressed body is decompressed as it's received, so it's never
+        # kept in memory
+        self._decompressor = decompressor
+        # the transport is paused while the bandwidth limits are exceeded
+        self._limiter = limiter
+        self._resume_call = None
+
+    def spill_at(self, size):
+        """Write the body to a temporary file once it's larger than size"""
+        self._spillsize = size
+
+    def spill(self):
+        """Write the body to a temporary file, to be memory mapped once the
+        download is complete"""
+        bodyfile = tempfile.TemporaryFile(prefix='scrapy-body-')
+        bodyfile.write(self._bodybuf.getvalue())
+        self._bodybuf = bodyfile
+        self._spilled = True
 
     def dataReceived(self, bodyBytes):
+        if self._finished.called:
+            return
+
+        if self._limiter is not None:
+            delay = self._limiter.consume(len(bodyBytes),
+                                          self._request.meta.get('download_slot'))
+            if delay:
+                self._pause(delay)
+
+        if self._decompressor:
+            try:
+                bodyBytes = self._decompressor.decompress(bodyBytes)
+            except DecompressionMaxSizeExceeded:
+                self._maxsize_reached(self._decompressor.size)
+                self._discard()
+                return
+            except IOError:
+                self._fail(Failure())
+                return
+
         self._bodybuf.write(bodyBytes)
+        self._bytes_received += len(bodyBytes)
+
+        if self._spillsize and not self._spilled \
+                and self._bytes_received > self._spillsize:
+            self.spill()
+
+        if self._maxsize and self._bytes_received > self._maxsize:
+            self._maxsize_reached(self._bytes_received)
+            self._discard()
+        elif self._warnsize and self._bytes_received > self._warnsize \
+                and not self._warned:
+            self._warned = True
+            log.msg(format="Received more bytes than download warn size "
+                    "(%(warnsize)s) in %(url)s", level=log.WARNING,
+                    spider=self._spider, url=self._request.url,
+                    warnsize=self._warnsize)
 
     def connectionLost(self, reason):
+        # the response waits for the bandwidth limits too, so a body received
+        # in a single chunk is delayed like any other
+        resume_call, self._resume_call = self._resume_call, None
+        if resume_call is not None and resume_call.active():
+            resume_call.cancel()
+            reactor.callLater(resume_call.getTime() - reactor.seconds(),
+                              self._finish, reason)
+        else:
+            self._finish(reason)
+
+    def _finish(self, reason):
         if self._finished.called:
             return
 
-        body = self._bodybuf.getvalue()
+        if self._decompressor and reason.check(ResponseDone, PotentialDataLoss):
+            try:
+                self._bodybuf.write(self._decompressor.flush())
+            except DecompressionMaxSizeExceeded:
+                self._maxsize_reached(self._decompressor.size)
+                self._discard()
+                return
+            except IOError:
+                self._fail(Failure())
+                return
+
+        body = self._getbody()
         if reason.check(ResponseDone):
             self._finished.callback((self._txresponse, body, None))
         elif reason.check(PotentialDataLoss):
             self._finished.callback((self._txresponse, body, ['partial']))
         else:
             self._finished.errback(reason)
+
+    def _getbody(self):
+        if not self._spilled:
+            return self._bodybuf.getvalue()
+        # an empty file can't be mapped
+        body = MappedBody(self._bodybuf) if self._bytes_received else ''
+        self._bodybuf.close()
+        return body
+
+    def _pause(self, delay):
+        # more data may be received while paused, extending the pause
+        if self._resume_call is not None and self._resume_call.active():
+            self._resume_call.cancel()
+        self._txresponse._transport.pauseProducing()
+        self._resume_call = reactor.callLater(delay, self._resume)
+
+    def _resume(self):
+        self._resume_call = None
+        self._txresponse._transport.resumeProducing()
+
+    def _fail(self, failure):
+        self._discard()
+        self._finished.errback(failure)
+        _loseConnection(self._txresponse)
+
+    def _discard(self):
+        if self._spilled:
+            self._bodybuf.close()
+            self._spilled = False
+        self._bodybuf = StringIO()
@@ -6,7 +6,7 @@ See documentation in docs/topics/downloader-middleware.rst
 
 from scrapy.http import Request, Response
 from scrapy.middleware import MiddlewareManager
-from scrapy.utils.defer import mustbe_deferred
+from scrapy.utils.defer import mustbe_deferred, maybe_deferred
 from scrapy.utils.conf import build_component_list
 
 class DownloaderMiddlewareManager(MiddlewareManager):
@@ -62,7 +62,8 @@ class DownloaderMiddlewareManager(MiddlewareManager):
                     return response
             return _failure
 
-        deferred = mustbe_deferred(process_request, request)
+        call = maybe_deferred if self.fastpath else mustbe_deferred
+        deferred = call(process_request, request)
         deferred.addErrback(process_exception)
         deferred.addCallback(process_response)
         return deferred
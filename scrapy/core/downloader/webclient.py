@@ -8,6 +8,7 @@ from twisted.internet import defer
 from scrapy.http import Headers
 from scrapy.utils.httpobj import urlparse_cached
 from scrapy.responsetypes import responsetypes
+from scrapy.utils.timings import add_timing
 
 
 def _parsed_url_args(parsed):
@@ -121,6 +122,10 @@ class ScrapyHTTPClientFactory(HTTPClientFactory):
 
     def _build_response(self, body, request):
         request.meta['download_latency'] = self.headers_time-self.start_time
+        # the connection time can't be told apart here, so it's part of ttfb
+        add_timing(request, 'ttfb', self.headers_time - self.start_time)
+        add_timing(request, 'body', time() - self.headers_time)
+        add_timing(request, 'download', time() - self.start_time)
         status = int(self.status)
         headers = Headers(self.response_headers)
         respcls = responsetypes.from_args(headers=headers, url=self.url)
@@ -5,6 +5,7 @@ For more information see docs/topics/architecture.rst
 
 """
 import warnings
+import weakref
 from time import time
 
 from twisted.internet import defer
@@ -17,6 +18,7 @@ from scrapy.exceptions import DontCloseSpider, ScrapyDeprecationWarning
 from scrapy.http import Response, Request
 from scrapy.utils.misc import load_object
 from scrapy.utils.reactor import CallLaterOnce
+from scrapy.utils.timings import add_timing
 
 
 class Slot(object):
@@ -67,6 +69,10 @@ class ExecutionEngine(object):
             warnings.warn("CONCURRENT_SPIDERS settings is deprecated, use " \
                 "Scrapyd max_proc config instead", ScrapyDeprecationWarning)
         self._spider_closed_callback = spider_closed_callback
+        self.timings = self.settings.getbool('TIMINGS_STATS')
+        # request -> time it was scheduled at, kept out of the request so it
+        # isn't serialized to the disk queues
+        self._scheduled_at = weakref.WeakKeyDictionary()
 
     @defer.inlineCallbacks
     def start(self):
@@ -132,6 +138,9 @@ class ExecutionEngine(object):
         request = slot.scheduler.next_request()
         if not request:
             return
+        scheduled_at = self._scheduled_at.pop(request, None)
+        if scheduled_at is not None:
+            add_timing(request, 'scheduler', time() - scheduled_at)
         d = self._download(request, spider)
         d.addBoth(self._handle_downloader_output, request, spider)
         d.addErrback(log.msg, spider=spider)
@@ -176,6 +185,11 @@ class ExecutionEngine(object):
     def schedule(self, request, spider):
         self.signals.send_catch_log(signal=signals.request_scheduled,
                 request=request, spider=spider)
+        if self.timings:
+            # a new set of timings every time the request goes through the
+            # scheduler (redirects and retries copy the meta of the first one)
+            request.meta['timings'] = {}
+            self._scheduled_at[request] = time()
         return self.slot.scheduler.enqueue_request(request)
 
     def download(self, request, spider):
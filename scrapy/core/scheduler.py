@@ -1,9 +1,12 @@
 import os
 import json
+import shutil
+import tempfile
 from os.path import join, exists
+from collections import deque
 
 from queuelib import PriorityQueue
-from scrapy.utils.reqser import request_to_dict, request_from_dict
+from scrapy.utils.reqser import request_to_dict, request_from_dict, RequestCodec
 from scrapy.utils.misc import load_object
 from scrapy.utils.job import job_dir
 from scrapy import log
@@ -17,16 +20,22 @@ class Scheduler(object):
         self.mqclass = mqclass
         self.logunser = logunser
         self.stats = stats
+        self.settings = None
 
     @classmethod
     def from_crawler(cls, crawler):
         settings = crawler.settings
         dupefilter_cls = load_object(settings['DUPEFILTER_CLASS'])
-        dupefilter = dupefilter_cls.from_settings(settings)
+        if hasattr(dupefilter_cls, 'from_crawler'):
+            dupefilter = dupefilter_cls.from_crawler(crawler)
+        else:
+            dupefilter = dupefilter_cls.from_settings(settings)
         dqclass = load_object(settings['SCHEDULER_DISK_QUEUE'])
         mqclass = load_object(settings['SCHEDULER_MEMORY_QUEUE'])
         logunser = settings.getbool('LOG_UNSERIALIZABLE_REQUESTS')
-        return cls(dupefilter, job_dir(settings), dqclass, mqclass, logunser, crawler.stats)
+        scheduler = cls(dupefilter, job_dir(settings), dqclass, mqclass, logunser, crawler.stats)
+        scheduler.settings = settings
+        return scheduler
 
     def has_pending_requests(self):
         return len(self) > 0
@@ -34,11 +43,12 @@ class Scheduler(object):
     def open(self, spider):
         self.spider = spider
         self.mqs = PriorityQueue(self._newmq)
+        self.codec = self._codec() if self.dqdir else None
         self.dqs = self._dq() if self.dqdir else None
         return self.df.open()
 
     def close(self, reason):
-        if self.dqs:
+        if self.dqs is not None:
             prios = self.dqs.close()
             with open(join(self.dqdir, 'active.json'), 'w') as f:
                 json.dump(prios, f)
@@ -75,7 +85,10 @@ class Scheduler(object):
         if self.dqs is None:
             return
         try:
-            reqd = request_to_dict(request, self.spider)
+            if self.codec:
+                reqd = self.codec.encode(request, self.spider)
+            else:
+                reqd = request_to_dict(request, self.spider)
             self.dqs.push(reqd, -request.priority)
         except ValueError as e: # non serializable request
             if self.logunser:
@@ -92,6 +105,8 @@ class Scheduler(object):
     def _dqpop(self):
         if self.dqs:
             d = self.dqs.pop()
+            if d and self.codec:
+                return self.codec.decode(d, self.spider)
             if d:
                 return request_from_dict(d, self.spider)
 
@@ -102,21 +117,341 @@ class Scheduler(object):
         return self.dqclass(join(self.dqdir, 'p%s' % priority))
 
     def _dq(self):
-        activef = join(self.dqdir, 'active.json')
-        if exists(activef):
-            with open(activef) as f:
-                prios = json.load(f)
+        if getattr(self.dqclass, 'priority_queue', False):
+            q = self._newpdq(join(self.dqdir, 'segments'))
         else:
-            prios = ()
-        q = PriorityQueue(self._newdq, startprios=prios)
+            activef = join(self.dqdir, 'active.json')
+            if exists(activef):
+                with open(activef) as f:
+                    prios = json.load(f)
+            else:
+                prios = ()
+            q = PriorityQueue(self._newdq, startprios=prios)
         if q:
             log.msg(format="Resuming crawl (%(queuesize)d requests scheduled)",
                     spider=self.spider, queuesize=len(q))
         return q
 
+    def _newpdq(self, path):
+        """Return a disk queue which handles priorities by itself"""
+        if self.settings is not None:
+            return self.dqclass.from_settings(self.settings, path)
+        return self.dqclass(path)
+
+    def _codec(self):
+        """Return the RequestCodec to serialize requests with, if the disk
+        queue class stores them already serialized"""
+        if getattr(self.dqclass, 'request_codec', False):
+            return RequestCodec(join(self.dqdir, 'names.json'))
+
     def _dqdir(self, jobdir):
         if jobdir:
             dqdir = join(jobdir, 'requests.queue')
             if not exists(dqdir):
                 os.makedirs(dqdir)
             return dqdir
+
+
+class SlotScheduler(Scheduler):
+    """Scheduler which keeps a separate queue per download slot and only
+    returns requests for slots that can take them without piling up in the
+    downloader, serving the slots in a round-robin fashion.
+
+    This prevents requests for slow or throttled sites from filling up the
+    downloader while other sites sit idle. Requests are assigned to slots
+    using the same key as the downloader (the ``download_slot`` meta key or
+    the request hostname) and priorities are only honoured within each slot.
+
+    When a job directory is used, requests are read back from the disk
+    queues in batches and kept in the slot queues until their slots are
+    ready (up to ``max_requests`` of them, the rest stay on disk), and pushed
+    back to disk when the spider is closed.
+    """
+
+    def __init__(self, dupefilter, jobdir=None, dqclass=None, mqclass=None,
+                 logunser=False, stats=None, downloader=None, slot_queue_size=1,
+                 refill_size=100, max_requests=0):
+        super(SlotScheduler, self).__init__(dupefilter, jobdir, dqclass,
+            mqclass, logunser, stats)
+        self.downloader = downloader
+        self.slot_queue_size = slot_queue_size
+        self.refill_size = refill_size
+        self.max_requests = max_requests
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super(SlotScheduler, cls).from_crawler(crawler)
+        scheduler.downloader = crawler.engine.downloader
+        scheduler.slot_queue_size = crawler.settings.getint('SCHEDULER_SLOT_QUEUE_SIZE')
+        scheduler.max_requests = crawler.settings.getint('SCHEDULER_MEMORY_MAX_REQUESTS')
+        return scheduler
+
+    def open(self, spider):
+        self.slotqs = {}
+        self.slotkeys = deque() # slots with pending requests, in round-robin order
+        self.pending = {} # requests returned and not yet seen in the downloader slot
+        self.slotcount = 0
+        return super(SlotScheduler, self).open(spider)
+
+    def close(self, reason):
+        if self.dqs is not None:
+            for q in self.slotqs.values():
+                request = q.pop()
+                while request:
+                    self._dqpush(request)
+                    request = q.pop()
+        return super(SlotScheduler, self).close(reason)
+
+    def next_request(self):
+        # forget the requests that reached the downloader slots, including
+        # the last ones of slots which have no requests left
+        for key in list(self.pending):
+            self._prune_pending(key)
+        request = self._slotpop()
+        if request:
+            self.stats.inc_value('scheduler/dequeued/memory', spider=self.spider)
+        else:
+            request = self._dqrefill()
+            if request:
+                self.stats.inc_value('scheduler/dequeued/disk', spider=self.spider)
+        if request:
+            self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return request
+
+    def __len__(self):
+        return len(self.dqs) + self.slotcount if self.dqs else self.slotcount
+
+    def _mqpush(self, request):
+        self._slotpush(self._slotkey(request), request)
+
+    def _slotkey(self, request):
+        return self.downloader._get_slot_key(request, self.spider)
+
+    def _slotpush(self, key, request):
+        if key not in self.slotqs:
+            self.slotqs[key] = PriorityQueue(self._newmq)
+            self.slotkeys.append(key)
+        self.slotqs[key].push(request, -request.priority)
+        self.slotcount += 1
+
+    def _slotpop(self):
+        for _ in xrange(len(self.slotkeys)):
+            key = self.slotkeys[0]
+            self.slotkeys.rotate(-1)
+            if self._slot_ready(key):
+                q = self.slotqs[key]
+                request = q.pop()
+                if not q:
+                    del self.slotqs[key]
+                    self.slotkeys.pop()
+                self.slotcount -= 1
+                self._add_pending(key, request)
+                return request
+
+    def _dqrefill(self):
+        """Move requests from the disk queues to the slot queues until one for
+        a ready slot (with no other requests waiting) is found, or the slot
+        queues are full"""
+        for _ in xrange(self.refill_size):
+            if self.max_requests and self.slotcount >= self.max_requests:
+                return
+            request = self._dqpop()
+            if not request:
+                return
+            key = self._slotkey(request)
+            if key not in self.slotqs and self._slot_ready(key):
+                self._add_pending(key, request)
+                return request
+            self._slotpush(key, request)
+
+    def _add_pending(self, key, request):
+        self.pending.setdefault(key, set()).add(request)
+
+    def _prune_pending(self, key):
+        """Forget the pending requests of the given slot which reached the
+        downloader slot (or left the downloader), and return the rest, which
+        are still going through the downloader middlewares"""
+        pending = self.pending.get(key)
+        if pending:
+            slot = self.downloader.slots.get(key)
+            active = self.downloader.active
+            for request in list(pending):
+                if request not in active or (slot and request in slot.active):
+                    pending.remove(request)
+            if not pending:
+                del self.pending[key]
+        return pending
+
+    def _slot_ready(self, key):
+        """Return True if a new request for the given slot would be
+        downloaded without waiting in the downloader slot queue for more than
+        ``slot_queue_size`` requests"""
+        slot = self.downloader.slots.get(key)
+        pending = self._prune_pending(key)
+        queued = len(pending or ()) + (len(slot.queue) if slot else 0)
+        if slot is None or slot.delay:
+            return queued < self.slot_queue_size
+        return queued < self.slot_queue_size + slot.free_transfer_slots()
+
+
+class _SpillablePriorityQueue(PriorityQueue):
+    """Priority queue which can also pop its lowest priority objects"""
+
+    def pop_lowest(self):
+        if not self.queues:
+            return
+        prio = max(self.queues)
+        q = self.queues[prio]
+        obj = q.pop()
+        if not len(q):
+            del self.queues[prio]
+            q.close()
+            if prio == self.curprio:
+                self.curprio = min(self.queues) if self.queues else None
+        return obj
+
+
+class HybridScheduler(Scheduler):
+    """Scheduler which keeps requests in memory until a high water mark on
+    their number (or approximate size) is reached. Then, the lowest priority
+    requests are spilled to the disk queues until the low water mark is
+    reached, and loaded back in batches when memory has room for them and
+    they have the highest priority.
+
+    The disk queues are kept in the job directory if one is used (and
+    requests still in memory are saved to them when the spider is closed),
+    otherwise in a temporary directory removed when the spider is closed.
+
+    Requests which can't be serialized are kept apart in memory once they
+    fail to be spilled, so they aren't tried again.
+    """
+
+    low_watermark = 0.75 # as a fraction of the high water marks
+
+    def __init__(self, dupefilter, jobdir=None, dqclass=None, mqclass=None,
+                 logunser=False, stats=None, max_requests=0, max_bytes=0,
+                 batch_size=1000):
+        super(HybridScheduler, self).__init__(dupefilter, jobdir, dqclass,
+            mqclass, logunser, stats)
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.tmpdir = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super(HybridScheduler, cls).from_crawler(crawler)
+        scheduler.max_requests = crawler.settings.getint('SCHEDULER_MEMORY_MAX_REQUESTS')
+        scheduler.max_bytes = crawler.settings.getint('SCHEDULER_MEMORY_MAX_BYTES')
+        return scheduler
+
+    def open(self, spider):
+        if not self.dqdir:
+            self.tmpdir = self.dqdir = tempfile.mkdtemp(prefix='scrapy-queue-')
+        self.mqcount = 0
+        self.mqbytes = 0
+        self.unspillable = PriorityQueue(self._newmq)
+        dfd = super(HybridScheduler, self).open(spider)
+        self.mqs = _SpillablePriorityQueue(self._newmq)
+        return dfd
+
+    def close(self, reason):
+        if self.tmpdir:
+            self.dqs.close()
+            self.dqs = None
+            shutil.rmtree(self.tmpdir)
+        else:
+            request = self._mqpop()
+            while request:
+                self._dqpush(request)
+                request = self._mqpop()
+        return super(HybridScheduler, self).close(reason)
+
+    def enqueue_request(self, request):
+        if not request.dont_filter and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return
+        self._mqpush(request)
+        self.stats.inc_value('scheduler/enqueued/memory', spider=self.spider)
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        if self._above(1):
+            self._spill()
+
+    def next_request(self):
+        if self._disk_first():
+            self._load()
+        if self._disk_first():
+            # no room in memory to load them
+            request = self._dqpop()
+            self.stats.inc_value('scheduler/dequeued/disk', spider=self.spider)
+        else:
+            request = self._mqpop()
+            if request:
+                self.stats.inc_value('scheduler/dequeued/memory', spider=self.spider)
+        if request:
+            self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return request
+
+    def __len__(self):
+        return super(HybridScheduler, self).__len__() + len(self.unspillable)
+
+    def _disk_first(self):
+        """Return True if the disk queues hold higher priority requests than
+        the memory queues"""
+        dqprio = self.dqs.curprio
+        mqprios = [p for p in (self.mqs.curprio, self.unspillable.curprio)
+                   if p is not None]
+        return dqprio is not None and (not mqprios or dqprio < min(mqprios))
+
+    def _mqpush(self, request):
+        super(HybridScheduler, self)._mqpush(request)
+        self.mqcount += 1
+        self.mqbytes += _request_size(request)
+
+    def _mqpop(self):
+        uprio, mqprio = self.unspillable.curprio, self.mqs.curprio
+        if uprio is not None and (mqprio is None or uprio < mqprio):
+            return self.unspillable.pop()
+        request = self.mqs.pop()
+        if request:
+            self._mqforget(request)
+        return request
+
+    def _mqforget(self, request):
+        self.mqcount -= 1
+        self.mqbytes -= _request_size(request)
+
+    def _above(self, ratio):
+        return (self.max_requests and self.mqcount > self.max_requests * ratio) \
+            or (self.max_bytes and self.mqbytes > self.max_bytes * ratio)
+
+    def _spill(self):
+        """Move the lowest priority requests to the disk queues until the low
+        water mark is reached"""
+        while self.mqcount and self._above(self.low_watermark):
+            request = self.mqs.pop_lowest()
+            self._mqforget(request)
+            if self._dqpush(request):
+                self.stats.inc_value('scheduler/spilled', spider=self.spider)
+            else:
+                self.unspillable.push(request, -request.priority)
+
+    def _load(self):
+        """Move a batch of the highest priority requests from the disk queues
+        to memory, without going over the low water mark"""
+        for _ in xrange(self.batch_size):
+            if self._above(self.low_watermark):
+                break
+            request = self._dqpop()
+            if not request:
+                break
+            self._mqpush(request)
+            self.stats.inc_value('scheduler/unspilled', spider=self.spider)
+
+
+def _request_size(request):
+    """Return the approximate size (in bytes) of the given request"""
+    size = len(request.url) + len(request.body)
+    for name, values in request.headers.iteritems():
+        size += len(name) + sum(len(v) for v in values)
+    return size
@@ -1,6 +1,7 @@
 """This module implements the Scraper component which parses responses and
 extracts information from them"""
 
+from time import time
 from collections import deque
 
 from twisted.python.failure import Failure
@@ -9,6 +10,7 @@ from twisted.internet import defer
 from scrapy.utils.defer import defer_result, defer_succeed, parallel, iter_errback
 from scrapy.utils.spider import iterate_spider_output
 from scrapy.utils.misc import load_object
+from scrapy.utils.timings import add_timing, get_timings, record_timings
 from scrapy.exceptions import CloseSpider, DropItem, IgnoreRequest
 from scrapy import signals
 from scrapy.http import Request, Response
@@ -32,7 +34,7 @@ class Slot(object):
 
     def add_response_request(self, response, request):
         deferred = defer.Deferred()
-        self.queue.append((response, request, deferred))
+        self.queue.append((response, request, deferred, time()))
         if isinstance(response, Response):
             self.active_size += max(len(response.body), self.MIN_RESPONSE_SIZE)
         else:
@@ -40,7 +42,8 @@ class Slot(object):
         return deferred
 
     def next_response_request_deferred(self):
-        response, request, deferred = self.queue.popleft()
+        response, request, deferred, queued_at = self.queue.popleft()
+        add_timing(request, 'scraper_queue', time() - queued_at)
         self.active.add(request)
         return response, request, deferred
 
@@ -68,6 +71,10 @@ class Scraper(object):
         self.crawler = crawler
         self.signals = crawler.signals
         self.logformatter = crawler.logformatter
+        self.timings_stats = crawler.settings.getbool('TIMINGS_STATS')
+        self.timings_per_slot = crawler.settings.getbool('TIMINGS_STATS_PER_SLOT')
+        self.fastpath = crawler.settings.getbool('SYNC_FASTPATH')
+        self.cputimer = getattr(crawler, 'cputimer', None)
 
     @defer.inlineCallbacks
     def open_spider(self, spider):
@@ -93,9 +100,12 @@ class Scraper(object):
 
     def enqueue_scrape(self, response, request, spider):
         slot = self.slot
+        enqueued_at = time()
         dfd = slot.add_response_request(response, request)
         def finish_scraping(_):
             slot.finish_response(response, request)
+            if self.timings_stats:
+                self._add_scrape_timing(request, spider, enqueued_at)
             self._check_if_closing(spider, slot)
             self._scrape_next(spider, slot)
             return _
@@ -105,6 +115,13 @@ class Scraper(object):
         self._scrape_next(spider, slot)
         return dfd
 
+    def _add_scrape_timing(self, request, spider, enqueued_at):
+        timings = get_timings(request)
+        if timings is None:
+            return
+        timings['scrape'] = time() - enqueued_at - timings.get('scraper_queue', 0)
+        record_timings(self.crawler.stats, request, spider, self.timings_per_slot)
+
     def _scrape_next(self, spider, slot):
         while slot.queue:
             response, request, deferred = slot.next_response_request_deferred()
@@ -134,8 +151,12 @@ class Scraper(object):
 
     def call_spider(self, result, request, spider):
         result.request = request
-        dfd = defer_result(result)
-        dfd.addCallbacks(request.callback or spider.parse, request.errback)
+        dfd = defer_result(result, self.fastpath)
+        callback, errback = request.callback or spider.parse, request.errback
+        if self.cputimer is not None:
+            callback = self.cputimer.wrap(callback)
+            errback = errback and self.cputimer.wrap(errback)
+        dfd.addCallbacks(callback, errback)
         return dfd.addCallback(iterate_spider_output)
 
     def handle_spider_error(self, _failure, request, response, spider):
@@ -6,7 +6,7 @@ See documentation in docs/topics/spider-middleware.rst
 
 from twisted.python.failure import Failure
 from scrapy.middleware import MiddlewareManager
-from scrapy.utils.defer import mustbe_deferred
+from scrapy.utils.defer import mustbe_deferred, maybe_deferred
 from scrapy.utils.conf import build_component_list
 
 def _isiterable(possible_iterator):
@@ -66,7 +66,8 @@ class SpiderMiddlewareManager(MiddlewareManager):
                     (fname(method), type(result))
             return result
 
-        dfd = mustbe_deferred(process_spider_input, response)
+        call = maybe_deferred if self.fastpath else mustbe_deferred
+        dfd = call(process_spider_input, response)
         dfd.addErrback(process_spider_exception)
         dfd.addCallback(process_spider_output)
         return dfd
@@ -3,11 +3,11 @@ import signal
 from twisted.internet import reactor, defer
 
 from scrapy.core.engine import ExecutionEngine
-from scrapy.resolver import CachingThreadedResolver
 from scrapy.extension import ExtensionManager
 from scrapy.signalmanager import SignalManager
 from scrapy.utils.ossignal import install_shutdown_handlers, signal_names
 from scrapy.utils.misc import load_object
+from scrapy.utils.cputime import CPUTimer
 from scrapy import log, signals
 
 
@@ -18,6 +18,7 @@ class Crawler(object):
         self.settings = settings
         self.signals = SignalManager(self)
         self.stats = load_object(settings['STATS_CLASS'])(self)
+        self.cputimer = CPUTimer() if settings.getbool('CPUSTATS_ENABLED') else None
         self._start_requests = lambda: ()
         self._spider = None
         # TODO: move SpiderManager to CrawlerProcess
@@ -73,14 +74,20 @@ class Crawler(object):
 
 
 class CrawlerProcess(object):
-    """ A class to run multiple scrapy crawlers in a process sequentially"""
+    """ A class to run multiple scrapy crawlers in a process, sequentially or
+    up to CONCURRENT_CRAWLERS of them at the same time"""
 
     def __init__(self, settings):
         install_shutdown_handlers(self._signal_shutdown)
         self.settings = settings
         self.crawlers = {}
         self.stopping = False
+        self.concurrent_crawlers = settings.getint('CONCURRENT_CRAWLERS')
+        self._active_crawlers = set()
+        self._sflo = None
         self._started = None
+        resolver_cls = load_object(settings['DNS_RESOLVER'])
+        self.resolver = resolver_cls.from_settings(settings, reactor)
 
     def create_crawler(self, name=None):
         if name not in self.crawlers:
@@ -95,8 +102,8 @@ class CrawlerProcess(object):
     @defer.inlineCallbacks
     def stop(self):
         self.stopping = True
-        if self._active_crawler:
-            yield self._active_crawler.stop()
+        if self._active_crawlers:
+            yield defer.DeferredList([c.stop() for c in list(self._active_crawlers)])
 
     def _signal_shutdown(self, signum, _):
         install_shutdown_handlers(self._signal_kill)
@@ -121,32 +128,69 @@ class CrawlerProcess(object):
     #
     def start_crawling(self):
         log.scrapy_info(self.settings)
-        return self._start_crawler() is not None
+        if self.concurrent_crawlers > 1:
+            # crawlers running at the same time share a single log observer,
+            # otherwise every message would be logged once per crawler
+            self._sflo = log.start_from_settings(self.settings)
+        started = self._start_crawlers()
+        self._share_concurrency()
+        return started > 0
 
     def start_reactor(self):
-        if self.settings.getbool('DNSCACHE_ENABLED'):
-            reactor.installResolver(CachingThreadedResolver(reactor))
+        reactor.installResolver(self.resolver)
         reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
         reactor.run(installSignalHandlers=False)  # blocking call
 
+    def _start_crawlers(self):
+        started = 0
+        while len(self._active_crawlers) < self.concurrent_crawlers:
+            if self._start_crawler() is None:
+                break
+            started += 1
+        return started
+
     def _start_crawler(self):
         if not self.crawlers or self.stopping:
             return
 
         name, crawler = self.crawlers.popitem()
-        self._active_crawler = crawler
-        sflo = log.start_from_crawler(crawler)
-        crawler.configure()
-        crawler.install()
-        crawler.signals.connect(crawler.uninstall, signals.engine_stopped)
-        if sflo:
-            crawler.signals.connect(sflo.stop, signals.engine_stopped)
+        self._active_crawlers.add(crawler)
+        self.resolver.stats.add(crawler.stats)
+        if self.concurrent_crawlers > 1:
+            crawler.configure()
+        else:
+            sflo = log.start_from_crawler(crawler)
+            crawler.configure()
+            crawler.install()
+            crawler.signals.connect(crawler.uninstall, signals.engine_stopped)
+            if sflo:
+                crawler.signals.connect(sflo.stop, signals.engine_stopped)
         crawler.signals.connect(self._check_done, signals.engine_stopped)
         crawler.start()
         return name, crawler
 
-    def _check_done(self, **kwargs):
-        if not self._start_crawler():
+    def _share_concurrency(self):
+        """Split the CONCURRENT_REQUESTS budget among the running crawlers"""
+        if self.concurrent_crawlers <= 1 or not self._active_crawlers:
+            return
+        total = self.settings.getint('CONCURRENT_REQUESTS')
+        share, extra = divmod(total, len(self._active_crawlers))
+        for i, crawler in enumerate(self._active_crawlers):
+            engine = crawler.engine
+            engine.downloader.total_concurrency = max(1, share + (i < extra))
+            if engine.slot:
+                engine.slot.nextcall.schedule()
+
+    def _check_done(self, sender, **kwargs):
+        self._active_crawlers.discard(sender)
+        self.resolver.stats.discard(sender.stats)
+        self._start_crawlers()
+        if self._active_crawlers:
+            self._share_concurrency()
+        else:
+            if self._sflo:
+                self._sflo.stop()
+                self._sflo = None
             self._stop_reactor()
 
     def _stop_reactor(self, _=None):
@@ -1,8 +1,16 @@
 from __future__ import print_function
 import os
+import math
+import mmap
+import struct
+from time import time
+from binascii import unhexlify
+
+from twisted.internet import task
 
 from scrapy import log
 from scrapy.utils.job import job_dir
+from scrapy.utils.project import data_path
 from scrapy.utils.request import request_fingerprint
 
 
@@ -69,3 +77,564 @@ class RFPDupeFilter(BaseDupeFilter):
             self.logdupes = False
 
         spider.crawler.stats.inc_value('dupefilter/filtered', spider=spider)
+
+
+class BinaryRFPDupeFilter(RFPDupeFilter):
+    """Request Fingerprint duplicates filter which keeps raw SHA1 digests in a
+    compact binary hash table instead of a set of hex strings.
+
+    When a job directory is used the table lives in ``requests.seen.bin`` and
+    is memory-mapped on resume, so no parsing is needed to restart a job.
+    """
+
+    def __init__(self, path=None, debug=False):
+        self.file = None
+        self.logdupes = True
+        self.debug = debug
+        if path:
+            self.fingerprints = FingerprintTable(os.path.join(path, 'requests.seen.bin'))
+            textpath = os.path.join(path, 'requests.seen')
+            if not self.fingerprints and os.path.exists(textpath):
+                # resuming a job started with RFPDupeFilter
+                with open(textpath) as f:
+                    for x in f:
+                        self.fingerprints.add(unhexlify(x.rstrip()))
+        else:
+            self.fingerprints = FingerprintTable()
+
+    def request_seen(self, request):
+        fp = unhexlify(self.request_fingerprint(request))
+        return not self.fingerprints.add(fp)
+
+    def close(self, reason):
+        self.fingerprints.close()
+
+
+class FingerprintTable(object):
+    """Set of fixed-size binary keys (such as SHA1 digests) stored in a flat
+    open-addressing hash table with linear probing. Each key can optionally
+    carry a fixed-size binary value, stored next to it.
+
+    Keys are expected to be uniformly distributed, so their first bytes are
+    used directly as the hash. Empty slots are all zero bytes; the (very
+    unlikely) all-zero key is kept in a reserved slot after the table.
+
+    If ``path`` is given the table is kept in a memory-mapped file with a small
+    header followed by the slots, otherwise it is kept in a ``bytearray``.
+    """
+
+    header = struct.Struct('<4sBBHHQQ')  # magic, version, flags, keysize, valuesize, capacity, count
+    magic = 'SFPT'
+    version = 2
+    # version 1 tables had no values, and no valuesize in the header
+    header_v1 = struct.Struct('<4sBBHQQ')  # magic, version, flags, keysize, capacity, count
+
+    def __init__(self, path=None, keysize=20, capacity=1024, load_factor=0.7, valuesize=0):
+        if keysize < 8:
+            raise ValueError("FingerprintTable keys must be at least 8 bytes long")
+        self.path = path
+        self.load_factor = load_factor
+        self._file = None
+        if path and os.path.exists(path) and os.path.getsize(path):
+            self._load(path)
+        else:
+            self._setsizes(keysize, valuesize)
+            self._zeroflag = False
+            self._count = 0
+            self._file, self._buf = self._allocate(capacity, path)
+            self._setcapacity(capacity)
+            self._writeheader()
+
+    def add(self, key, value=''):
+        """Add the key to the table, returning ``False`` if it was already
+        present and ``True`` otherwise"""
+        pos, found = self._lookup(key)
+        if found:
+            return False
+        self._insert(pos, key, value)
+        return True
+
+    def get(self, key, default=None):
+        pos, found = self._lookup(key)
+        if not found:
+            return default
+        return str(self._buf[pos + self.keysize:pos + self.recsize])
+
+    def items(self):
+        buf, keysize, recsize, zero = self._buf, self.keysize, self.recsize, self._zero
+        for pos in xrange(self._offset, self._zeropos, recsize):
+            key = str(buf[pos:pos + keysize])
+            if key != zero:
+                yield key, str(buf[pos + keysize:pos + recsize])
+        if self._zeroflag:
+            yield zero, str(buf[self._zeropos + keysize:self._zeropos + recsize])
+
+    def close(self):
+        if self._file is not None:
+            self._buf.flush()
+            self._buf.close()
+            self._file.close()
+            self._file = None
+
+    def __setitem__(self, key, value):
+        pos, found = self._lookup(key)
+        if found:
+            self._buf[pos + self.keysize:pos + self.recsize] = value
+        else:
+            self._insert(pos, key, value)
+
+    def __contains__(self, key):
+        return self._lookup(key)[1]
+
+    def __len__(self):
+        return self._count
+
+    def _lookup(self, key):
+        """Return a (offset, found) tuple with the offset of the slot where
+        key is stored or where it should be stored"""
+        buf, keysize, recsize, zero = self._buf, self.keysize, self.recsize, self._zero
+        if key == zero:
+            return self._zeropos, self._zeroflag
+        slot = struct.unpack_from('<Q', key)[0] & self._mask
+        while True:
+            pos = self._offset + slot * recsize
+            k = buf[pos:pos + keysize]
+            if k == zero:
+                return pos, False
+            if k == key:
+                return pos, True
+            slot = (slot + 1) & self._mask
+
+    def _insert(self, pos, key, value):
+        if len(value) != self.valuesize:
+            raise ValueError("FingerprintTable values must be %d bytes long" % self.valuesize)
+        if key == self._zero:
+            self._zeroflag = True
+        elif self._count + 1 > self._maxcount:
+            self._grow()
+            pos = self._lookup(key)[0]
+        self._buf[pos:pos + self.recsize] = key + value
+        self._count += 1
+        self._writeheader()
+
+    def _grow(self):
+        old_file, old_buf = self._file, self._buf
+        old_offset, old_zeropos = self._offset, self._zeropos
+        capacity = self._capacity * 2
+        tmppath = self.path + '.tmp' if self.path else None
+        self._file, self._buf = self._allocate(capacity, tmppath)
+        self._setcapacity(capacity)
+        zero, keysize, recsize = self._zero, self.keysize, self.recsize
+        for pos in xrange(old_offset, old_zeropos, recsize):
+            if old_buf[pos:pos + keysize] != zero:
+                newpos = self._lookup(old_buf[pos:pos + keysize])[0]
+                self._buf[newpos:newpos + recsize] = old_buf[pos:pos + recsize]
+        self._buf[self._zeropos:self._zeropos + recsize] = \
+            old_buf[old_zeropos:old_zeropos + recsize]
+        self._writeheader()
+        if old_file is not None:
+            self._buf.flush()
+            old_buf.close()
+            old_file.close()
+            os.rename(tmppath, self.path)
+
+    def _allocate(self, capacity, path):
+        return _allocate(path, self.header.size + (capacity + 1) * self.recsize)
+
+    def _load(self, path):
+        self._file = open(path, 'r+b')
+        self._buf = mmap.mmap(self._file.fileno(), 0)
+        if self._buf[:5] == self.magic + chr(1):
+            self._upgrade_v1()
+        magic, version, flags, keysize, valuesize, capacity, self._count = \
+            self.header.unpack_from(self._buf)
+        if magic != self.magic or version != self.version:
+            self._buf.close()
+            self._file.close()
+            raise ValueError("Unsupported fingerprint table file: %s" % path)
+        self._setsizes(keysize, valuesize)
+        self._zeroflag = bool(flags & 1)
+        self._setcapacity(capacity)
+
+    def _upgrade_v1(self):
+        """Rewrite a version 1 table in place: the slots are the same, but the
+        header is larger and the zero key slot after the slots is missing"""
+        magic, version, flags, keysize, capacity, count = \
+            self.header_v1.unpack_from(self._buf)
+        slotssize = capacity * keysize
+        zeropos = self.header.size + slotssize
+        self._buf.resize(zeropos + keysize)
+        self._buf.move(self.header.size, self.header_v1.size, slotssize)
+        # the zero key slot (the stored zero key itself, if flags & 1)
+        self._buf[zeropos:zeropos + keysize] = '\0' * keysize
+        self.header.pack_into(self._buf, 0, magic, self.version, flags,
+                              keysize, 0, capacity, count)
+        self._buf.flush()
+
+    def _setsizes(self, keysize, valuesize):
+        self.keysize = keysize
+        self.valuesize = valuesize
+        self.recsize = keysize + valuesize
+        self._zero = '\0' * keysize
+
+    def _setcapacity(self, capacity):
+        if capacity & (capacity - 1):
+            raise ValueError("FingerprintTable capacity must be a power of 2")
+        self._capacity = capacity
+        self._mask = capacity - 1
+        self._maxcount = int(capacity * self.load_factor)
+        self._offset = self.header.size
+        self._zeropos = self._offset + capacity * self.recsize
+
+    def _writeheader(self):
+        self.header.pack_into(self._buf, 0, self.magic, self.version,
+            int(self._zeroflag), self.keysize, self.valuesize, self._capacity,
+            self._count)
+
+
+class ExpiringRFPDupeFilter(RFPDupeFilter):
+    """Request Fingerprint duplicates filter which only filters requests seen
+    in the last ``DUPEFILTER_SEEN_TTL`` seconds, remembering them across runs
+    of the same spider.
+
+    Fingerprints are kept in a SeenStore inside ``DUPEFILTER_SEEN_DIR``, in a
+    directory named after the spider. When built without a crawler, ``path``
+    is the directory of the SeenStore itself.
+    """
+
+    def __init__(self, path, ttl, debug=False, crawler=None):
+        self.file = None
+        self.logdupes = True
+        self.debug = debug
+        self.path = path
+        self.ttl = ttl
+        self.crawler = crawler
+        self.fingerprints = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = data_path(settings['DUPEFILTER_SEEN_DIR'], createdir=True)
+        ttl = settings.getint('DUPEFILTER_SEEN_TTL')
+        return cls(path, ttl, settings.getbool('DUPEFILTER_DEBUG'), crawler)
+
+    @classmethod
+    def from_settings(cls, settings):
+        raise TypeError("%s keeps a store per spider, so it must be built "
+                        "with from_crawler()" % cls.__name__)
+
+    def open(self):
+        path = self.path
+        if self.crawler is not None:
+            # the spider is set on the engine before the scheduler is opened
+            path = os.path.join(path, self.crawler.engine.spider.name)
+        self.fingerprints = SeenStore(path, self.ttl)
+        self.task = task.LoopingCall(self.fingerprints.compact)
+        self.task.start(self.fingerprints.span, now=False)
+
+    def request_seen(self, request):
+        fp = unhexlify(self.request_fingerprint(request))
+        return not self.fingerprints.add(fp)
+
+    def close(self, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.fingerprints.close()
+
+
+class SeenStore(object):
+    """Persistent set of binary fingerprints which expire ``ttl`` seconds
+    after being added.
+
+    Fingerprints are stored, along with the time they were added, in
+    FingerprintTable segment files covering ``ttl / segments``
+    seconds each. Expired fingerprints are compacted away by removing the
+    segments which only contain expired entries, so the store never grows
+    bigger than what was added in the last ``ttl`` seconds plus one segment.
+    """
+
+    segments = 4
+    timestamp = struct.Struct('<I')
+
+    def __init__(self, path, ttl, keysize=20):
+        if ttl <= 0:
+            raise ValueError("SeenStore ttl must be positive")
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.ttl = ttl
+        self.keysize = keysize
+        self.span = max(1, ttl // self.segments)
+        self.tables = {}
+        for fname in os.listdir(path):
+            start, ext = os.path.splitext(fname)
+            if ext == '.seen' and start.isdigit():
+                self.tables[int(start)] = FingerprintTable(os.path.join(path, fname))
+        self.compact()
+
+    def add(self, key, now=None):
+        """Add the key with the given (or current) time, returning ``False``
+        if it was already added and has not expired yet, and ``True``
+        otherwise"""
+        now = int(time() if now is None else now)
+        if self.seen(key, now):
+            return False
+        start = now - now % self.span
+        if start not in self.tables:
+            path = os.path.join(self.path, '%d.seen' % start)
+            self.tables[start] = FingerprintTable(path, self.keysize,
+                valuesize=self.timestamp.size)
+            self._starts = sorted(self.tables, reverse=True)
+        self.tables[start][key] = self.timestamp.pack(now)
+        return True
+
+    def seen(self, key, now=None):
+        now = int(time() if now is None else now)
+        for start in self._starts:
+            if start + self.span <= now - self.ttl:
+                break
+            value = self.tables[start].get(key)
+            if value is not None and self.timestamp.unpack(value)[0] > now - self.ttl:
+                return True
+        return False
+
+    def compact(self, now=None):
+        """Remove the segments whose fingerprints have all expired"""
+        now = int(time() if now is None else now)
+        for start in sorted(self.tables):
+            if start + self.span > now - self.ttl:
+                break
+            table = self.tables.pop(start)
+            table.close()
+            os.remove(table.path)
+        self._starts = sorted(self.tables, reverse=True)
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def __len__(self):
+        return sum(len(t) for t in self.tables.values())
+
+
+class BloomRFPDupeFilter(RFPDupeFilter):
+    """Request Fingerprint duplicates filter backed by a scalable Bloom
+    filter, trading a small false positive rate for a constant and tiny
+    amount of memory per request.
+
+    When a job directory is used the filter stages are kept in
+    ``requests.seen.bloom.<n>`` files.
+    """
+
+    def __init__(self, path=None, debug=False, capacity=1000000,
+                 error_rate=0.001, stats=None):
+        self.file = None
+        self.logdupes = True
+        self.debug = debug
+        self.stats = stats
+        path = os.path.join(path, 'requests.seen.bloom') if path else None
+        self.fingerprints = ScalableBloomFilter(capacity, error_rate, path)
+
+    @classmethod
+    def from_settings(cls, settings, stats=None):
+        debug = settings.getbool('DUPEFILTER_DEBUG')
+        capacity = settings.getint('DUPEFILTER_BLOOM_CAPACITY')
+        error_rate = settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE')
+        return cls(job_dir(settings), debug, capacity, error_rate, stats)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls.from_settings(crawler.settings, crawler.stats)
+
+    def request_seen(self, request):
+        fp = unhexlify(self.request_fingerprint(request))
+        if not self.fingerprints.add(fp):
+            return True
+        if len(self.fingerprints) % 1000 == 0:
+            self._update_stats()
+
+    def close(self, reason):
+        self._update_stats()
+        self.fingerprints.close()
+
+    def _update_stats(self):
+        if self.stats is None:
+            return
+        bf = self.fingerprints
+        self.stats.set_value('dupefilter/bloom/stages', len(bf.stages))
+        self.stats.set_value('dupefilter/bloom/fill_ratio', bf.fill_ratio)
+        self.stats.set_value('dupefilter/bloom/false_positive_rate', bf.false_positive_rate)
+
+
+class BloomFilter(object):
+    """Bloom filter for uniformly distributed binary keys (such as SHA1
+    digests) of at least 16 bytes, which are used directly as hash values.
+
+    If ``path`` is given the bit array is kept in a memory-mapped file with a
+    small header, otherwise it is kept in a ``bytearray``.
+    """
+
+    header = struct.Struct('<4sBBQQQQd')  # magic, version, hashes, bits, capacity, count, bits set, error rate
+    magic = 'SBLM'
+    version = 1
+
+    def __init__(self, capacity, error_rate, path=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.nbits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.nhashes = max(1, int(round(self.nbits * math.log(2) / capacity)))
+        self.count = 0
+        self.bitsset = 0
+        self._file, self._buf = _allocate(path, self.header.size + (self.nbits + 7) // 8)
+        self._writeheader()
+
+    @classmethod
+    def load(cls, path):
+        bf = cls.__new__(cls)
+        bf._file = open(path, 'r+b')
+        bf._buf = mmap.mmap(bf._file.fileno(), 0)
+        magic, version, bf.nhashes, bf.nbits, bf.capacity, bf.count, \
+            bf.bitsset, bf.error_rate = cls.header.unpack_from(bf._buf)
+        if magic != cls.magic or version != cls.version:
+            bf.close()
+            raise ValueError("Unsupported Bloom filter file: %s" % path)
+        return bf
+
+    def add(self, key):
+        """Add the key to the filter, returning ``False`` if it was (probably)
+        already present and ``True`` otherwise"""
+        buf, offset, added = self._buf, self.header.size, 0
+        for bit in self._bits(key):
+            pos = offset + (bit >> 3)
+            mask = 1 << (bit & 7)
+            byte = _byte.unpack_from(buf, pos)[0]
+            if not byte & mask:
+                _byte.pack_into(buf, pos, byte | mask)
+                added += 1
+        if not added:
+            return False
+        self.count += 1
+        self.bitsset += added
+        self._writeheader()
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._buf.flush()
+            self._buf.close()
+            self._file.close()
+            self._file = None
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    @property
+    def fill_ratio(self):
+        return float(self.bitsset) / self.nbits
+
+    @property
+    def false_positive_rate(self):
+        return self.fill_ratio ** self.nhashes
+
+    def __contains__(self, key):
+        buf, offset = self._buf, self.header.size
+        for bit in self._bits(key):
+            if not _byte.unpack_from(buf, offset + (bit >> 3))[0] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def _bits(self, key):
+        # enhanced double hashing (Dillinger and Manolios)
+        h1, h2 = struct.unpack_from('<QQ', key)
+        nbits = self.nbits
+        x, y = h1 % nbits, h2 % nbits
+        bits = []
+        for i in xrange(self.nhashes):
+            bits.append(x)
+            x = (x + y) % nbits
+            y = (y + i) % nbits
+        return bits
+
+    def _writeheader(self):
+        self.header.pack_into(self._buf, 0, self.magic, self.version,
+            self.nhashes, self.nbits, self.capacity, self.count,
+            self.bitsset, self.error_rate)
+
+
+class ScalableBloomFilter(object):
+    """Bloom filter which grows in stages of increasing capacity and
+    decreasing error rate, so the overall false positive rate stays below
+    ``error_rate`` no matter how many keys are added (see "Scalable Bloom
+    Filters", Almeida et al.)
+
+    If ``path`` is given stages are stored in ``<path>.<n>`` files.
+    """
+
+    def __init__(self, capacity, error_rate, path=None, growth=2, tightening=0.9):
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.path = path
+        self.growth = growth
+        self.tightening = tightening
+        self.stages = []
+        while path and os.path.exists(self._stagepath(len(self.stages))):
+            self.stages.append(BloomFilter.load(self._stagepath(len(self.stages))))
+        if not self.stages:
+            self._addstage()
+
+    def add(self, key):
+        if key in self:
+            return False
+        if self.stages[-1].full:
+            self._addstage()
+        return self.stages[-1].add(key)
+
+    def close(self):
+        for bf in self.stages:
+            bf.close()
+
+    @property
+    def fill_ratio(self):
+        return self.stages[-1].fill_ratio
+
+    @property
+    def false_positive_rate(self):
+        p = 1.
+        for bf in self.stages:
+            p *= 1 - bf.false_positive_rate
+        return 1 - p
+
+    def __contains__(self, key):
+        for bf in reversed(self.stages):
+            if key in bf:
+                return True
+        return False
+
+    def __len__(self):
+        return sum(bf.count for bf in self.stages)
+
+    def _addstage(self):
+        n = len(self.stages)
+        capacity = self.initial_capacity * self.growth ** n
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** n
+        path = self._stagepath(n) if self.path else None
+        self.stages.append(BloomFilter(capacity, error_rate, path))
+
+    def _stagepath(self, n):
+        return '%s.%d' % (self.path, n)
+
+
+# bit arrays may be mmap objects, which index as strings instead of ints
+_byte = struct.Struct('B')
+
+
+def _allocate(path, size):
+    """Return a (file, buffer) tuple with a zeroed buffer of the given size,
+    memory-mapped to a new file at path, if given"""
+    if path is None:
+        return None, bytearray(size)
+    f = open(path, 'w+b')
+    f.truncate(size)
+    return f, mmap.mmap(f.fileno(), size)
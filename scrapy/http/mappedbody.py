@@ -0,0 +1,72 @@
+"""
+This module implements the MappedBody class, used as the body of large
+responses so they don't need to be kept in the Python heap.
+
+See documentation in docs/topics/request-response.rst
+"""
+
+import mmap
+
+
+class MappedBody(mmap.mmap):
+    """A read-only response body backed by a memory mapped (temporary) file.
+
+    It supports the buffer interface, so it can be used with the ``re`` module
+    and written to files without copying it, and it implements the read-only
+    ``str`` methods most commonly used on response bodies. Slicing it returns
+    a ``str``.
+
+    The file is kept open by the mapping, so passing an already unlinked
+    file (like the ones returned by ``tempfile.TemporaryFile``) removes it
+    from disk when the body is garbage collected.
+    """
+
+    def __new__(cls, fileobj):
+        fileobj.flush()
+        return mmap.mmap.__new__(cls, fileobj.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+
+    def __init__(self, fileobj):
+        pass
+
+    def startswith(self, prefix, start=0, end=None):
+        if isinstance(prefix, tuple):
+            return any(self.startswith(p, start, end) for p in prefix)
+        end = len(self) if end is None else min(end, len(self))
+        return start + len(prefix) <= end and \
+            self[start:start + len(prefix)] == prefix
+
+    def endswith(self, suffix, start=0, end=None):
+        if isinstance(suffix, tuple):
+            return any(self.endswith(s, start, end) for s in suffix)
+        end = len(self) if end is None else min(end, len(self))
+        return end - len(suffix) >= start and \
+            self[end - len(suffix):end] == suffix
+
+    def __contains__(self, sub):
+        return self.find(sub) != -1
+
+    def decode(self, *args):
+        return self[:].decode(*args)
+
+    def __str__(self):
+        return self[:]
+
+    def __eq__(self, other):
+        if isinstance(other, MappedBody):
+            other = other[:]
+        if isinstance(other, str):
+            return len(self) == len(other) and self[:] == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return str, (self[:],)
+
+    def __repr__(self):
+        return "<MappedBody %d bytes>" % len(self)
@@ -8,6 +8,7 @@ See documentation in docs/topics/request-response.rst
 import copy
 
 from scrapy.http.headers import Headers
+from scrapy.http.mappedbody import MappedBody
 from scrapy.utils.trackref import object_ref
 from scrapy.http.common import obsolete_setter
 
@@ -45,7 +46,7 @@ class Response(object_ref):
         return self._body
 
     def _set_body(self, body):
-        if isinstance(body, str):
+        if isinstance(body, (str, MappedBody)):
             self._body = body
         elif isinstance(body, unicode):
             raise TypeError("Cannot assign a unicode body to a raw Response. " \
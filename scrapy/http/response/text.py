@@ -5,15 +5,19 @@ discovering (through HTTP headers) to base Response class.
 See documentation in docs/topics/request-response.rst
 """
 
+import codecs
+
 from w3lib.encoding import html_to_unicode, resolve_encoding, \
     html_body_declared_encoding, http_content_type_encoding
 from scrapy.http.response import Response
+from scrapy.http.mappedbody import MappedBody
 from scrapy.utils.python import memoizemethod_noargs
 
 
 class TextResponse(Response):
 
     _DEFAULT_ENCODING = 'ascii'
+    _MAPPED_BODY_SNIFF_SIZE = 65536
 
     def __init__(self, *args, **kwargs):
         self._encoding = kwargs.pop('encoding', None)
@@ -68,6 +72,14 @@ class TextResponse(Response):
         return http_content_type_encoding(content_type)
 
     def _body_inferred_encoding(self):
+        if self._cached_benc is None and isinstance(self.body, MappedBody):
+            # infer the encoding from the beginning of mapped bodies, instead
+            # of decoding them as a whole
+            content_type = self.headers.get('Content-Type')
+            self._cached_benc = html_to_unicode(content_type,
+                    self.body[:self._MAPPED_BODY_SNIFF_SIZE],
+                    auto_detect_fun=self._mapped_auto_detect_fun,
+                    default_encoding=self._DEFAULT_ENCODING)[0]
         if self._cached_benc is None:
             content_type = self.headers.get('Content-Type')
             benc, ubody = html_to_unicode(content_type, self.body, \
@@ -85,6 +97,15 @@ class TextResponse(Response):
                 continue
             return resolve_encoding(enc)
 
+    def _mapped_auto_detect_fun(self, text):
+        # an ascii beginning may be followed by utf-8 text, and the sniffed
+        # text may end in the middle of an utf-8 character
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(text)
+        except UnicodeError:
+            return resolve_encoding('cp1252')
+        return 'utf-8'
+
     @memoizemethod_noargs
     def _body_declared_encoding(self):
         return html_body_declared_encoding(self.body)
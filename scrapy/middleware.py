@@ -10,6 +10,10 @@ class MiddlewareManager(object):
 
     component_name = 'foo middleware'
 
+    # run the chains of middleware methods right away when they return
+    # synchronously, instead of in the next reactor loop
+    fastpath = False
+
     def __init__(self, *middlewares):
         self.middlewares = middlewares
         self.methods = defaultdict(list)
@@ -43,7 +47,13 @@ class MiddlewareManager(object):
         enabled = [x.__class__.__name__ for x in middlewares]
         log.msg(format="Enabled %(componentname)ss: %(enabledlist)s", level=log.INFO,
                 componentname=cls.component_name, enabledlist=', '.join(enabled))
-        return cls(*middlewares)
+        mwman = cls(*middlewares)
+        mwman.fastpath = settings.getbool('SYNC_FASTPATH')
+        cputimer = getattr(crawler, 'cputimer', None)
+        if cputimer is not None:
+            for methods in mwman.methods.itervalues():
+                methods[:] = [cputimer.wrap(method) for method in methods]
+        return mwman
 
     @classmethod
     def from_crawler(cls, crawler):
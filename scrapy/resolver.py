@@ -1,22 +1,216 @@
-from twisted.internet import defer
-from twisted.internet.base import ThreadedResolver
+"""
+Caching DNS resolvers installed in the reactor by the CrawlerProcess.
 
-from scrapy.utils.datatypes import LocalCache
+See documentation in docs/topics/settings.rst (DNS_RESOLVER setting)
+"""
+
+import time
+import socket
 
-# TODO: cache misses
-# TODO: make cache size a setting
+from zope.interface import implements
+from twisted.internet import defer, threads
+from twisted.internet.error import DNSLookupError
+from twisted.internet.interfaces import IResolverSimple
+from twisted.names import client, dns, error, hosts, resolve
 
+from scrapy.utils.datatypes import LocalCache
+
+# host name -> ip address of the last successful lookup, used by the
+# downloader to assign per-IP slots. Shared by all the resolvers, so its size
+# doesn't depend on the DNSCACHE_SIZE of any of them
 dnscache = LocalCache(10000)
 
-class CachingThreadedResolver(ThreadedResolver):
+# gethostbyname errors meaning that the name has no address
+_NEGATIVE_GAIERRORS = set(getattr(socket, code) for code in
+                          ('EAI_NONAME', 'EAI_NODATA') if hasattr(socket, code))
+
+
+class _CachingResolver(object):
+    """Base class of the caching resolvers.
+
+    Successful lookups are cached for the TTL returned by ``_lookup()`` (or
+    until they're pushed out of the cache when ``ttl`` is ``None``). Failed
+    lookups are only cached when the name is known not to exist (or to have
+    no address), for the ``ttl`` of the ``DNSLookupError`` raised by
+    ``_lookup()``; timeouts and server failures aren't cached, so the next
+    lookup tries again. Subclasses implement ``_lookup(name, timeout)``, which
+    must return a deferred firing with an ``(address, ttl)`` tuple.
+    """
+
+    implements(IResolverSimple)
+
+    # seconds to cache missing names for, when the answer doesn't say
+    negative_ttl = 60
+    _time = staticmethod(time.time)
+
+    def __init__(self, reactor, cache_size=10000, timeout=60):
+        self.reactor = reactor
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.stats = set()
+        # host name -> (expiration time or None, ip address or DNSLookupError)
+        self._cache = LocalCache(cache_size)
 
-    def getHostByName(self, name, timeout = (1, 3, 11, 45)):
-        if name in dnscache:
-            return defer.succeed(dnscache[name])
-        d = ThreadedResolver.getHostByName(self, name, timeout)
-        d.addCallback(self._cache_result, name)
+    @classmethod
+    def from_settings(cls, settings, reactor):
+        return cls(reactor, _cache_size(settings), settings.getfloat('DNS_TIMEOUT'))
+
+    def getHostByName(self, name, timeout=None):
+        cached = self._cache.get(name)
+        if cached is not None:
+            expires, result = cached
+            if expires is None or expires > self._time():
+                if isinstance(result, DNSLookupError):
+                    self._inc_stats('dnscache/negative_hit')
+                    return defer.fail(result)
+                self._inc_stats('dnscache/hit')
+                return defer.succeed(result)
+            del self._cache[name]
+        self._inc_stats('dnscache/miss')
+        started = self._time()
+        d = self._lookup(name, self.timeout)
+        d.addCallbacks(self._cb_lookup, self._eb_lookup,
+                       callbackArgs=(name, started), errbackArgs=(name, started))
         return d
 
-    def _cache_result(self, result, name):
-        dnscache[name] = result
+    def _cb_lookup(self, result, name, started):
+        self._lookup_done(started)
+        address, ttl = result
+        if self.cache_size:
+            self._store(name, address, ttl)
+            dnscache[name] = address
+        return address
+
+    def _eb_lookup(self, failure, name, started):
+        self._lookup_done(started)
+        self._inc_stats('dns/lookup_error')
+        ttl = getattr(failure.value, 'ttl', None)
+        if not failure.check(DNSLookupError):
+            failure = DNSLookupError("address %r not found: %s" % \
+                (name, failure.getErrorMessage()))
+        else:
+            failure = failure.value
+        if self.cache_size and ttl:
+            self._store(name, failure, ttl)
+        raise failure
+
+    def _store(self, name, result, ttl):
+        expires = None if ttl is None else self._time() + ttl
+        self._cache[name] = (expires, result)
+
+    def _lookup_done(self, started):
+        latency = self._time() - started
+        self._inc_stats('dns/lookup_count')
+        self._inc_stats('dns/latency_total', latency)
+        for stats in self.stats:
+            stats.max_value('dns/latency_max', latency)
+
+    def _inc_stats(self, key, count=1):
+        for stats in self.stats:
+            stats.inc_value(key, count)
+
+    def _lookup(self, name, timeout):
+        raise NotImplementedError
+
+
+class CachingThreadedResolver(_CachingResolver):
+    """Resolves names with ``socket.gethostbyname`` in the reactor thread pool.
+
+    The system resolver doesn't expose TTLs, so addresses are kept until
+    they're pushed out of the cache, and missing names for ``negative_ttl``
+    seconds.
+    """
+
+    def _lookup(self, name, timeout):
+        d = threads.deferToThreadPool(self.reactor, self.reactor.getThreadPool(),
+                                      socket.gethostbyname, name)
+        # the thread can't be stopped, its result is ignored once cancelled
+        timeout_call = self.reactor.callLater(timeout, d.cancel)
+        d.addBoth(self._cb_finished, timeout_call)
+        d.addCallbacks(lambda address: (address, None), self._eb_gethostbyname,
+                       errbackArgs=(name,))
+        return d
+
+    def _cb_finished(self, result, timeout_call):
+        if timeout_call.active():
+            timeout_call.cancel()
         return result
+
+    def _eb_gethostbyname(self, failure, name):
+        if failure.check(defer.CancelledError):
+            raise DNSLookupError("address %r not found: timeout error" % name)
+        if failure.check(socket.gaierror) and \
+                failure.value.args[0] in _NEGATIVE_GAIERRORS:
+            err = DNSLookupError("address %r not found: %s" % \
+                (name, failure.getErrorMessage()))
+            err.ttl = self.negative_ttl
+            raise err
+        return failure
+
+
+class CachingAsyncResolver(_CachingResolver):
+    """Resolves names without threads, by querying the nameservers from
+    ``servers`` (or ``/etc/resolv.conf`` when it's empty) with
+    ``twisted.names``. The hosts file is looked up first.
+
+    Addresses are cached for the TTL of the DNS answer and missing names for
+    the TTL of the SOA record sent along the negative answer (or
+    ``negative_ttl`` seconds without one).
+    """
+
+    def __init__(self, reactor, cache_size=10000, timeout=60, servers=None):
+        super(CachingAsyncResolver, self).__init__(reactor, cache_size, timeout)
+        if servers:
+            dnsresolver = client.Resolver(servers=servers, reactor=reactor)
+        else:
+            dnsresolver = client.Resolver(resolv='/etc/resolv.conf', reactor=reactor)
+        self._resolver = resolve.ResolverChain([hosts.Resolver(), dnsresolver])
+
+    @classmethod
+    def from_settings(cls, settings, reactor):
+        servers = [_parse_server(s) for s in settings.getlist('DNS_SERVERS')]
+        return cls(reactor, _cache_size(settings),
+                   settings.getfloat('DNS_TIMEOUT'), servers)
+
+    def _lookup(self, name, timeout):
+        # spread the timeout over retries, like twisted.names does by default
+        timeouts = tuple(t * timeout / 60. for t in (1, 3, 11, 45))
+        d = self._resolver.lookupAddress(name, timeouts)
+        d.addCallbacks(self._cb_answers, self._eb_answers,
+                       callbackArgs=(name,), errbackArgs=(name,))
+        return d
+
+    def _cb_answers(self, result, name):
+        answers, authority, _ = result
+        addresses = [a for a in answers if a.type == dns.A]
+        if not addresses:
+            raise self._negative_answer(name, authority)
+        # the answer may include a chain of CNAME records, whose TTLs also apply
+        ttl = min(a.ttl for a in answers)
+        return addresses[0].payload.dottedQuad(), ttl
+
+    def _eb_answers(self, failure, name):
+        if failure.check(error.DNSNameError):
+            message = failure.value.args[0] if failure.value.args else None
+            raise self._negative_answer(name, getattr(message, 'authority', []))
+        return failure
+
+    def _negative_answer(self, name, authority):
+        err = DNSLookupError("address %r not found" % name)
+        soas = [r for r in authority if r.type == dns.SOA]
+        if soas:
+            err.ttl = min(min(r.ttl, r.payload.minimum) for r in soas)
+        else:
+            err.ttl = self.negative_ttl
+        return err
+
+
+def _cache_size(settings):
+    if settings.getbool('DNSCACHE_ENABLED'):
+        return settings.getint('DNSCACHE_SIZE')
+    return 0
+
+
+def _parse_server(server):
+    host, _, port = server.partition(':')
+    return host, int(port or 53)
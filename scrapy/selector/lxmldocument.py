@@ -4,17 +4,34 @@ garbage collection to lxml element tree documents.
 """
 
 import weakref
+from cStringIO import StringIO
 from lxml import etree
+from scrapy.http.mappedbody import MappedBody
 from scrapy.utils.trackref import object_ref
 
 
 def _factory(response, parser_cls):
     url = response.url
+    if isinstance(response.body, MappedBody):
+        root = _mapped_factory(response, parser_cls)
+        if root is not None:
+            return root
     body = response.body_as_unicode().strip().encode('utf8') or '<html/>'
     parser = parser_cls(recover=True, encoding='utf8')
     return etree.fromstring(body, parser=parser, base_url=url)
 
 
+def _mapped_factory(response, parser_cls):
+    # let lxml read mapped bodies in chunks, to avoid decoding them as a whole
+    try:
+        parser = parser_cls(recover=True, encoding=response.encoding)
+        tree = etree.parse(StringIO(response.body), parser=parser,
+                           base_url=response.url)
+    except (LookupError, etree.XMLSyntaxError):
+        return
+    return tree.getroot()
+
+
 class LxmlDocument(object_ref):
 
     cache = weakref.WeakKeyDictionary()
@@ -20,6 +20,17 @@ from os.path import join, abspath, dirname
 
 AJAXCRAWL_ENABLED = False
 
+AUTOCONCURRENCY_ENABLED = False
+AUTOCONCURRENCY_START = 1
+AUTOCONCURRENCY_MIN = 1
+AUTOCONCURRENCY_MAX = 0
+AUTOCONCURRENCY_TARGET_LATENCY = 1.0
+AUTOCONCURRENCY_BACKOFF = 0.5
+AUTOCONCURRENCY_DEBUG = False
+
+BANDWIDTH_LIMIT = 0
+BANDWIDTH_LIMIT_PER_SLOT = 0
+
 BOT_NAME = 'scrapybot'
 
 CLOSESPIDER_TIMEOUT = 0
@@ -31,6 +42,8 @@ COMMANDS_MODULE = ''
 
 COMPRESSION_ENABLED = True
 
+CONCURRENT_CRAWLERS = 1
+
 CONCURRENT_ITEMS = 100
 
 CONCURRENT_REQUESTS = 16
@@ -40,6 +53,8 @@ CONCURRENT_REQUESTS_PER_IP = 0
 COOKIES_ENABLED = True
 COOKIES_DEBUG = False
 
+CPUSTATS_ENABLED = False
+
 DEFAULT_ITEM_CLASS = 'scrapy.item.Item'
 
 DEFAULT_REQUEST_HEADERS = {
@@ -52,6 +67,10 @@ DEPTH_STATS = True
 DEPTH_PRIORITY = 0
 
 DNSCACHE_ENABLED = True
+DNSCACHE_SIZE = 10000
+DNS_RESOLVER = 'scrapy.resolver.CachingThreadedResolver'
+DNS_SERVERS = []
+DNS_TIMEOUT = 60
 
 DOWNLOAD_DELAY = 0
 
@@ -66,9 +85,19 @@ DOWNLOAD_HANDLERS_BASE = {
 
 DOWNLOAD_TIMEOUT = 180      # 3mins
 
+DOWNLOAD_MAXSIZE = 1024*1024*1024   # 1024m
+DOWNLOAD_WARNSIZE = 32*1024*1024    # 32m
+DOWNLOAD_MMAPSIZE = 0
+
+DOWNLOAD_POOL_IDLE_TIMEOUT = 240
+DOWNLOAD_POOL_MAXIDLE = 0
+
 DOWNLOADER_HTTPCLIENTFACTORY = 'scrapy.core.downloader.webclient.ScrapyHTTPClientFactory'
 DOWNLOADER_CLIENTCONTEXTFACTORY = 'scrapy.core.downloader.contextfactory.ScrapyClientContextFactory'
 
+DOWNLOADER_COALESCE = False
+DOWNLOADER_COALESCE_HEADERS = ['Cookie', 'Authorization']
+
 DOWNLOADER_MIDDLEWARES = {}
 
 DOWNLOADER_MIDDLEWARES_BASE = {
@@ -88,12 +117,17 @@ DOWNLOADER_MIDDLEWARES_BASE = {
     'scrapy.contrib.downloadermiddleware.chunked.ChunkedTransferMiddleware': 830,
     'scrapy.contrib.downloadermiddleware.stats.DownloaderStats': 850,
     'scrapy.contrib.downloadermiddleware.httpcache.HttpCacheMiddleware': 900,
+    'scrapy.contrib.downloadermiddleware.autoconcurrency.AutoConcurrencyMiddleware': 950,
     # Downloader side
 }
 
 DOWNLOADER_STATS = True
 
+DUPEFILTER_BLOOM_CAPACITY = 1000000
+DUPEFILTER_BLOOM_ERROR_RATE = 0.001
 DUPEFILTER_CLASS = 'scrapy.dupefilter.RFPDupeFilter'
+DUPEFILTER_SEEN_DIR = 'seen'
+DUPEFILTER_SEEN_TTL = 86400     # 1 day
 
 try:
     EDITOR = os.environ['EDITOR']
@@ -111,11 +145,14 @@ EXTENSIONS_BASE = {
     'scrapy.telnet.TelnetConsole': 0,
     'scrapy.contrib.memusage.MemoryUsage': 0,
     'scrapy.contrib.memdebug.MemoryDebugger': 0,
+    'scrapy.contrib.cpustats.CPUStats': 0,
+    'scrapy.contrib.profiler.SamplingProfiler': 0,
     'scrapy.contrib.closespider.CloseSpider': 0,
     'scrapy.contrib.feedexport.FeedExporter': 0,
     'scrapy.contrib.logstats.LogStats': 0,
     'scrapy.contrib.spiderstate.SpiderState': 0,
     'scrapy.contrib.throttle.AutoThrottle': 0,
+    'scrapy.contrib.prefetch.Prefetch': 0,
 }
 
 FEED_URI = None
@@ -186,6 +223,16 @@ METAREFRESH_MAXDELAY = 100
 
 NEWSPIDER_MODULE = ''
 
+PREFETCH_ENABLED = False
+PREFETCH_CONNECT = False
+PREFETCH_CONCURRENCY = 16
+
+PROFILER_ENABLED = False
+PROFILER_DIR = 'profiles'
+PROFILER_INTERVAL = 0.01
+PROFILER_DUMP_INTERVAL = 600
+PROFILER_MAX_DUMPS = 10
+
 RANDOMIZE_DOWNLOAD_DELAY = True
 
 REDIRECT_ENABLED = True
@@ -203,7 +250,12 @@ ROBOTSTXT_OBEY = False
 
 SCHEDULER = 'scrapy.core.scheduler.Scheduler'
 SCHEDULER_DISK_QUEUE = 'scrapy.squeue.PickleLifoDiskQueue'
+SCHEDULER_DISK_QUEUE_FSYNC = 'segment'
+SCHEDULER_DISK_QUEUE_SEGMENT_SIZE = 16777216
+SCHEDULER_MEMORY_MAX_BYTES = 0
+SCHEDULER_MEMORY_MAX_REQUESTS = 100000
 SCHEDULER_MEMORY_QUEUE = 'scrapy.squeue.LifoMemoryQueue'
+SCHEDULER_SLOT_QUEUE_SIZE = 1
 
 SPIDER_MANAGER_CLASS = 'scrapy.spidermanager.SpiderManager'
 
@@ -226,6 +278,11 @@ STATS_DUMP = True
 
 STATSMAILER_RCPTS = []
 
+SYNC_FASTPATH = False
+
+TIMINGS_STATS = False
+TIMINGS_STATS_PER_SLOT = False
+
 TEMPLATES_DIR = abspath(join(dirname(__file__), '..', 'templates'))
 
 URLLENGTH_LIMIT = 2083
@@ -245,6 +302,7 @@ WEBSERVICE_RESOURCES_BASE = {
     'scrapy.contrib.webservice.crawler.CrawlerResource': 1,
     'scrapy.contrib.webservice.enginestatus.EngineStatusResource': 1,
     'scrapy.contrib.webservice.stats.StatsResource': 1,
+    'scrapy.contrib.webservice.profiler.ProfilerResource': 1,
 }
 
 SPIDER_CONTRACTS = {}
@@ -2,7 +2,12 @@
 Scheduler queues
 """
 
+import os
+import glob
+import heapq
+import struct
 import marshal, cPickle as pickle
+from collections import deque, OrderedDict
 
 from queuelib import queue
 
@@ -10,9 +15,9 @@ def _serializable_queue(queue_class, serialize, deserialize):
 
     class SerializableQueue(queue_class):
 
-        def push(self, obj):
+        def push(self, obj, *args):
             s = serialize(obj)
-            super(SerializableQueue, self).push(s)
+            super(SerializableQueue, self).push(s, *args)
 
         def pop(self):
             s = super(SerializableQueue, self).pop()
@@ -35,5 +40,301 @@ MarshalFifoDiskQueue = _serializable_queue(queue.FifoDiskQueue, \
     marshal.dumps, marshal.loads)
 MarshalLifoDiskQueue = _serializable_queue(queue.LifoDiskQueue, \
     marshal.dumps, marshal.loads)
+
+def _request_codec_queue(queue_class):
+
+    class RequestCodecQueue(queue_class):
+        """Disk queue for requests serialized by the scheduler with
+        scrapy.utils.reqser.RequestCodec"""
+
+        request_codec = True
+
+    return RequestCodecQueue
+
+CompactFifoDiskQueue = _request_codec_queue(queue.FifoDiskQueue)
+CompactLifoDiskQueue = _request_codec_queue(queue.LifoDiskQueue)
+
+
+class SegmentedFifoDiskQueue(object):
+    """Persistent priority queue which stores the records of all priorities
+    in a single append-only log, split in segment files of (about)
+    ``segment_size`` bytes, and keeps an in-memory index of the positions of
+    the records of each priority. Records with the same priority are
+    returned in FIFO order, and lower numbers are higher priorities (like
+    ``queuelib.PriorityQueue``).
+
+    Records are written in batches of ``write_buffer`` bytes. Segments are
+    removed once all their records are consumed, and segments with few
+    records left are compacted (their records are appended again to the log)
+    every ``compact_interval`` pops.
+
+    ``fsync`` is the policy used to flush records to the disk: ``'none'``
+    leaves it to the operating system, ``'segment'`` syncs segments when
+    they are full and when the queue is closed, and ``'batch'`` also syncs
+    after every batch of records is written.
+
+    The index is saved when the queue is closed. If it's missing (because
+    the process was killed), it's rebuilt from the segments, and records
+    which were already consumed since the last time the queue was closed
+    are returned again.
+    """
+
+    priority_queue = True
+    lifo = False
+    compact_ratio = 0.25 # fraction of live bytes below which a segment is compacted
+    compact_interval = 1000
+    max_open_segments = 16
+    fsync_policies = ('none', 'segment', 'batch')
+
+    _header = struct.Struct('<iI') # priority, size
+
+    def __init__(self, path, segment_size=16777216, fsync='segment',
+                 write_buffer=65536):
+        if fsync not in self.fsync_policies:
+            raise ValueError("Unknown fsync policy: %r" % fsync)
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.write_buffer = write_buffer
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.queues = {} # priority -> deque of record positions
+        self.prios = [] # heap of priorities, some of which may be empty
+        self.segments = {} # segment number -> [live records, live bytes, size]
+        self.count = 0
+        self.pops = 0
+        self.curprio = None
+        self.rfds = OrderedDict()
+        if os.path.exists(self._indexpath()):
+            self._loadindex()
+        else:
+            self._rebuild()
+        self.head = max(self.segments) + 1 if self.segments else 0
+        self._openhead()
+
+    @classmethod
+    def from_settings(cls, settings, path):
+        return cls(path, settings.getint('SCHEDULER_DISK_QUEUE_SEGMENT_SIZE'),
+            settings.get('SCHEDULER_DISK_QUEUE_FSYNC'))
+
+    def push(self, string, priority=0):
+        self._index(priority, self._append(priority, string))
+
+    def pop(self):
+        if self.curprio is None:
+            return
+        q = self.queues[self.curprio]
+        pos = q.pop() if self.lifo else q.popleft()
+        if not q:
+            del self.queues[self.curprio]
+            heapq.heappop(self.prios)
+            self.curprio = self.prios[0] if self.prios else None
+        string = self.unflushed.pop(pos, None)
+        if string is None:
+            string = self._read(pos)
+        self.count -= 1
+        self._consume(pos >> 32, self._header.size + len(string))
+        self.pops += 1
+        if self.pops % self.compact_interval == 0:
+            self.compact()
+        return string
+
+    def compact(self):
+        """Append the records of the segments with few live bytes to the log
+        again and remove those segments, if that frees at least one segment
+        worth of disk space"""
+        sparse = set(n for n, (live, livebytes, size) in self.segments.iteritems()
+            if n != self.head and livebytes < size * self.compact_ratio)
+        if sum(self.segments[n][2] - self.segments[n][1] for n in sparse) < self.segment_size:
+            return
+        for priority, q in self.queues.iteritems():
+            for i, pos in enumerate(q):
+                if pos >> 32 in sparse:
+                    # the segment is removed once its last record is read
+                    string = self._read(pos)
+                    self._consume(pos >> 32, self._header.size + len(string))
+                    q[i] = self._append(priority, string)
+
+    def close(self):
+        self._flush()
+        self._sync(self.fsync != 'none')
+        os.close(self.wfd)
+        for fd in self.rfds.values():
+            os.close(fd)
+        self.rfds.clear()
+        if self.count:
+            self._saveindex()
+        else:
+            self._cleanup()
+        return sorted(self.queues)
+
+    def __len__(self):
+        return self.count
+
+    def _index(self, priority, pos):
+        if priority not in self.queues:
+            self.queues[priority] = deque()
+            heapq.heappush(self.prios, priority)
+            if self.curprio is None or priority < self.curprio:
+                self.curprio = priority
+        self.queues[priority].append(pos)
+        self.count += 1
+
+    def _append(self, priority, string):
+        pos = self.head << 32 | self.headsize
+        record = self._header.pack(priority, len(string)) + string
+        self.wbuf.append(record)
+        self.wbufsize += len(record)
+        self.unflushed[pos] = string
+        self.headsize += len(record)
+        segment = self.segments[self.head]
+        segment[0] += 1
+        segment[1] += len(record)
+        segment[2] = self.headsize
+        if self.wbufsize >= self.write_buffer:
+            self._flush()
+        if self.headsize >= self.segment_size:
+            self._rotate()
+        return pos
+
+    def _consume(self, number, size):
+        segment = self.segments[number]
+        segment[0] -= 1
+        segment[1] -= size
+        if not segment[0] and number != self.head:
+            self._remove(number)
+
+    def _read(self, pos):
+        fd = self._rfd(pos >> 32)
+        os.lseek(fd, pos & 0xffffffff, os.SEEK_SET)
+        _, size = self._header.unpack(os.read(fd, self._header.size))
+        return os.read(fd, size)
+
+    def _rfd(self, number):
+        fd = self.rfds.pop(number, None)
+        if fd is None:
+            if len(self.rfds) >= self.max_open_segments:
+                os.close(self.rfds.popitem(last=False)[1])
+            fd = os.open(self._segmentpath(number), os.O_RDONLY)
+        self.rfds[number] = fd
+        return fd
+
+    def _flush(self):
+        if self.wbuf:
+            os.write(self.wfd, ''.join(self.wbuf))
+            self.wbuf = []
+            self.wbufsize = 0
+            self.unflushed.clear()
+            self._sync(self.fsync == 'batch')
+
+    def _sync(self, sync):
+        if sync:
+            os.fsync(self.wfd)
+
+    def _rotate(self):
+        self._flush()
+        self._sync(self.fsync != 'none')
+        os.close(self.wfd)
+        number = self.head
+        self.head += 1
+        self._openhead()
+        if not self.segments[number][0]:
+            self._remove(number)
+
+    def _openhead(self):
+        self.wfd = os.open(self._segmentpath(self.head),
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.wbuf = []
+        self.wbufsize = 0
+        self.unflushed = {}
+        self.headsize = 0
+        self.segments[self.head] = [0, 0, 0]
+
+    def _remove(self, number):
+        fd = self.rfds.pop(number, None)
+        if fd is not None:
+            os.close(fd)
+        os.remove(self._segmentpath(number))
+        del self.segments[number]
+
+    def _saveindex(self):
+        index = {
+            'segments': self.segments,
+            'queues': dict((p, list(q)) for p, q in self.queues.iteritems()),
+        }
+        with open(self._indexpath(), 'wb') as f:
+            marshal.dump(index, f)
+            if self.fsync != 'none':
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _loadindex(self):
+        with open(self._indexpath(), 'rb') as f:
+            index = marshal.load(f)
+        # a stale index must not be used if the process is killed from now on
+        os.remove(self._indexpath())
+        self.segments = index['segments']
+        for priority, positions in index['queues'].iteritems():
+            self.queues[priority] = deque(positions)
+            self.prios.append(priority)
+            self.count += len(positions)
+        heapq.heapify(self.prios)
+        self.curprio = self.prios[0] if self.prios else None
+
+    def _rebuild(self):
+        hsize = self._header.size
+        for number in sorted(self._segmentnumbers()):
+            segment = self.segments[number] = [0, 0, 0]
+            with open(self._segmentpath(number), 'rb+') as f:
+                filesize = os.fstat(f.fileno()).st_size
+                offset = 0
+                while offset + hsize <= filesize:
+                    priority, size = self._header.unpack(f.read(hsize))
+                    if offset + hsize + size > filesize:
+                        break
+                    self._index(priority, number << 32 | offset)
+                    segment[0] += 1
+                    offset += hsize + size
+                    f.seek(offset)
+                # discard records partially written
+                f.truncate(offset)
+            segment[1] = segment[2] = offset
+            if not segment[0]:
+                self._remove(number)
+
+    def _cleanup(self):
+        for number in self._segmentnumbers():
+            os.remove(self._segmentpath(number))
+        if not os.listdir(self.path):
+            os.rmdir(self.path)
+
+    def _segmentnumbers(self):
+        paths = glob.glob(os.path.join(self.path, 's*'))
+        return [int(os.path.basename(p)[1:]) for p in paths]
+
+    def _segmentpath(self, number):
+        return os.path.join(self.path, 's%06d' % number)
+
+    def _indexpath(self):
+        return os.path.join(self.path, 'index')
+
+
+class SegmentedLifoDiskQueue(SegmentedFifoDiskQueue):
+    """Like SegmentedFifoDiskQueue, but records with the same priority are
+    returned in LIFO order"""
+
+    lifo = True
+
+
+PickleSegmentedFifoDiskQueue = _serializable_queue(SegmentedFifoDiskQueue, \
+    _pickle_serialize, pickle.loads)
+PickleSegmentedLifoDiskQueue = _serializable_queue(SegmentedLifoDiskQueue, \
+    _pickle_serialize, pickle.loads)
+MarshalSegmentedFifoDiskQueue = _serializable_queue(SegmentedFifoDiskQueue, \
+    marshal.dumps, marshal.loads)
+MarshalSegmentedLifoDiskQueue = _serializable_queue(SegmentedLifoDiskQueue, \
+    marshal.dumps, marshal.loads)
+CompactSegmentedFifoDiskQueue = _request_codec_queue(SegmentedFifoDiskQueue)
+CompactSegmentedLifoDiskQueue = _request_codec_queue(SegmentedLifoDiskQueue)
 FifoMemoryQueue = queue.FifoMemoryQueue
 LifoMemoryQueue = queue.LifoMemoryQueue
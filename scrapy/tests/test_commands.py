@@ -1,5 +1,7 @@
 import os
+import re
 import sys
+import json
 import subprocess
 from time import sleep
 from os.path import exists, join, abspath
@@ -228,6 +230,61 @@ ITEM_PIPELINES = {'%s.pipelines.MyPipeline': 1}
         self.assert_("[scrapy] INFO: It Works!" in log, log)
 
 
+class CrawlWorkersCommandTest(CommandTest):
+
+    def setUp(self):
+        super(CrawlWorkersCommandTest, self).setUp()
+        fname = abspath(join(self.proj_mod_path, 'spiders', 'follow.py'))
+        with open(fname, 'w') as f:
+            f.write("""
+from scrapy.http import Request
+from scrapy.item import Item, Field
+from scrapy.spider import Spider
+from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor
+
+class PageItem(Item):
+    url = Field()
+
+class FollowSpider(Spider):
+    name = 'follow'
+    start_urls = ['http://localhost:8998/follow?total=10&show=20&order=desc',
+                  'http://127.0.0.1:8998/follow?total=10&show=20&order=desc']
+
+    def parse(self, response):
+        yield PageItem(url=response.url)
+        for link in SgmlLinkExtractor().extract_links(response):
+            yield Request(link.url)
+            # links to the other host are forwarded to the worker owning it
+            if 'localhost' in link.url:
+                yield Request(link.url.replace('localhost', '127.0.0.1'))
+            else:
+                yield Request(link.url.replace('127.0.0.1', 'localhost'))
+""")
+
+    def test_workers(self):
+        from scrapy.tests.mockserver import MockServer
+        with MockServer():
+            p = self.proc('crawl', 'follow', '--workers', '2', '-o', 'items.jl')
+        log = p.stderr.read()
+        self.assertEqual(p.returncode, 0, log)
+        self.assert_("Dumping merged Scrapy stats of 2 workers" in log, log)
+        merged = log.split("Dumping merged Scrapy stats")[1]
+        forwarded = re.search(r"'workers/forwarded': (\d+)", merged).group(1)
+        received = re.search(r"'workers/received': (\d+)", merged).group(1)
+        self.assertEqual(forwarded, received)
+        self.assert_("'item_scraped_count': 22" in merged, log)
+        self.assert_("'request_depth_max': 2" in merged, log)
+        with open(join(self.cwd, 'items.jl')) as f:
+            urls = [json.loads(line)['url'] for line in f]
+        self.assertEqual(len(urls), 22)
+        self.assertEqual(len(set(urls)), 22)
+        self.assertEqual(len([u for u in urls if 'localhost' in u]), 11)
+
+    def test_invalid_workers(self):
+        p = self.proc('crawl', 'follow', '--workers', '0')
+        self.assertEqual(p.returncode, 2)
+
+
 class BenchCommandTest(CommandTest):
 
     def test_run(self):
@@ -0,0 +1,111 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+import mock
+
+from scrapy.contrib.profiler import SamplingProfiler, write_callgrind, write_folded
+from scrapy.contrib.webservice.profiler import ProfilerResource
+from scrapy.statscol import StatsCollector
+from scrapy.utils.test import get_crawler
+
+A = ('a.py', 1, 'a')
+B = ('b.py', 10, 'b')
+C = ('c.py', 20, 'c')
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class WriteSamplesTest(unittest.TestCase):
+
+    samples = {(A, B): 3, (A, B, C): 2, (A,): 1}
+
+    def test_write_callgrind(self):
+        f = StringIO()
+        write_callgrind(self.samples, f)
+        output = f.getvalue()
+        self.assertTrue(output.startswith('events: Samples\nsummary: 6\n'))
+        self.assertIn('fl=b.py\nfn=b b.py:10\n10 3\n'
+                      'cfl=c.py\ncfn=c c.py:20\ncalls=2 20\n10 2\n', output)
+        self.assertIn('fl=c.py\nfn=c c.py:20\n20 2\n', output)
+        self.assertIn('fn=a a.py:1\n1 1\ncfl=b.py\ncfn=b b.py:10\ncalls=5 10\n1 5\n',
+                      output)
+
+    def test_write_folded(self):
+        f = StringIO()
+        write_folded(self.samples, f)
+        self.assertEqual(sorted(f.getvalue().splitlines()), [
+            'a (a.py:1) 1',
+            'a (a.py:1);b (b.py:10) 3',
+            'a (a.py:1);b (b.py:10);c (c.py:20) 2',
+        ])
+
+
+class SamplingProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.stats = StatsCollector(get_crawler())
+
+    def get_profiler(self, **kwargs):
+        kwargs.setdefault('dump_interval', 0)
+        return SamplingProfiler(self.stats, os.path.join(self.directory, 'profiles'),
+                                **kwargs)
+
+    def test_sample(self):
+        profiler = self.get_profiler(interval=0.001)
+        self.assertEqual(profiler.dump(), [])
+        self.assertTrue(profiler.start())
+        self.assertFalse(profiler.start())
+        busy(0.2)
+        self.assertTrue(profiler.status()['running'])
+        self.assertTrue(profiler.stop())
+        self.assertFalse(profiler.stop())
+
+        status = profiler.status()
+        self.assertFalse(status['running'])
+        self.assertEqual(status['samples'], 0)
+        callgrind, = status['dumps']
+        with open(callgrind) as f:
+            self.assertIn('\nfn=busy %s' % __file__.replace('.pyc', '.py'), f.read())
+        with open(callgrind.replace('.callgrind', '.folded')) as f:
+            self.assertIn('test_sample (', f.read())
+        self.assertEqual(self.stats.get_value('profiler/dumps'), 1)
+        self.assertTrue(self.stats.get_value('profiler/samples') > 0)
+
+    @mock.patch('scrapy.contrib.profiler.strftime')
+    def test_max_dumps(self, strftime):
+        profiler = self.get_profiler(max_dumps=2)
+        # a dump of another process
+        os.makedirs(profiler.directory)
+        other = os.path.join(profiler.directory, 'profile-0-0-1.callgrind')
+        open(other, 'w').close()
+        for i in range(3):
+            strftime.return_value = str(i)
+            profiler.samples = {(A,): 1}
+            profiler.dump()
+        self.assertEqual(sorted(os.listdir(profiler.directory)),
+            ['profile-0-0-1.callgrind'] +
+            ['profile-%d-%d-%d.%s' % (os.getpid(), i, i + 1, ext)
+             for i in (1, 2) for ext in ('callgrind', 'folded')])
+        self.assertNotIn(other, profiler.status()['dumps'])
+
+    def test_resource(self):
+        crawler = get_crawler()
+        profiler = self.get_profiler()
+        crawler.extensions = mock.Mock(middlewares=(object(), profiler))
+        resource = ProfilerResource(crawler)
+        self.assertIs(resource.get_target(), profiler)
+        self.assertEqual(resource.render_GET(None)['running'], False)
+
+
+if __name__ == "__main__":
+    unittest.main()
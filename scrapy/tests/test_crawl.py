@@ -3,7 +3,7 @@ import socket
 import mock
 from twisted.internet import defer
 from twisted.trial.unittest import TestCase
-from scrapy.utils.test import docrawl, get_testlog
+from scrapy.utils.test import docrawl, get_testlog, get_crawler
 from scrapy.tests.spiders import FollowAllSpider, DelaySpider, SimpleSpider, \
     BrokenStartRequestsSpider, SingleRequestSpider
 from scrapy.tests.mockserver import MockServer
@@ -25,6 +25,40 @@ class CrawlTestCase(TestCase):
         yield docrawl(spider)
         self.assertEqual(len(spider.urls_visited), 11)  # 10 + start_url
 
+    @defer.inlineCallbacks
+    def test_follow_all_slot_scheduler(self):
+        spider = FollowAllSpider()
+        yield docrawl(spider, {'SCHEDULER': 'scrapy.core.scheduler.SlotScheduler'})
+        self.assertEqual(len(spider.urls_visited), 11)  # 10 + start_url
+
+    @defer.inlineCallbacks
+    def test_follow_all_hybrid_scheduler(self):
+        spider = FollowAllSpider()
+        yield docrawl(spider, {'SCHEDULER': 'scrapy.core.scheduler.HybridScheduler',
+                               'SCHEDULER_MEMORY_MAX_REQUESTS': 2})
+        self.assertEqual(len(spider.urls_visited), 11)  # 10 + start_url
+
+    @defer.inlineCallbacks
+    def test_follow_all_prefetch(self):
+        spider = FollowAllSpider()
+        yield docrawl(spider, {'PREFETCH_ENABLED': True, 'PREFETCH_CONNECT': True})
+        self.assertEqual(len(spider.urls_visited), 11)  # 10 + start_url
+        # every request is for the same host
+        self.assertEqual(spider.crawler.stats.get_value('prefetch/dns'), 1)
+        self.assertEqual(spider.crawler.stats.get_value('prefetch/error'), None)
+
+    @defer.inlineCallbacks
+    def test_follow_all_fastpath(self):
+        spider = FollowAllSpider()
+        yield docrawl(spider, {'SYNC_FASTPATH': True})
+        self.assertEqual(len(spider.urls_visited), 11)  # 10 + start_url
+
+    @defer.inlineCallbacks
+    def test_follow_all_autoconcurrency(self):
+        spider = FollowAllSpider()
+        yield docrawl(spider, {'AUTOCONCURRENCY_ENABLED': True})
+        self.assertEqual(len(spider.urls_visited), 11)  # 10 + start_url
+
     @defer.inlineCallbacks
     def test_delay(self):
         # short to long delays
@@ -201,3 +235,91 @@ with multiples lines
         s = dict(est[0])
         self.assertEqual(s['engine.spider.name'], spider.name)
         self.assertEqual(s['len(engine.scraper.slot.active)'], 1)
+
+    @defer.inlineCallbacks
+    def test_timings(self):
+        spider = SingleRequestSpider(seed='http://localhost:8998/')
+        yield docrawl(spider, {'TIMINGS_STATS': True,
+                               'TIMINGS_STATS_PER_SLOT': True})
+        response, = spider.meta['responses']
+        self.assertEqual(sorted(response.meta['timings']),
+            ['body', 'connect', 'dns', 'download', 'scheduler',
+             'scrape', 'scraper_queue', 'slot_queue', 'ttfb'])
+        timings = response.meta['timings']
+        self.assertTrue(timings['download'] >= timings['dns'] +
+            timings['connect'] + timings['ttfb'] + timings['body'] - 0.001)
+        stats = spider.crawler.stats
+        for phase in timings:
+            self.assertEqual(stats.get_value('timings/%s/count' % phase), 1)
+            self.assertEqual(stats.get_value('timings/slots/localhost/%s/count' % phase), 1)
+
+    @defer.inlineCallbacks
+    def test_timings_disabled(self):
+        seed = Request('http://localhost:8998/', meta={'timings': 'mine'})
+        spider = SingleRequestSpider(seed=seed)
+        yield docrawl(spider)
+        response, = spider.meta['responses']
+        self.assertEqual(response.meta['timings'], 'mine')
+        self.assertEqual(spider.crawler.engine._scheduled_at.keys(), [])
+
+    @defer.inlineCallbacks
+    def test_cpustats(self):
+        spider = FollowAllSpider()
+        yield docrawl(spider, {'CPUSTATS_ENABLED': True})
+        self.assertEqual(len(spider.urls_visited), 11)
+        stats = spider.crawler.stats
+        self.assertEqual(stats.get_value('cpustats/FollowAllSpider.parse/calls'), 11)
+        self.assertEqual(stats.get_value('cpustats/RetryMiddleware.process_response/calls'), 11)
+        self.assertEqual(stats.get_value('cpustats/DepthMiddleware.process_spider_output/calls'), 11)
+        self.assertTrue(stats.get_value('cpustats/FollowAllSpider.parse/cpu') >= 0)
+        self.assertTrue(stats.get_value('cpustats/FollowAllSpider.parse/wall') >= 0)
+
+
+class ConcurrentCrawlersTest(TestCase):
+
+    def setUp(self):
+        self.mockserver = MockServer()
+        self.mockserver.__enter__()
+
+    def tearDown(self):
+        self.mockserver.__exit__(None, None, None)
+
+    def _get_process(self, settings):
+        from scrapy.crawler import CrawlerProcess
+        settings.update({'LOG_ENABLED': False, 'CONCURRENT_REQUESTS': 5})
+        with mock.patch('scrapy.crawler.install_shutdown_handlers'):
+            process = CrawlerProcess(get_crawler(settings).settings)
+        process.finished = defer.Deferred()
+        process._stop_reactor = lambda: process.finished.callback(None)
+        return process
+
+    @defer.inlineCallbacks
+    def test_concurrent_crawlers(self):
+        process = self._get_process({'CONCURRENT_CRAWLERS': 2})
+        spiders = [FollowAllSpider(total=5) for _ in range(3)]
+        for i, spider in enumerate(spiders):
+            process.create_crawler(i).crawl(spider)
+        self.assertTrue(process.start_crawling())
+        self.assertEqual(len(process._active_crawlers), 2)
+        self.assertEqual(len(process.crawlers), 1)
+        concurrency = [c.engine.downloader.total_concurrency
+                       for c in process._active_crawlers]
+        self.assertEqual(sorted(concurrency), [2, 3])
+        yield process.finished
+        self.assertEqual(len(process._active_crawlers), 0)
+        for spider in spiders:
+            self.assertEqual(len(spider.urls_visited), 6)  # 5 + start_url
+
+    @defer.inlineCallbacks
+    def test_sequential_crawlers(self):
+        process = self._get_process({})
+        spiders = [FollowAllSpider(total=5) for _ in range(2)]
+        for i, spider in enumerate(spiders):
+            process.create_crawler(i).crawl(spider)
+        self.assertTrue(process.start_crawling())
+        self.assertEqual(len(process._active_crawlers), 1)
+        crawler, = process._active_crawlers
+        self.assertEqual(crawler.engine.downloader.total_concurrency, 5)
+        yield process.finished
+        for spider in spiders:
+            self.assertEqual(len(spider.urls_visited), 6)  # 5 + start_url
@@ -0,0 +1,146 @@
+import mock
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from scrapy.core.downloader import Downloader
+from scrapy.http import Request, Response
+from scrapy.spider import Spider
+from scrapy.utils.test import get_crawler
+
+
+class FakeHandlers(object):
+
+    def __init__(self):
+        self.downloaded = []
+        self.hanging = []
+
+    def download_request(self, request, spider):
+        self.downloaded.append(request.url)
+        if request.meta.get('hang'):
+            d = defer.Deferred()
+            self.hanging.append(d)
+            return d
+        return defer.succeed(Response(request.url))
+
+
+class DownloaderSlotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.clock.advance(1000)
+        patches = [mock.patch('scrapy.core.downloader.reactor', self.clock),
+                   mock.patch('scrapy.core.downloader.time', self.clock.seconds)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        crawler = get_crawler({'DOWNLOAD_DELAY': 1,
+                               'RANDOMIZE_DOWNLOAD_DELAY': False})
+        self.downloader = Downloader(crawler)
+        self.downloader.handlers = self.handlers = FakeHandlers()
+        self.spider = Spider('foo')
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def enqueue(self, *urls, **meta):
+        return [self.downloader._enqueue_request(Request(url, meta=meta), self.spider)
+                for url in urls]
+
+    def test_delayed_slots_share_a_timer(self):
+        self.enqueue('http://a.com/1', 'http://b.com/1', 'http://c.com/1',
+                     'http://a.com/2', 'http://b.com/2', 'http://c.com/2')
+        self.assertEqual(self.handlers.downloaded,
+                         ['http://a.com/1', 'http://b.com/1', 'http://c.com/1'])
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(0.5)
+        self.assertEqual(len(self.handlers.downloaded), 3)
+        self.clock.advance(0.5)
+        self.assertEqual(sorted(self.handlers.downloaded[3:]),
+                         ['http://a.com/2', 'http://b.com/2', 'http://c.com/2'])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_earlier_slot_reschedules_timer(self):
+        _, slow = self.downloader._get_slot(Request('http://slow.com'), self.spider)
+        slow.delay = 10
+        self.enqueue('http://slow.com/1', 'http://slow.com/2')
+        self.enqueue('http://a.com/1', 'http://a.com/2')
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(1)
+        self.assertEqual(self.handlers.downloaded[-1], 'http://a.com/2')
+        self.clock.advance(9)
+        self.assertEqual(self.handlers.downloaded[-1], 'http://slow.com/2')
+
+    def test_slot_gc(self):
+        self.enqueue('http://a.com/1', 'http://b.com/1')
+        self.clock.advance(30)
+        self.enqueue('http://c.com/1')
+        self.assertEqual(sorted(self.downloader.slots), ['a.com', 'b.com', 'c.com'])
+        self.clock.advance(40)
+        self.downloader._slot_gc()
+        self.assertEqual(sorted(self.downloader.slots), ['c.com'])
+        # active slots are never collected
+        self.enqueue('http://c.com/2', hang=True)
+        self.clock.advance(100)
+        self.downloader._slot_gc()
+        self.assertEqual(list(self.downloader.slots), ['c.com'])
+
+
+class DownloaderCoalesceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler = get_crawler({'DOWNLOADER_COALESCE': True})
+        self.downloader = Downloader(self.crawler)
+        self.downloader.handlers = self.handlers = FakeHandlers()
+        self.spider = Spider('foo')
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def fetch(self, url, **kwargs):
+        kwargs.setdefault('meta', {})['hang'] = True
+        responses = []
+        d = self.downloader.fetch(Request(url, **kwargs), self.spider)
+        d.addBoth(responses.append)
+        return responses
+
+    def test_coalesce(self):
+        r1 = self.fetch('http://a.com/?x=1&y=2')
+        r2 = self.fetch('http://a.com/?y=2&x=1', dont_filter=True)
+        r3 = self.fetch('http://a.com/?x=1&y=2', method='POST')
+        r4 = self.fetch('http://a.com/?x=1&y=2', meta={'dont_coalesce': True})
+        self.assertEqual(len(self.handlers.downloaded), 3)
+        self.handlers.hanging[0].callback(Response('http://a.com/?x=1&y=2'))
+        (res1,), (res2,) = r1, r2
+        self.assertEqual(res1.flags, [])
+        self.assertEqual(res2.flags, ['coalesced'])
+        self.assertIsNot(res1, res2)
+        self.assertEqual((r3, r4), ([], []))
+        self.assertEqual(self.crawler.stats.get_value('downloader/coalesced_count'), 1)
+        # once downloaded, requests are downloaded again
+        self.fetch('http://a.com/?x=1&y=2')
+        self.assertEqual(len(self.handlers.downloaded), 4)
+
+    def test_coalesce_meta(self):
+        req1 = Request('http://a.com', meta={'hang': True})
+        req2 = Request('http://a.com', meta={'hang': True})
+        self.downloader.fetch(req1, self.spider)
+        self.downloader.fetch(req2, self.spider)
+        self.assertEqual(len(self.handlers.downloaded), 1)
+        req1.meta['download_latency'] = 0.5
+        self.handlers.hanging[0].callback(Response('http://a.com'))
+        self.assertEqual(req2.meta['download_slot'], 'a.com')
+        self.assertEqual(req2.meta['download_latency'], 0.5)
+
+    def test_coalesce_headers(self):
+        self.fetch('http://a.com', headers={'Authorization': 'Basic 1'})
+        self.fetch('http://a.com', headers={'Authorization': 'Basic 2'})
+        self.fetch('http://a.com', headers={'Authorization': 'Basic 1', 'Accept': 'foo'})
+        self.assertEqual(len(self.handlers.downloaded), 2)
+
+    def test_coalesce_failure(self):
+        r1 = self.fetch('http://a.com')
+        r2 = self.fetch('http://a.com')
+        self.handlers.hanging[0].errback(ValueError('foo'))
+        for (failure,) in (r1, r2):
+            self.assertTrue(failure.check(ValueError))
+        self.assertEqual(self.downloader._inflight, {})
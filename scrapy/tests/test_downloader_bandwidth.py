@@ -0,0 +1,83 @@
+import unittest
+
+from scrapy.core.downloader.bandwidth import TokenBucket, BandwidthLimiter
+from scrapy.settings import Settings
+from scrapy.statscol import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_consume(self):
+        clock = Clock()
+        bucket = TokenBucket(100, clock=clock)
+        self.assertEqual(bucket.consume(60), 0)
+        self.assertEqual(bucket.consume(40), 0)
+        # in debt, waits until there are tokens again
+        self.assertEqual(bucket.consume(50), 0.5)
+        clock.now += 0.5
+        self.assertEqual(bucket.consume(100), 1)
+        # never holds more than the burst size
+        clock.now += 10
+        self.assertEqual(bucket.consume(100), 0)
+        self.assertEqual(bucket.consume(20), 0.2)
+
+    def test_burst(self):
+        bucket = TokenBucket(100, burst=500, clock=Clock())
+        self.assertEqual(bucket.consume(500), 0)
+        self.assertEqual(bucket.consume(100), 1)
+
+
+class BandwidthLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.stats = MemoryStatsCollector(get_crawler())
+
+    def test_from_settings(self):
+        self.assertIsNone(BandwidthLimiter.from_settings(Settings()))
+        limiter = BandwidthLimiter.from_settings(Settings({'BANDWIDTH_LIMIT_PER_SLOT': 10}))
+        self.assertIsNone(limiter.bucket)
+        self.assertEqual(limiter.slot_rate, 10)
+
+    def test_global_limit(self):
+        limiter = BandwidthLimiter(1000, stats=self.stats, clock=self.clock)
+        self.assertEqual(limiter.consume(600, 'a'), 0)
+        self.assertEqual(limiter.consume(600, 'b'), 0.2)
+        self.assertEqual(self.stats.get_value('bandwidth/throttled'), 1)
+
+    def test_slot_limit(self):
+        limiter = BandwidthLimiter(1000, 100, stats=self.stats, clock=self.clock)
+        self.assertEqual(limiter.consume(100, 'a'), 0)
+        self.assertEqual(limiter.consume(100, 'b'), 0)
+        self.assertEqual(limiter.consume(50, 'a'), 0.5)
+        # requests without slot only count for the global limit
+        self.assertEqual(limiter.consume(100), 0)
+
+    def test_stats(self):
+        limiter = BandwidthLimiter(1000, 500, stats=self.stats, clock=self.clock)
+        limiter.consume(300, 'a')
+        limiter.consume(200, 'b')
+        limiter.consume(100, 'b')
+        self.clock.now += 2
+        limiter._update_stats()
+        self.assertEqual(self.stats.get_value('bandwidth/rate'), 300)
+        self.assertEqual(self.stats.get_value('bandwidth/slot_rate'), 150)
+        self.clock.now += 1
+        limiter._update_stats()
+        self.assertEqual(self.stats.get_value('bandwidth/rate'), 0)
+        self.assertEqual(self.stats.get_value('bandwidth/rate_max'), 300)
+        self.assertEqual(self.stats.get_value('bandwidth/slot_rate_max'), 150)
+
+
+if __name__ == "__main__":
+    unittest.main()
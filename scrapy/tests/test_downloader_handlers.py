@@ -1,10 +1,13 @@
 import os
+import time
 import twisted
+from cStringIO import StringIO
+from gzip import GzipFile
 
 from twisted.trial import unittest
 from twisted.protocols.policies import WrappingFactory
 from twisted.python.filepath import FilePath
-from twisted.internet import reactor, defer, error
+from twisted.internet import reactor, defer, error, task
 from twisted.web import server, static, util, resource
 from twisted.web.test.test_webclient import ForeverTakingResource, \
         NoLengthResource, HostHeaderResource, \
@@ -19,12 +22,14 @@ from scrapy.core.downloader.handlers import DownloadHandlers
 from scrapy.core.downloader.handlers.file import FileDownloadHandler
 from scrapy.core.downloader.handlers.http import HTTPDownloadHandler, HttpDownloadHandler
 from scrapy.core.downloader.handlers.http10 import HTTP10DownloadHandler
-from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler, \
+    ScrapyHTTPConnectionPool
 from scrapy.core.downloader.handlers.s3 import S3DownloadHandler
 from scrapy.core.downloader.handlers.ftp import FTPDownloadHandler
 
 from scrapy.spider import Spider
 from scrapy.http import Request
+from scrapy.http.mappedbody import MappedBody
 from scrapy.settings import Settings
 from scrapy import optional_features
 from scrapy.utils.test import get_crawler
@@ -105,6 +110,8 @@ class HttpTestCase(unittest.TestCase):
         r.putChild("host", HostHeaderResource())
         r.putChild("payload", PayloadResource())
         r.putChild("broken", BrokenDownloadResource())
+        r.putChild("largechunkedfile", LargeChunkedFileResource())
+        r.putChild("gzip", GzipResource())
         self.site = server.Site(r, timeout=None)
         self.wrapper = WrappingFactory(self.site)
         self.port = reactor.listenTCP(0, self.wrapper, interface='127.0.0.1')
@@ -202,12 +209,278 @@ class Http10TestCase(HttpTestCase):
     download_handler_cls = HTTP10DownloadHandler
 
 
+class LargeChunkedFileResource(resource.Resource):
+    """Write 1000 bytes in chunks, without a Content-Length header"""
+
+    def render(self, request):
+        def response():
+            for i in xrange(100):
+                request.write("0123456789")
+            request.finish()
+        reactor.callLater(0, response)
+        return server.NOT_DONE_YET
+
+
+class GzipResource(resource.Resource):
+    """Write 1000 gzip encoded bytes in chunks"""
+
+    def render(self, request):
+        buf = StringIO()
+        with GzipFile(fileobj=buf, mode='wb') as f:
+            f.write("0123456789" * 100)
+        body = buf.getvalue()
+        request.setHeader('Content-Encoding', 'gzip')
+        def response():
+            for i in xrange(0, len(body), 10):
+                request.write(body[i:i + 10])
+            request.finish()
+        reactor.callLater(0, response)
+        return server.NOT_DONE_YET
+
+
 class Http11TestCase(HttpTestCase):
     """HTTP 1.1 test case"""
     download_handler_cls = HTTP11DownloadHandler
     if 'http11' not in optional_features:
         skip = 'HTTP1.1 not supported in twisted < 11.1.0'
 
+    @defer.inlineCallbacks
+    def test_download_with_maxsize(self):
+        request = Request(self.getURL('file'), meta={'download_maxsize': 10})
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEquals(response.body, "0123456789")
+
+        # the declared Content-Length is too large
+        request = Request(self.getURL('file'), meta={'download_maxsize': 9})
+        d = self.download_request(request, Spider('foo'))
+        yield self.assertFailure(d, defer.CancelledError)
+
+    @defer.inlineCallbacks
+    def test_download_with_maxsize_chunked(self):
+        request = Request(self.getURL('largechunkedfile'),
+                          meta={'download_maxsize': 1000})
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEquals(len(response.body), 1000)
+
+        # no Content-Length, the download is aborted while streaming
+        request = Request(self.getURL('largechunkedfile'),
+                          meta={'download_maxsize': 500})
+        d = self.download_request(request, Spider('foo'))
+        yield self.assertFailure(d, defer.CancelledError)
+
+    @defer.inlineCallbacks
+    def test_download_with_maxsize_setting(self):
+        yield self.download_handler.close()
+        crawler = get_crawler({'DOWNLOAD_MAXSIZE': 500})
+        self.download_handler = self.download_handler_cls.from_crawler(crawler)
+        spider = Spider('foo')
+        download = self.download_handler.download_request
+
+        response = yield download(Request(self.getURL('file')), spider)
+        self.assertEquals(response.body, "0123456789")
+        d = download(Request(self.getURL('largechunkedfile')), spider)
+        yield self.assertFailure(d, defer.CancelledError)
+        request = Request(self.getURL('largechunkedfile'), meta={'download_maxsize': 0})
+        response = yield download(request, spider)
+        self.assertEquals(len(response.body), 1000)
+        request = Request(self.getURL('file'), meta={'download_maxsize': 5})
+        d = download(request, spider)
+        yield self.assertFailure(d, defer.CancelledError)
+
+        stats = crawler.stats
+        self.assertEqual(stats.get_value('downloader/response_maxsize/aborted'), 1)
+        self.assertEqual(stats.get_value('downloader/response_maxsize/cancelled'), 1)
+
+    @defer.inlineCallbacks
+    def test_download_with_bandwidth_limit(self):
+        yield self.download_handler.close()
+        crawler = get_crawler({'BANDWIDTH_LIMIT_PER_SLOT': 1000})
+        self.download_handler = self.download_handler_cls.from_crawler(crawler)
+        spider = Spider('foo')
+        start = time.time()
+        for _ in range(2):
+            request = Request(self.getURL('largechunkedfile'),
+                              meta={'download_slot': 'foo'})
+            response = yield self.download_handler.download_request(request, spider)
+            self.assertEquals(len(response.body), 1000)
+        # the second response waits until the first one is paid for
+        self.assertTrue(time.time() - start >= 0.9)
+        self.assertTrue(crawler.stats.get_value('bandwidth/throttled') > 0)
+
+    @defer.inlineCallbacks
+    def test_download_with_mmapsize(self):
+        request = Request(self.getURL('largechunkedfile'))
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEquals(type(response.body), str)
+
+        request = Request(self.getURL('largechunkedfile'),
+                          meta={'download_mmapsize': 500})
+        response = yield self.download_request(request, Spider('foo'))
+        self.assert_(isinstance(response.body, MappedBody))
+        self.assertEquals(response.body, "0123456789" * 100)
+
+        # the declared Content-Length is larger than the threshold
+        request = Request(self.getURL('file'), meta={'download_mmapsize': 5})
+        response = yield self.download_request(request, Spider('foo'))
+        self.assert_(isinstance(response.body, MappedBody))
+        self.assertEquals(response.body, "0123456789")
+
+    @defer.inlineCallbacks
+    def test_download_with_warnsize(self):
+        request = Request(self.getURL('largechunkedfile'),
+                          meta={'download_warnsize': 500})
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEquals(len(response.body), 1000)
+
+    @defer.inlineCallbacks
+    def test_download_decompress(self):
+        request = Request(self.getURL('gzip'))
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertEquals(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotEquals(response.body, "0123456789" * 100)
+
+        # requests from the HttpCompressionMiddleware
+        request = Request(self.getURL('gzip'), meta={'_decompress': True})
+        response = yield self.download_request(request, Spider('foo'))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEquals(response.body, "0123456789" * 100)
+
+        # the limit applies to the decompressed size
+        request = Request(self.getURL('gzip'),
+                          meta={'_decompress': True, 'download_maxsize': 500})
+        d = self.download_request(request, Spider('foo'))
+        yield self.assertFailure(d, defer.CancelledError)
+
+    @defer.inlineCallbacks
+    def test_preconnect(self):
+        yield self.download_handler.close()
+        crawler = get_crawler()
+        self.download_handler = self.download_handler_cls.from_crawler(crawler)
+        request = Request(self.getURL('file'))
+        preconnected = yield self.download_handler.preconnect(request)
+        self.assertTrue(preconnected)
+        # there's an idle connection already
+        preconnected = yield self.download_handler.preconnect(request)
+        self.assertFalse(preconnected)
+        response = yield self.download_handler.download_request(request, Spider('foo'))
+        self.assertEquals(response.body, "0123456789")
+
+        stats = crawler.stats
+        self.assertEqual(stats.get_value('downloader/pool/preconnected'), 1)
+        self.assertEqual(stats.get_value('downloader/pool/opened'), 1)
+        self.assertEqual(stats.get_value('downloader/pool/reused'), 1)
+
+
+class FakeTransport(object):
+
+    disconnected = False
+
+    def loseConnection(self):
+        self.disconnected = True
+
+
+class FakeConnection(object):
+
+    state = 'QUIESCENT'
+
+    def __init__(self):
+        self.transport = FakeTransport()
+
+    def abort(self):
+        self.transport.loseConnection()
+        return defer.succeed(None)
+
+
+class FakeEndpoint(object):
+
+    def connect(self, factory):
+        return defer.succeed(FakeConnection())
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.stats = get_crawler().stats
+        self.pool = ScrapyHTTPConnectionPool(self.clock, stats=self.stats)
+        self.pool.retryAutomatically = False
+        self.endpoint = FakeEndpoint()
+
+    def get(self, key):
+        connections = []
+        self.pool.getConnection(key, self.endpoint).addCallback(connections.append)
+        return connections[0]
+
+    def stat(self, key):
+        return self.stats.get_value('downloader/pool/%s' % key)
+
+    def test_reuse(self):
+        conn = self.get('a')
+        self.pool._putConnection('a', conn)
+        self.assertEqual(self.stat('idle'), 1)
+        self.assertIs(self.get('a'), conn)
+        self.assertIsNot(self.get('a'), conn)
+        self.assertEqual(self.stat('opened'), 2)
+        self.assertEqual(self.stat('reused'), 1)
+        self.assertEqual(self.stat('idle'), 0)
+
+    def test_broken(self):
+        conn = self.get('a')
+        self.pool._putConnection('a', conn)
+        conn.state = 'CONNECTION_LOST'
+        self.assertIsNot(self.get('a'), conn)
+        self.assertEqual(self.stat('broken'), 1)
+        self.assertEqual(self.stat('opened'), 2)
+        self.assertEqual(self.stat('reused'), None)
+
+    def test_idle_timeout(self):
+        self.pool.cachedConnectionTimeout = 10
+        conn = self.get('a')
+        self.pool._putConnection('a', conn)
+        self.clock.advance(9)
+        self.assertFalse(conn.transport.disconnected)
+        self.clock.advance(2)
+        self.assertTrue(conn.transport.disconnected)
+        self.assertEqual(self.stat('evicted/idle_timeout'), 1)
+        self.assertEqual(self.stat('idle'), 0)
+        self.assertEqual(self.pool.idleConnections(), {})
+
+    def test_max_idle(self):
+        self.pool.maxIdle = 2
+        conns = dict((key, self.get(key)) for key in 'abcd')
+        for key in 'abc':
+            self.pool._putConnection(key, conns[key])
+        self.assertTrue(conns['a'].transport.disconnected)
+        self.assertEqual(self.pool.idleConnections(), {'b': 1, 'c': 1})
+
+        # b is used again, so c is now the least recently used
+        self.pool._putConnection('b', self.get('b'))
+        self.pool._putConnection('d', conns['d'])
+        self.assertTrue(conns['c'].transport.disconnected)
+        self.assertFalse(conns['b'].transport.disconnected)
+        self.assertEqual(self.pool.idleConnections(), {'b': 1, 'd': 1})
+        self.assertEqual(self.stat('evicted/max_idle'), 2)
+        self.assertEqual(self.stat('idle'), 2)
+        self.assertEqual(self.stat('idle_hosts'), 2)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 2)
+
+    def test_max_per_host(self):
+        self.pool.maxPersistentPerHost = 1
+        conn1, conn2 = self.get('a'), self.get('a')
+        self.pool._putConnection('a', conn1)
+        self.pool._putConnection('a', conn2)
+        self.assertTrue(conn1.transport.disconnected)
+        self.assertEqual(self.stat('evicted/max_per_host'), 1)
+        self.assertIs(self.get('a'), conn2)
+
+    def test_close(self):
+        conn = self.get('a')
+        self.pool._putConnection('a', conn)
+        self.pool.closeCachedConnections()
+        self.assertTrue(conn.transport.disconnected)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertIsNot(self.get('a'), conn)
+
 
 class UriResource(resource.Resource):
     """Return the full uri that was requested"""
@@ -219,12 +492,21 @@ class UriResource(resource.Resource):
         return request.uri
 
 
+class ConnectionCountingFactory(WrappingFactory):
+
+    connections = 0
+
+    def buildProtocol(self, addr):
+        self.connections += 1
+        return WrappingFactory.buildProtocol(self, addr)
+
+
 class HttpProxyTestCase(unittest.TestCase):
     download_handler_cls = HTTPDownloadHandler
 
     def setUp(self):
         site = server.Site(UriResource(), timeout=None)
-        wrapper = WrappingFactory(site)
+        self.wrapper = wrapper = ConnectionCountingFactory(site)
         self.port = reactor.listenTCP(0, wrapper, interface='127.0.0.1')
         self.portno = self.port.getHost().port
         self.download_handler = self.download_handler_cls(Settings())
@@ -283,6 +565,48 @@ class Http11ProxyTestCase(HttpProxyTestCase):
     if 'http11' not in optional_features:
         skip = 'HTTP1.1 not supported in twisted < 11.1.0'
 
+    @defer.inlineCallbacks
+    def test_download_with_proxy_reuses_connection(self):
+        http_proxy = self.getURL('')
+        for url in ['http://example.com', 'http://example.com/other',
+                    'http://scrapy.org']:
+            request = Request(url, meta={'proxy': http_proxy})
+            response = yield self.download_request(request, Spider('foo'))
+            self.assertEquals(response.body, url)
+        self.assertEquals(self.wrapper.connections, 1)
+
+    def test_agents_are_reused(self):
+        agent = self.download_handler._agent
+        get_agent = lambda url, **meta: agent._get_agent(Request(url, meta=meta), 10)
+        proxy1, proxy2 = 'http://proxy1:8080', 'http://proxy2:8080'
+
+        self.assertIs(get_agent('http://example.com'), get_agent('https://scrapy.org'))
+        self.assertIsNot(get_agent('http://example.com'),
+                         get_agent('http://example.com', bindaddress=('127.0.0.2', 0)))
+        self.assertIs(get_agent('http://example.com', proxy=proxy1),
+                      get_agent('http://scrapy.org', proxy=proxy1))
+        self.assertIsNot(get_agent('http://example.com', proxy=proxy1),
+                         get_agent('http://example.com', proxy=proxy2))
+        self.assertIs(get_agent('https://example.com', proxy=proxy1),
+                      get_agent('https://scrapy.org', proxy=proxy1))
+        self.assertIsNot(get_agent('https://example.com', proxy=proxy1),
+                         get_agent('http://example.com', proxy=proxy1))
+        self.assertIsNot(get_agent('http://example.com'),
+                         agent._get_agent(Request('http://example.com'), 20))
+
+    def test_tunnels_are_pooled_by_proxy(self):
+        agent = self.download_handler._agent
+        keys = []
+        pool = agent._pool
+        self.patch(pool, 'getConnection',
+                   lambda key, endpoint: keys.append(key) or defer.Deferred())
+        for proxy in ['http://proxy1:8080', 'http://proxy2:8080']:
+            request = Request('https://example.com', meta={'proxy': proxy})
+            agent._get_agent(request, 10).request('GET', request.url)
+        agent._get_agent(Request('https://example.com'), 10).request(
+            'GET', 'https://example.com')
+        self.assertEqual(len(set(keys)), 3)
+
 
 class HttpDownloadHandlerMock(object):
     def __init__(self, settings):
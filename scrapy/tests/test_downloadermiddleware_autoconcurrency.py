@@ -0,0 +1,120 @@
+from unittest import TestCase
+
+import mock
+from twisted.internet.error import TimeoutError
+
+from scrapy.contrib.downloadermiddleware.autoconcurrency import AutoConcurrencyMiddleware
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, Response
+from scrapy.spider import Spider
+from scrapy.utils.test import get_crawler
+
+
+class FakeDownloader(object):
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.slots = {}
+
+    def _get_slot(self, request, spider):
+        key = request.meta['download_slot']
+        if key not in self.slots:
+            self.slots[key] = Slot(8, 0, self.settings)
+        return key, self.slots[key]
+
+
+class AutoConcurrencyMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patch = mock.patch('scrapy.contrib.downloadermiddleware.autoconcurrency.time',
+                           lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.spider = Spider('foo')
+
+    def get_mw(self, **settings):
+        settings.setdefault('AUTOCONCURRENCY_ENABLED', True)
+        crawler = get_crawler(settings)
+        crawler.engine = mock.Mock()
+        crawler.engine.downloader = self.downloader = FakeDownloader(crawler.settings)
+        return AutoConcurrencyMiddleware.from_crawler(crawler)
+
+    def request(self, mw, latency=0.1):
+        req = Request('http://example.com', meta={'download_slot': 'example.com',
+                                                  'download_latency': latency})
+        mw.process_request(req, self.spider)
+        return req
+
+    def round(self, mw, latency=0.1, status=200, seconds=1):
+        """Download as many requests as the slot concurrency at once"""
+        slot = self.downloader.slots['example.com']
+        self.now += seconds
+        reqs = [self.request(mw, latency) for _ in range(slot.concurrency)]
+        slot.transferring.update(reqs)
+        for req in reqs:
+            slot.transferring.remove(req)
+            mw.process_response(req, Response(req.url, status=status), self.spider)
+        return slot.concurrency
+
+    def test_disabled(self):
+        self.assertRaises(NotConfigured, self.get_mw, AUTOCONCURRENCY_ENABLED=False)
+
+    def test_start_and_bounds(self):
+        mw = self.get_mw(AUTOCONCURRENCY_START=2)
+        self.request(mw)
+        self.assertEqual(self.downloader.slots['example.com'].concurrency, 2)
+        # the concurrency grows while the throughput does, up to the slot one
+        self.assertEqual([self.round(mw) for _ in range(8)], [3, 4, 5, 6, 7, 8, 8, 8])
+
+        mw = self.get_mw(AUTOCONCURRENCY_START=20, AUTOCONCURRENCY_MAX=3)
+        self.request(mw)
+        self.assertEqual(self.downloader.slots['example.com'].concurrency, 3)
+
+    def test_hold_without_more_throughput(self):
+        mw = self.get_mw()
+        self.request(mw)
+        self.assertEqual(self.round(mw), 2)
+        # same number of responses per second
+        self.assertEqual(self.round(mw, seconds=2), 2)
+        self.assertEqual(self.round(mw, seconds=0.5), 3)
+
+    def test_high_latency(self):
+        mw = self.get_mw(AUTOCONCURRENCY_START=4, AUTOCONCURRENCY_TARGET_LATENCY=0.5)
+        self.request(mw)
+        self.assertEqual(self.round(mw, latency=0.6), 3)
+        self.assertEqual(self.round(mw, latency=0.4), 3)
+        self.assertEqual(self.round(mw, latency=0.4, seconds=0.5), 4)
+
+    def test_backoff(self):
+        mw = self.get_mw(AUTOCONCURRENCY_START=8)
+        self.request(mw)
+        # only the first error of a round backs off
+        self.assertEqual(self.round(mw, status=503), 4)
+        self.assertEqual(self.round(mw, status=429), 2)
+        self.assertEqual(self.round(mw, status=503), 1)
+        self.assertEqual(self.round(mw, status=503), 1)
+        # and it grows again
+        self.assertEqual(self.round(mw), 2)
+        self.assertEqual(self.round(mw, seconds=0.5), 3)
+
+    def test_backoff_on_timeout(self):
+        mw = self.get_mw(AUTOCONCURRENCY_START=8, AUTOCONCURRENCY_BACKOFF=0.75)
+        req, req2 = self.request(mw), self.request(mw)
+        # the second request was sent before backing off
+        self.downloader.slots['example.com'].transferring.add(req2)
+        mw.process_exception(req, TimeoutError(), self.spider)
+        self.downloader.slots['example.com'].transferring.remove(req2)
+        mw.process_exception(req2, TimeoutError(), self.spider)
+        self.assertEqual(self.downloader.slots['example.com'].concurrency, 6)
+        # other errors don't change it
+        mw.process_exception(req, ValueError(), self.spider)
+        self.assertEqual(self.downloader.slots['example.com'].concurrency, 6)
+
+    def test_cached_responses_ignored(self):
+        mw = self.get_mw()
+        req = Request('http://example.com')
+        res = Response(req.url, status=503)
+        self.assertIs(mw.process_response(req, res, self.spider), res)
+        self.assertEqual(self.downloader.slots, {})
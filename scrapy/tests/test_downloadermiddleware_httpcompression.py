@@ -6,6 +6,7 @@ from gzip import GzipFile
 from scrapy.spider import Spider
 from scrapy.http import Response, Request, HtmlResponse
 from scrapy.contrib.downloadermiddleware.httpcompression import HttpCompressionMiddleware
+from scrapy.exceptions import IgnoreRequest
 from scrapy.tests import tests_datadir
 from w3lib.encoding import resolve_encoding
 
@@ -51,6 +52,7 @@ class HttpCompressionTest(TestCase):
         assert 'Accept-Encoding' not in request.headers
         self.mw.process_request(request, self.spider)
         self.assertEqual(request.headers.get('Accept-Encoding'), 'gzip,deflate')
+        self.assertTrue(request.meta['_decompress'])
 
     def test_process_response_gzip(self):
         response = self._getresponse('gzip')
@@ -62,6 +64,18 @@ class HttpCompressionTest(TestCase):
         assert newresponse.body.startswith('<!DOCTYPE')
         assert 'Content-Encoding' not in newresponse.headers
 
+    def test_process_response_maxsize(self):
+        response = self._getresponse('gzip')
+        request = response.request
+        mw = HttpCompressionMiddleware(maxsize=100)
+        self.assertRaises(IgnoreRequest, mw.process_response, request,
+                          response, self.spider)
+        response = self._getresponse('gzip')
+        request = response.request
+        request.meta['download_maxsize'] = 0
+        newresponse = mw.process_response(request, response, self.spider)
+        assert newresponse.body.startswith('<!DOCTYPE')
+
     def test_process_response_rawdeflate(self):
         response = self._getresponse('rawdeflate')
         request = response.request
@@ -1,13 +1,30 @@
+import os
+import shutil
+import tempfile
+import hashlib
 import unittest
 
 from scrapy.http import Request
-from scrapy.dupefilter import RFPDupeFilter
+from scrapy.dupefilter import RFPDupeFilter, BinaryRFPDupeFilter, FingerprintTable, \
+    BloomRFPDupeFilter, BloomFilter, ScalableBloomFilter, ExpiringRFPDupeFilter, \
+    SeenStore
+from scrapy.spider import Spider
+from scrapy.statscol import StatsCollector
+from scrapy.utils.test import get_crawler
 
 
 class RFPDupeFilterTest(unittest.TestCase):
 
+    dupefilter_class = RFPDupeFilter
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
     def test_filter(self):
-        filter = RFPDupeFilter()
+        filter = self.dupefilter_class()
         filter.open()
 
         r1 = Request('http://scrapytest.org/1')
@@ -21,3 +38,291 @@ class RFPDupeFilterTest(unittest.TestCase):
         assert filter.request_seen(r3)
 
         filter.close('finished')
+
+    def test_resume(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+
+        filter = self.dupefilter_class(self.tmpdir)
+        filter.open()
+        assert not filter.request_seen(r1)
+        filter.close('shutdown')
+
+        filter = self.dupefilter_class(self.tmpdir)
+        filter.open()
+        assert filter.request_seen(r1)
+        assert not filter.request_seen(r2)
+        filter.close('finished')
+
+
+class BinaryRFPDupeFilterTest(RFPDupeFilterTest):
+
+    dupefilter_class = BinaryRFPDupeFilter
+
+    def test_resume_from_text_file(self):
+        r1 = Request('http://scrapytest.org/1')
+        filter = RFPDupeFilter(self.tmpdir)
+        assert not filter.request_seen(r1)
+        filter.close('shutdown')
+
+        filter = self.dupefilter_class(self.tmpdir)
+        assert filter.request_seen(r1)
+        filter.close('finished')
+
+
+class BloomRFPDupeFilterTest(RFPDupeFilterTest):
+
+    dupefilter_class = BloomRFPDupeFilter
+
+    def test_stats(self):
+        crawler = get_crawler({'DUPEFILTER_BLOOM_CAPACITY': 10})
+        stats = crawler.stats = StatsCollector(crawler)
+        filter = self.dupefilter_class.from_crawler(crawler)
+        for i in range(50):
+            filter.request_seen(Request('http://scrapytest.org/%d' % i))
+        filter.close('finished')
+        self.assertEqual(stats.get_value('dupefilter/bloom/stages'), 3)
+        self.assertTrue(0 < stats.get_value('dupefilter/bloom/fill_ratio') < 1)
+        self.assertTrue(0 < stats.get_value('dupefilter/bloom/false_positive_rate') < 0.001)
+
+
+class ExpiringRFPDupeFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_filter(self):
+        crawler = get_crawler({'DUPEFILTER_SEEN_DIR': self.tmpdir})
+        crawler.engine = type('FakeEngine', (object,), {})()
+        crawler.engine.spider = Spider('foo')
+        filter = ExpiringRFPDupeFilter.from_crawler(crawler)
+        filter.open()
+        return filter
+
+    def test_filter_across_runs(self):
+        r1 = Request('http://scrapytest.org/1')
+        r2 = Request('http://scrapytest.org/2')
+
+        filter = self.get_filter()
+        assert not filter.request_seen(r1)
+        assert filter.request_seen(r1)
+        filter.close('finished')
+
+        filter = self.get_filter()
+        assert filter.request_seen(r1)
+        assert not filter.request_seen(r2)
+        filter.close('finished')
+        self.assertEqual(os.listdir(self.tmpdir), ['foo'])
+
+    def test_without_crawler(self):
+        self.assertRaises(TypeError, ExpiringRFPDupeFilter.from_settings,
+                          get_crawler().settings)
+        path = os.path.join(self.tmpdir, 'store')
+        filter = ExpiringRFPDupeFilter(path, 3600)
+        filter.open()
+        r1 = Request('http://scrapytest.org/1')
+        assert not filter.request_seen(r1)
+        assert filter.request_seen(r1)
+        filter.close('finished')
+        assert os.path.isdir(path)
+
+
+class FingerprintTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'table.bin')
+        self.keys = [hashlib.sha1(str(i)).digest() for i in range(5000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_add_and_grow(self):
+        t = FingerprintTable(capacity=8)
+        for k in self.keys:
+            self.assertTrue(t.add(k))
+        for k in self.keys:
+            self.assertFalse(t.add(k))
+            self.assertIn(k, t)
+        self.assertEqual(len(t), len(self.keys))
+        self.assertNotIn(hashlib.sha1('missing').digest(), t)
+
+    def test_zero_key(self):
+        t = FingerprintTable()
+        zero = '\0' * 20
+        self.assertNotIn(zero, t)
+        self.assertTrue(t.add(zero))
+        self.assertFalse(t.add(zero))
+        self.assertIn(zero, t)
+        self.assertEqual(len(t), 1)
+
+    def test_persistence(self):
+        t = FingerprintTable(self.path, capacity=8)
+        for k in self.keys:
+            t.add(k)
+        t.add('\0' * 20)
+        t.close()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+        t = FingerprintTable(self.path)
+        self.assertEqual(len(t), len(self.keys) + 1)
+        for k in self.keys:
+            self.assertIn(k, t)
+        self.assertIn('\0' * 20, t)
+        t.close()
+
+    def test_values(self):
+        t = FingerprintTable(self.path, capacity=8, valuesize=4)
+        zero = '\0' * 20
+        for k in self.keys + [zero]:
+            t.add(k, k[-4:])
+        t[self.keys[0]] = 'abcd'
+        self.assertRaises(ValueError, t.add, 'x' * 20, 'toolong')
+        t.close()
+
+        t = FingerprintTable(self.path)
+        self.assertEqual(t.get(self.keys[0]), 'abcd')
+        for k in self.keys[1:] + [zero]:
+            self.assertEqual(t.get(k), k[-4:])
+        self.assertEqual(t.get('missing' * 3), None)
+        self.assertEqual(len(list(t.items())), len(self.keys) + 1)
+        self.assertEqual(dict(t.items())[zero], zero[-4:])
+        t.close()
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write('x' * 100)
+        self.assertRaises(ValueError, FingerprintTable, self.path)
+
+    def test_unsupported_version(self):
+        t = FingerprintTable(self.path)
+        t.close()
+        with open(self.path, 'r+b') as f:
+            f.seek(4)
+            f.write(chr(FingerprintTable.version + 1))
+        self.assertRaises(ValueError, FingerprintTable, self.path)
+
+    def test_upgrade_v1(self):
+        # a version 1 table: smaller header, no zero key slot after the slots
+        capacity, keys = 16, self.keys[:10]
+        t = FingerprintTable(capacity=capacity)
+        for k in keys + ['\0' * 20]:
+            t.add(k)
+        slots = str(t._buf[t._offset:t._zeropos])
+        with open(self.path, 'wb') as f:
+            f.write(FingerprintTable.header_v1.pack('SFPT', 1, 1, 20, capacity, 11))
+            f.write(slots)
+
+        t = FingerprintTable(self.path)
+        self.assertEqual(t.version, 2)
+        self.assertEqual(t.valuesize, 0)
+        self.assertEqual(len(t), 11)
+        for k in keys + ['\0' * 20]:
+            self.assertIn(k, t)
+        self.assertEqual(t.get('\0' * 20), '')
+        self.assertNotIn(self.keys[10], t)
+        # past the load factor, so the table grows
+        for k in self.keys[10:20]:
+            self.assertTrue(t.add(k))
+        self.assertEqual(t._capacity, capacity * 2)
+        t.close()
+
+        t = FingerprintTable(self.path)
+        self.assertEqual(len(t), 21)
+        for k in self.keys[:20] + ['\0' * 20]:
+            self.assertIn(k, t)
+        t.close()
+
+
+class ScalableBloomFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'bloom')
+        self.keys = [hashlib.sha1(str(i)).digest() for i in range(5000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_add_and_grow(self):
+        bf = ScalableBloomFilter(100, 0.00001)
+        for k in self.keys:
+            self.assertTrue(bf.add(k))
+        for k in self.keys:
+            self.assertIn(k, bf)
+            self.assertFalse(bf.add(k))
+        self.assertEqual(len(bf), len(self.keys))
+        self.assertEqual(len(bf.stages), 6)
+        self.assertTrue(bf.false_positive_rate < 0.00001)
+
+    def test_false_positive_rate(self):
+        bf = BloomFilter(len(self.keys), 0.01)
+        for k in self.keys:
+            bf.add(k)
+        others = [hashlib.sha1('x%d' % i).digest() for i in range(10000)]
+        fp = sum(1 for k in others if k in bf)
+        self.assertTrue(fp < 200, fp)
+        self.assertTrue(abs(bf.false_positive_rate - 0.01) < 0.005)
+
+    def test_persistence(self):
+        bf = ScalableBloomFilter(1000, 0.00001, self.path)
+        for k in self.keys:
+            bf.add(k)
+        bf.close()
+
+        bf = ScalableBloomFilter(1000, 0.00001, self.path)
+        self.assertEqual(len(bf.stages), 3)
+        self.assertEqual(len(bf), len(self.keys))
+        for k in self.keys:
+            self.assertIn(k, bf)
+        bf.close()
+
+
+class SeenStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.keys = [hashlib.sha1(str(i)).digest() for i in range(10)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_expiration(self):
+        store = SeenStore(self.tmpdir, 100)
+        self.assertTrue(store.add(self.keys[0], now=1000))
+        self.assertFalse(store.add(self.keys[0], now=1050))
+        self.assertTrue(store.seen(self.keys[0], now=1099))
+        self.assertFalse(store.seen(self.keys[0], now=1100))
+        self.assertTrue(store.add(self.keys[0], now=1100))
+        self.assertFalse(store.add(self.keys[0], now=1150))
+        self.assertTrue(store.add(self.keys[0], now=1200))
+        store.close()
+
+    def test_compaction(self):
+        store = SeenStore(self.tmpdir, 100)
+        for i, k in enumerate(self.keys):
+            store.add(k, now=1000 + i * 25)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 10)
+        store.compact(now=1260)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 4)
+        self.assertEqual(len(store), 4)
+        for k in self.keys[:7]:
+            self.assertFalse(store.seen(k, now=1260))
+        for k in self.keys[7:]:
+            self.assertTrue(store.seen(k, now=1260))
+        store.close()
+
+    def test_persistence(self):
+        store = SeenStore(self.tmpdir, 100)
+        store.add(self.keys[0], now=1000)
+        store.add(self.keys[1])
+        store.close()
+
+        store = SeenStore(self.tmpdir, 100)
+        self.assertEqual(len(store), 1)  # expired segments removed on open
+        self.assertFalse(store.seen(self.keys[0]))
+        self.assertTrue(store.seen(self.keys[1]))
+        store.close()
@@ -0,0 +1,60 @@
+import re
+import pickle
+import tempfile
+import unittest
+
+from scrapy.http.mappedbody import MappedBody
+
+
+def mapped(data):
+    f = tempfile.TemporaryFile()
+    f.write(data)
+    body = MappedBody(f)
+    f.close()
+    return body
+
+
+class MappedBodyTest(unittest.TestCase):
+
+    def test_str_methods(self):
+        body = mapped('<html><body>Some text</body></html>')
+        self.assertEqual(len(body), 35)
+        self.assertEqual(body[:6], '<html>')
+        self.assertEqual(str(body), '<html><body>Some text</body></html>')
+        self.assertEqual(body.find('Some'), 12)
+        self.assert_('text' in body)
+        self.assert_('other' not in body)
+        self.assert_(body.startswith('<html>'))
+        self.assert_(body.startswith(('<?xml', '<html>')))
+        self.assert_(body.startswith('<body>', 6))
+        self.assertFalse(body.startswith('<body>'))
+        self.assert_(body.endswith('</html>'))
+        self.assertFalse(body.endswith('</body>'))
+        self.assertEqual(body.decode('utf-8'), u'<html><body>Some text</body></html>')
+
+    def test_equality(self):
+        body = mapped('some body')
+        self.assertEqual(body, 'some body')
+        self.assertEqual(body, mapped('some body'))
+        self.assertNotEqual(body, 'other body')
+        self.assertNotEqual(body, 'some body ')
+        self.assertRaises(TypeError, hash, body)
+
+    def test_regex(self):
+        body = mapped('price: 100, price: 200')
+        self.assertEqual(re.findall(r'price: (\d+)', body), ['100', '200'])
+
+    def test_pickle(self):
+        body = pickle.loads(pickle.dumps(mapped('some body')))
+        self.assertEqual(type(body), str)
+        self.assertEqual(body, 'some body')
+
+    def test_write(self):
+        f = tempfile.TemporaryFile()
+        f.write(mapped('some body'))
+        f.seek(0)
+        self.assertEqual(f.read(), 'some body')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 
 from w3lib.encoding import resolve_encoding
 from scrapy.http import Request, Response, TextResponse, HtmlResponse, XmlResponse, Headers
+from scrapy.tests.test_http_mappedbody import mapped
 
 
 class BaseResponseTest(unittest.TestCase):
@@ -290,6 +291,19 @@ class HtmlResponseTest(TextResponseTest):
         r4 = r3.replace(body=body)
         self._assert_response_values(r4, 'iso-8859-1', body)
 
+    def test_mapped_body(self):
+        body = mapped('<html><head><meta charset="gb2312" /></head></html>')
+        r1 = self.response_class("http://www.example.com", body=body)
+        self.assert_(r1.body is body)
+        self.assertEqual(r1.encoding, 'gb18030')
+        self.assert_(r1.replace(url="http://www.example.com/other").body is body)
+
+        # the encoding of mapped bodies is inferred from their beginning
+        body = mapped('<html>' + 'a' * 100000 + '\xc2\xa3100</html>')
+        r2 = self.response_class("http://www.example.com", body=body)
+        self.assertEqual(r2.encoding, 'utf-8')
+        self.assert_(r2.body_as_unicode().endswith(u'\xa3100</html>'))
+
     def test_html5_meta_charset(self):
         body = """<html><head><meta charset="gb2312" /><title>Some page</title><body>bla bla</body>"""
         r1 = self.response_class("http://www.example.com", body=body)
@@ -0,0 +1,185 @@
+import socket
+import time
+
+import mock
+from twisted.trial import unittest
+from twisted.internet import defer, reactor, protocol, task
+from twisted.internet.error import DNSLookupError
+from twisted.names import dns, error, server
+from twisted.names.common import ResolverBase
+
+from scrapy.resolver import CachingAsyncResolver, CachingThreadedResolver, \
+    dnscache
+from scrapy.settings import Settings
+from scrapy.statscol import StatsCollector
+from scrapy.utils.test import get_crawler
+
+
+class StubAuthority(ResolverBase):
+    """Answers A queries from a dict, counting the queries it gets"""
+
+    def __init__(self, records):
+        ResolverBase.__init__(self)
+        self.records = records
+        self.queries = []
+
+    def _lookup(self, name, cls, type, timeout):
+        self.queries.append(name)
+        if name not in self.records:
+            return defer.fail(error.DomainError(name))
+        address, ttl = self.records[name]
+        rr = dns.RRHeader(name, dns.A, dns.IN, ttl,
+                          dns.Record_A(address, ttl), auth=True)
+        return defer.succeed(([rr], [], []))
+
+
+class SilentServer(protocol.DatagramProtocol):
+    """Nameserver which never answers, counting the queries it gets"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def datagramReceived(self, data, address):
+        self.queries += 1
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CachingAsyncResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.authority = StubAuthority({
+            'example.com': ('10.0.0.1', 300),
+            'short.example.com': ('10.0.0.2', 5),
+        })
+        factory = server.DNSServerFactory(authorities=[self.authority])
+        protocol = dns.DNSDatagramProtocol(factory)
+        self.port = reactor.listenUDP(0, protocol, interface='127.0.0.1')
+        servers = [('127.0.0.1', self.port.getHost().port)]
+        self.resolver = CachingAsyncResolver(reactor, 100, 10, servers)
+        self.resolver._time = self.time = FakeTime()
+        self.stats = StatsCollector(get_crawler())
+        self.resolver.stats.add(self.stats)
+
+    def tearDown(self):
+        return self.port.stopListening()
+
+    @defer.inlineCallbacks
+    def test_resolve_and_cache(self):
+        address = yield self.resolver.getHostByName('example.com')
+        self.assertEqual(address, '10.0.0.1')
+        self.assertEqual(dnscache['example.com'], '10.0.0.1')
+        address = yield self.resolver.getHostByName('example.com')
+        self.assertEqual(address, '10.0.0.1')
+        self.assertEqual(self.authority.queries, ['example.com'])
+        self.assertEqual(self.stats.get_value('dnscache/miss'), 1)
+        self.assertEqual(self.stats.get_value('dnscache/hit'), 1)
+        self.assertEqual(self.stats.get_value('dns/lookup_count'), 1)
+        self.assertTrue(self.stats.get_value('dns/latency_max') >= 0)
+
+    @defer.inlineCallbacks
+    def test_ttl(self):
+        yield self.resolver.getHostByName('short.example.com')
+        self.time.now += 4
+        yield self.resolver.getHostByName('short.example.com')
+        self.assertEqual(len(self.authority.queries), 1)
+        self.time.now += 2
+        yield self.resolver.getHostByName('short.example.com')
+        self.assertEqual(len(self.authority.queries), 2)
+
+    @defer.inlineCallbacks
+    def test_negative_cache(self):
+        for _ in range(2):
+            d = self.resolver.getHostByName('missing.example.com')
+            yield self.assertFailure(d, DNSLookupError)
+        self.assertEqual(self.authority.queries, ['missing.example.com'])
+        self.assertEqual(self.stats.get_value('dnscache/negative_hit'), 1)
+        self.assertEqual(self.stats.get_value('dns/lookup_error'), 1)
+        self.time.now += self.resolver.negative_ttl + 1
+        d = self.resolver.getHostByName('missing.example.com')
+        yield self.assertFailure(d, DNSLookupError)
+        self.assertEqual(len(self.authority.queries), 2)
+
+    @defer.inlineCallbacks
+    def test_cache_disabled(self):
+        self.resolver.cache_size = 0
+        for _ in range(2):
+            yield self.resolver.getHostByName('example.com')
+        self.assertEqual(len(self.authority.queries), 2)
+
+    @defer.inlineCallbacks
+    def test_timeout_not_cached(self):
+        silent = SilentServer()
+        port = reactor.listenUDP(0, silent, interface='127.0.0.1')
+        self.addCleanup(port.stopListening)
+        resolver = CachingAsyncResolver(reactor, 100, 0.6,
+                                        [('127.0.0.1', port.getHost().port)])
+        resolver.stats.add(self.stats)
+        for _ in range(2):
+            d = resolver.getHostByName('slow.example.com')
+            yield self.assertFailure(d, DNSLookupError)
+        self.assertEqual(self.stats.get_value('dnscache/miss'), 2)
+        self.assertEqual(self.stats.get_value('dnscache/negative_hit'), None)
+        # the second lookup queried the nameserver again
+        self.assertEqual(silent.queries, 8)
+
+    def test_from_settings(self):
+        settings = Settings({'DNSCACHE_SIZE': 5, 'DNS_TIMEOUT': 3,
+                             'DNS_SERVERS': ['127.0.0.1:5353', '10.0.0.1']})
+        resolver = CachingAsyncResolver.from_settings(settings, reactor)
+        self.assertEqual(resolver.cache_size, 5)
+        self.assertEqual(resolver.timeout, 3)
+        dnsresolver = resolver._resolver.resolvers[-1]
+        self.assertEqual(dnsresolver.servers,
+                         [('127.0.0.1', 5353), ('10.0.0.1', 53)])
+
+
+class CachingThreadedResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def gethostbyname(self, name):
+        self.calls.append(name)
+        if name == 'localhost':
+            return '127.0.0.1'
+        if name == 'slow.example.com':
+            time.sleep(0.3)
+            return '10.0.0.1'
+        if name == 'missing.example.com':
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        raise socket.gaierror(socket.EAI_AGAIN, 'Temporary failure in name resolution')
+
+    @defer.inlineCallbacks
+    def test_cache(self):
+        resolver = CachingThreadedResolver(reactor, 100)
+        with mock.patch('socket.gethostbyname', self.gethostbyname):
+            for _ in range(2):
+                address = yield resolver.getHostByName('localhost')
+                self.assertEqual(address, '127.0.0.1')
+                d = resolver.getHostByName('missing.example.com')
+                yield self.assertFailure(d, DNSLookupError)
+                d = resolver.getHostByName('failing.example.com')
+                yield self.assertFailure(d, DNSLookupError)
+        # only the missing name is cached, not the temporary failure
+        self.assertEqual(self.calls, ['localhost', 'missing.example.com',
+            'failing.example.com', 'failing.example.com'])
+
+    @defer.inlineCallbacks
+    def test_timeout_not_cached(self):
+        resolver = CachingThreadedResolver(reactor, 100, timeout=0.1)
+        with mock.patch('socket.gethostbyname', self.gethostbyname):
+            for _ in range(2):
+                d = resolver.getHostByName('slow.example.com')
+                failure = yield self.assertFailure(d, DNSLookupError)
+                self.assertIn('timeout', str(failure))
+            self.assertEqual(self.calls, ['slow.example.com'] * 2)
+            # wait for the threads
+            yield task.deferLater(reactor, 0.6, lambda: None)
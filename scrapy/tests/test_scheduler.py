@@ -0,0 +1,300 @@
+import shutil
+import tempfile
+import unittest
+
+from scrapy.http import Request
+from scrapy.spider import Spider
+from scrapy.dupefilter import RFPDupeFilter
+from scrapy.core.scheduler import Scheduler, SlotScheduler, HybridScheduler
+from scrapy.core.downloader import Slot
+from scrapy.squeue import FifoMemoryQueue, PickleFifoDiskQueue, PickleSegmentedFifoDiskQueue
+from scrapy.statscol import StatsCollector
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.test import get_crawler
+
+
+class MockDownloader(object):
+
+    def __init__(self):
+        self.slots = {}
+        self.active = set()
+
+    def _get_slot_key(self, request, spider):
+        return urlparse_cached(request).hostname
+
+    def fetch(self, request, slot=None):
+        self.active.add(request)
+        if slot:
+            slot.active.add(request)
+            slot.queue.append((request, None))
+
+
+class SlotSchedulerTest(unittest.TestCase):
+
+    jobdir = None
+
+    def setUp(self):
+        self.spider = Spider('foo')
+        self.downloader = MockDownloader()
+        self.open_scheduler()
+
+    def open_scheduler(self):
+        crawler = get_crawler()
+        self.scheduler = SlotScheduler(RFPDupeFilter(), self.jobdir,
+            PickleFifoDiskQueue, FifoMemoryQueue, stats=StatsCollector(crawler),
+            downloader=self.downloader)
+        self.scheduler.open(self.spider)
+
+    def tearDown(self):
+        self.scheduler.close('finished')
+
+    def get_slot(self, concurrency=2, delay=0):
+        return Slot(concurrency, delay, get_crawler().settings)
+
+    def enqueue(self, *urls):
+        for url in urls:
+            self.scheduler.enqueue_request(Request(url))
+
+    def test_round_robin(self):
+        self.enqueue('http://a.com/1', 'http://a.com/2', 'http://a.com/3',
+            'http://b.com/1', 'http://c.com/1')
+        hosts = [urlparse_cached(self.scheduler.next_request()).hostname
+            for _ in range(5)]
+        self.assertEqual(hosts, ['a.com', 'b.com', 'c.com', 'a.com', 'a.com'])
+        self.assertEqual(self.scheduler.next_request(), None)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_saturated_slot(self):
+        slot = self.downloader.slots['a.com'] = self.get_slot(concurrency=1)
+        slot.transferring.add(Request('http://a.com/0'))
+        self.enqueue('http://a.com/1', 'http://a.com/2', 'http://b.com/1')
+
+        # one request can wait in the slot queue
+        r1 = self.scheduler.next_request()
+        self.assertEqual(r1.url, 'http://a.com/1')
+        self.downloader.fetch(r1)
+        self.assertEqual(self.scheduler.next_request().url, 'http://b.com/1')
+        self.assertEqual(self.scheduler.next_request(), None)
+
+        # the request reached the downloader slot
+        self.downloader.fetch(r1, slot)
+        self.assertEqual(self.scheduler.next_request(), None)
+        self.assertEqual(len(self.scheduler), 1)
+
+        slot.queue.popleft()
+        self.assertEqual(self.scheduler.next_request().url, 'http://a.com/2')
+
+    def test_delayed_slot(self):
+        slot = self.downloader.slots['a.com'] = self.get_slot(concurrency=8, delay=2)
+        self.enqueue('http://a.com/1', 'http://a.com/2')
+        r1 = self.scheduler.next_request()
+        self.downloader.fetch(r1, slot)
+        self.assertEqual(self.scheduler.next_request(), None)
+        slot.queue.popleft()
+        self.assertEqual(self.scheduler.next_request().url, 'http://a.com/2')
+
+    def test_priorities_within_slot(self):
+        self.scheduler.enqueue_request(Request('http://a.com/1', priority=1))
+        self.scheduler.enqueue_request(Request('http://a.com/2', priority=5))
+        self.assertEqual(self.scheduler.next_request().url, 'http://a.com/2')
+
+    def test_pending_forgotten(self):
+        self.enqueue(*['http://host%d.com/' % i for i in range(1000)])
+        request = self.scheduler.next_request()
+        while request:
+            self.downloader.fetch(request)
+            host = urlparse_cached(request).hostname
+            if len(self.downloader.slots) < 500:
+                # it reached its downloader slot
+                slot = self.downloader.slots[host] = self.get_slot()
+                slot.active.add(request)
+            else:
+                # it was downloaded
+                self.downloader.active.remove(request)
+            request = self.scheduler.next_request()
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertEqual(self.scheduler.pending, {})
+
+
+class SlotSchedulerDiskTest(SlotSchedulerTest):
+
+    def setUp(self):
+        self.jobdir = tempfile.mkdtemp()
+        super(SlotSchedulerDiskTest, self).setUp()
+
+    def tearDown(self):
+        super(SlotSchedulerDiskTest, self).tearDown()
+        shutil.rmtree(self.jobdir)
+
+    def test_round_robin(self):
+        # requests are read from disk until one for a ready slot is found
+        self.enqueue('http://a.com/1', 'http://a.com/2', 'http://a.com/3',
+            'http://b.com/1', 'http://c.com/1')
+        urls = []
+        for _ in range(3):
+            request = self.scheduler.next_request()
+            self.downloader.fetch(request)
+            urls.append(request.url)
+        self.assertEqual(urls, ['http://a.com/1', 'http://b.com/1', 'http://c.com/1'])
+        self.assertEqual(self.scheduler.next_request(), None)
+        self.assertEqual(len(self.scheduler), 2)
+
+    def test_close_and_resume(self):
+        slot = self.downloader.slots['a.com'] = self.get_slot(concurrency=1)
+        slot.transferring.add(Request('http://a.com/0'))
+        slot.queue.append((Request('http://a.com/0'), None))
+        self.enqueue('http://a.com/1', 'http://b.com/1')
+        self.assertEqual(self.scheduler.next_request().url, 'http://b.com/1')
+        self.assertEqual(self.scheduler.next_request(), None)
+        self.assertEqual(len(self.scheduler), 1)
+        self.scheduler.close('shutdown')
+
+        self.downloader = MockDownloader()
+        self.open_scheduler()
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.next_request().url, 'http://a.com/1')
+
+    def test_max_requests(self):
+        self.scheduler.max_requests = 150
+        slot = self.downloader.slots['a.com'] = self.get_slot(concurrency=1)
+        slot.transferring.add(Request('http://a.com/0'))
+        slot.queue.append((Request('http://a.com/0'), None))
+        self.enqueue(*['http://a.com/%d' % i for i in range(1, 1001)])
+        for _ in range(20):
+            self.assertEqual(self.scheduler.next_request(), None)
+        # the rest of the requests are left on disk
+        self.assertEqual(self.scheduler.slotcount, 150)
+        self.assertEqual(len(self.scheduler.dqs), 850)
+        self.assertEqual(len(self.scheduler), 1000)
+
+
+class SegmentedDiskQueueSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobdir = tempfile.mkdtemp()
+        self.spider = Spider('foo')
+        self.open_scheduler()
+
+    def tearDown(self):
+        self.scheduler.close('finished')
+        shutil.rmtree(self.jobdir)
+
+    def open_scheduler(self):
+        crawler = get_crawler({'SCHEDULER_DISK_QUEUE_SEGMENT_SIZE': 1024})
+        self.scheduler = Scheduler(RFPDupeFilter(), self.jobdir,
+            PickleSegmentedFifoDiskQueue, FifoMemoryQueue,
+            stats=StatsCollector(crawler))
+        self.scheduler.settings = crawler.settings
+        self.scheduler.open(self.spider)
+
+    def test_priorities_close_and_resume(self):
+        for i in range(100):
+            self.scheduler.enqueue_request(
+                Request('http://a.com/%d' % i, priority=i % 10))
+        self.assertEqual(self.scheduler.dqs.segment_size, 1024)
+        self.assertEqual(len(self.scheduler), 100)
+        self.assertEqual(self.scheduler.next_request().url, 'http://a.com/9')
+        self.scheduler.close('shutdown')
+
+        self.open_scheduler()
+        self.assertEqual(len(self.scheduler), 99)
+        prios = [self.scheduler.next_request().priority for _ in range(99)]
+        self.assertEqual(prios, sorted(prios, reverse=True))
+        self.assertEqual(self.scheduler.next_request(), None)
+
+
+class HybridSchedulerTest(unittest.TestCase):
+
+    jobdir = None
+    dqclass = PickleFifoDiskQueue
+
+    def setUp(self):
+        self.spider = Spider('foo')
+        self.stats = StatsCollector(get_crawler())
+        self.open_scheduler()
+
+    def tearDown(self):
+        self.scheduler.close('finished')
+
+    def open_scheduler(self):
+        self.scheduler = HybridScheduler(RFPDupeFilter(), self.jobdir,
+            self.dqclass, FifoMemoryQueue, stats=self.stats,
+            max_requests=8, batch_size=4)
+        self.scheduler.open(self.spider)
+
+    def enqueue(self, n, priority=0):
+        for i in range(n):
+            self.scheduler.enqueue_request(
+                Request('http://a.com/%d/%d' % (priority, i), priority=priority))
+
+    def test_spill_and_load(self):
+        self.enqueue(6, priority=1)
+        self.enqueue(3, priority=0)
+        self.assertEqual(self.stats.get_value('scheduler/spilled'), 3)
+        self.assertEqual(self.scheduler.mqcount, 6)
+        self.assertEqual(len(self.scheduler), 9)
+
+        urls = [self.scheduler.next_request().url for _ in range(9)]
+        self.assertEqual(urls, ['http://a.com/1/%d' % i for i in range(6)] +
+                               ['http://a.com/0/%d' % i for i in range(3)])
+        self.assertEqual(self.scheduler.next_request(), None)
+        self.assertEqual(self.stats.get_value('scheduler/unspilled'), 3)
+        self.assertEqual(self.scheduler.mqcount, 0)
+        self.assertEqual(self.scheduler.mqbytes, 0)
+
+    def test_disk_priority(self):
+        self.enqueue(9, priority=0)
+        self.enqueue(6, priority=-1)
+        # higher priority requests spilled to disk first
+        self.enqueue(2, priority=5)
+        self.assertEqual(self.scheduler.next_request().url, 'http://a.com/5/0')
+        self.assertEqual(self.scheduler.next_request().url, 'http://a.com/5/1')
+        prios = [self.scheduler.next_request().priority for _ in range(15)]
+        self.assertEqual(prios, [0] * 9 + [-1] * 6)
+
+    def test_max_bytes(self):
+        self.scheduler.max_requests = 0
+        self.scheduler.max_bytes = 100
+        self.enqueue(10)
+        self.assertTrue(self.scheduler.mqbytes <= 75)
+        self.assertEqual(len(self.scheduler), 10)
+
+    def test_unserializable(self):
+        pushes = []
+        dqpush = self.scheduler._dqpush
+        self.scheduler._dqpush = lambda request: pushes.append(request) or dqpush(request)
+        for i in range(20):
+            self.scheduler.enqueue_request(Request('http://a.com/lambda/%d' % i,
+                callback=lambda response: None, priority=-1))
+        self.enqueue(10)
+        # every unserializable request is only tried once
+        self.assertEqual(len([r for r in pushes if r.callback]), 20)
+        self.assertEqual(len(self.scheduler.unspillable), 20)
+        self.assertEqual(len(self.scheduler), 30)
+        prios = [self.scheduler.next_request().priority for _ in range(30)]
+        self.assertEqual(prios, [0] * 10 + [-1] * 20)
+        self.assertEqual(self.scheduler.next_request(), None)
+
+
+class HybridSchedulerDiskTest(HybridSchedulerTest):
+
+    def setUp(self):
+        self.jobdir = tempfile.mkdtemp()
+        super(HybridSchedulerDiskTest, self).setUp()
+
+    def tearDown(self):
+        super(HybridSchedulerDiskTest, self).tearDown()
+        shutil.rmtree(self.jobdir)
+
+    def test_close_and_resume(self):
+        self.enqueue(5)
+        self.scheduler.close('shutdown')
+        self.open_scheduler()
+        self.assertEqual(len(self.scheduler), 5)
+        urls = set(self.scheduler.next_request().url for _ in range(5))
+        self.assertEqual(urls, set('http://a.com/0/%d' % i for i in range(5)))
+
+
+class HybridSchedulerSegmentedDiskTest(HybridSchedulerDiskTest):
+
+    dqclass = PickleSegmentedFifoDiskQueue
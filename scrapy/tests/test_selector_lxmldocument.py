@@ -1,6 +1,7 @@
 import unittest
 from scrapy.selector.lxmldocument import LxmlDocument
-from scrapy.http import TextResponse, HtmlResponse
+from scrapy.http import TextResponse, HtmlResponse, XmlResponse
+from scrapy.tests.test_http_mappedbody import mapped
 
 
 class LxmlDocumentTest(unittest.TestCase):
@@ -24,3 +25,17 @@ class LxmlDocumentTest(unittest.TestCase):
                                 headers={'Content-Type': 'text/plain; charset=utf-8'},
                                 body=body)
         LxmlDocument(response)
+
+    def test_mapped_body(self):
+        body = mapped('<html><body><p>\xa3100</p></body></html>')
+        response = HtmlResponse('http://example.com', body=body,
+                                headers={'Content-Type': 'text/html; charset=iso-8859-1'})
+        doc = LxmlDocument(response)
+        self.assertEqual(doc.xpath('//p/text()'), [u'\xa3100'])
+        self.assert_(response._cached_ubody is None)
+
+        body = mapped('<?xml version="1.0" encoding="utf-8"?><root><a>1</a></root>')
+        response = XmlResponse('http://example.com', body=body)
+        from scrapy.selector.unified import SafeXMLParser
+        doc = LxmlDocument(response, SafeXMLParser)
+        self.assertEqual(doc.xpath('//a/text()'), ['1'])
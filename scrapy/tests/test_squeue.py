@@ -1,5 +1,10 @@
+import os
+import glob
+
 from queuelib.tests import test_queue as t
-from scrapy.squeue import MarshalFifoDiskQueue, MarshalLifoDiskQueue, PickleFifoDiskQueue, PickleLifoDiskQueue
+from scrapy.squeue import MarshalFifoDiskQueue, MarshalLifoDiskQueue, PickleFifoDiskQueue, PickleLifoDiskQueue, \
+    CompactFifoDiskQueue, CompactLifoDiskQueue, SegmentedFifoDiskQueue, SegmentedLifoDiskQueue, \
+    PickleSegmentedLifoDiskQueue
 from scrapy.item import Item, Field
 from scrapy.http import Request
 from scrapy.contrib.loader import ItemLoader
@@ -144,3 +149,149 @@ class PickleLifoDiskQueueTest(MarshalLifoDiskQueueTest):
         assert isinstance(r2, Request)
         self.assertEqual(r.url, r2.url)
         assert r2.meta['request'] is r2
+
+
+class CompactFifoDiskQueueTest(t.FifoDiskQueueTest):
+
+    def queue(self):
+        return CompactFifoDiskQueue(self.qdir, chunksize=self.chunksize)
+
+
+class CompactLifoDiskQueueTest(t.LifoDiskQueueTest):
+
+    def queue(self):
+        return CompactLifoDiskQueue(self.path)
+
+
+class SegmentedDiskQueueTestMixin(object):
+
+    segment_size = 100
+
+    def setUp(self):
+        super(SegmentedDiskQueueTestMixin, self).setUp()
+        self.qdir = self.mktemp()
+
+    def queue(self, **kwargs):
+        kwargs.setdefault('segment_size', self.segment_size)
+        return self.queue_class(self.qdir, **kwargs)
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.qdir, 's*')))
+
+    def test_priorities(self):
+        q = self.queue()
+        q.push('a', 2)
+        q.push('b', -1)
+        q.push('c', 1)
+        self.assertEqual(q.curprio, -1)
+        self.assertEqual(q.pop(), 'b')
+        self.assertEqual(q.curprio, 1)
+        q.push('d', 0)
+        self.assertEqual([q.pop(), q.pop(), q.pop(), q.pop()], ['d', 'c', 'a', None])
+        self.assertEqual(q.curprio, None)
+
+    def test_close_open(self):
+        q = self.queue()
+        for i in range(20):
+            q.push('record%d' % i, i % 3)
+        for _ in range(5):
+            q.pop()
+        self.assertEqual(sorted(q.close()), [0, 1, 2])
+        q = self.queue()
+        self.assertEqual(len(q), 15)
+        self.assertEqual(q.curprio, 0)
+        popped = [q.pop() for _ in range(15)]
+        self.assertEqual(len(set(popped)), 15)
+        self.assertEqual(q.pop(), None)
+        q.close()
+
+    def test_cleanup(self):
+        q = self.queue()
+        q.push('a')
+        q.close()
+        assert os.path.exists(self.qdir)
+        q = self.queue()
+        self.assertEqual(q.pop(), 'a')
+        q.close()
+        assert not os.path.exists(self.qdir)
+
+    def test_consumed_segments_removed(self):
+        q = self.queue()
+        for i in range(30):
+            q.push('x' * 20, i)
+        self.assertEqual(len(self.segments()), 8)
+        for _ in range(20):
+            q.pop()
+        self.assertEqual(len(self.segments()), 3)
+        q.close()
+
+    def test_many_priorities(self):
+        q = self.queue(segment_size=16384)
+        for i in range(1000):
+            q.push(str(i), i)
+        self.assertEqual(len(self.segments()), 1)
+        self.assertEqual(q.pop(), '0')
+        q.close()
+
+    def test_compact(self):
+        q = self.queue()
+        q.compact_interval = 10
+        # one low priority record per segment
+        for i in range(10):
+            q.push('l' * 8, 1)
+            for _ in range(3):
+                q.push('x' * 20, 0)
+        self.assertEqual(len(self.segments()), 11)
+        for _ in range(30):
+            q.pop()
+        self.assertEqual(len(self.segments()), 2)
+        self.assertEqual([q.pop() for _ in range(10)], ['l' * 8] * 10)
+        self.assertEqual(q.pop(), None)
+        q.close()
+
+    def test_rebuild_index(self):
+        q = self.queue()
+        for i in range(10):
+            q.push('record%d' % i, i % 2)
+        q._flush()
+        # simulate the process being killed in the middle of a write
+        with open(self.segments()[-1], 'ab') as f:
+            f.write(q._header.pack(0, 100) + 'partial')
+        q = self.queue()
+        self.assertEqual(len(q), 10)
+        self.assertEqual(sorted(q.pop() for _ in range(10)),
+            sorted('record%d' % i for i in range(10)))
+        q.close()
+
+    def test_fsync(self):
+        for fsync in ('none', 'segment', 'batch'):
+            q = self.queue(fsync=fsync, write_buffer=1)
+            q.push('a')
+            self.assertEqual(q.pop(), 'a')
+            q.close()
+        self.assertRaises(ValueError, self.queue, fsync='always')
+
+
+class SegmentedFifoDiskQueueTest(SegmentedDiskQueueTestMixin, t.FifoMemoryQueueTest):
+
+    queue_class = SegmentedFifoDiskQueue
+
+
+class SegmentedLifoDiskQueueTest(SegmentedDiskQueueTestMixin, t.LifoMemoryQueueTest):
+
+    queue_class = SegmentedLifoDiskQueue
+
+
+class PickleSegmentedLifoDiskQueueTest(t.LifoMemoryQueueTest):
+
+    def queue(self):
+        return PickleSegmentedLifoDiskQueue(self.mktemp())
+
+    def test_serialize_request(self):
+        q = self.queue()
+        q.push(Request('http://www.example.com/1'), 1)
+        q.push(Request('http://www.example.com/0'), 0)
+        r = q.pop()
+        assert isinstance(r, Request)
+        self.assertEqual(r.url, 'http://www.example.com/0')
+        self.assertEqual(q.pop().url, 'http://www.example.com/1')
@@ -0,0 +1,83 @@
+import unittest
+
+import mock
+
+from scrapy.utils.cputime import CPUTimer, callable_name
+from scrapy.statscol import StatsCollector
+from scrapy.utils.test import get_crawler
+
+
+class Component(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def work(self, seconds):
+        self.clock[0] += seconds
+        return seconds
+
+    def nested(self, inner, seconds):
+        self.clock[0] += seconds
+        return inner(seconds)
+
+    def generate(self, seconds):
+        for i in range(3):
+            self.clock[0] += seconds
+            yield i
+
+
+class CPUTimerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = [0.0]
+        for name in ('clock', 'time'):
+            patch = mock.patch('scrapy.utils.cputime.%s' % name, lambda: self.clock[0])
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.timer = CPUTimer()
+        self.component = Component(self.clock)
+
+    def test_callable_name(self):
+        self.assertEqual(callable_name(self.component.work), 'Component.work')
+        self.assertEqual(callable_name(callable_name), 'callable_name')
+
+    def test_wrap(self):
+        work = self.timer.wrap(self.component.work)
+        self.assertIs(work.im_self, self.component)
+        self.assertEqual(work.im_func.__name__, 'work')
+        self.assertEqual(work(1), 1)
+        self.assertEqual(work(seconds=2), 2)
+        self.assertEqual(self.timer.times, {'Component.work': [2, 3, 3]})
+
+    def test_exclusive_times(self):
+        work = self.timer.wrap(self.component.work)
+        nested = self.timer.wrap(self.component.nested)
+        nested(work, 2)
+        self.assertEqual(self.timer.times, {'Component.work': [1, 2, 2],
+                                            'Component.nested': [1, 2, 2]})
+
+    def test_exception(self):
+        work = self.timer.wrap(self.component.work)
+        self.assertRaises(TypeError, work, None)
+        self.assertEqual(self.timer.times['Component.work'][0], 1)
+        self.assertEqual(self.timer._stack, [])
+
+    def test_generator(self):
+        generate = self.timer.wrap(self.component.generate, 'gen')
+        gen = generate(1)
+        self.assertEqual(self.timer.times, {'gen': [1, 0, 0]})
+        self.assertEqual(list(gen), [0, 1, 2])
+        self.assertEqual(self.timer.times, {'gen': [1, 3, 3]})
+
+    def test_flush(self):
+        self.timer.wrap(self.component.work)(1.5)
+        stats = StatsCollector(get_crawler())
+        self.timer.flush(stats)
+        self.assertEqual(stats.get_stats(), {'cpustats/Component.work/calls': 1,
+                                             'cpustats/Component.work/cpu': 1.5,
+                                             'cpustats/Component.work/wall': 1.5})
+        self.assertIn('Component.work', self.timer.format_times())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 import copy
 import unittest
 
-from scrapy.utils.datatypes import CaselessDict
+from scrapy.utils.datatypes import CaselessDict, GenerationalCache
 
 __doctests__ = ['scrapy.utils.datatypes']
 
@@ -129,6 +129,35 @@ class CaselessDictTest(unittest.TestCase):
         assert isinstance(h2, CaselessDict)
 
 
+class GenerationalCacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = GenerationalCache(2)
+        cache['a'] = 1
+        self.assertEqual(cache['a'], 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('b', 2), 2)
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+
+    def test_keeps_recently_used(self):
+        cache = GenerationalCache(3)
+        for key in 'abc':
+            cache[key] = key
+        cache['d'] = 'd'
+        self.assertEqual(cache['a'], 'a')
+        cache['e'] = 'e'
+        cache['f'] = 'f'
+        cache['g'] = 'g'
+        # the 3 most recently used keys are always kept
+        for key in 'efg':
+            self.assertTrue(key in cache)
+        self.assertFalse('b' in cache)
+        self.assertFalse('c' in cache)
+        self.assertTrue(len(cache) <= 6)
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -2,8 +2,9 @@ from twisted.trial import unittest
 from twisted.internet import reactor, defer
 from twisted.python.failure import Failure
 
-from scrapy.utils.defer import mustbe_deferred, process_chain, \
-    process_chain_both, process_parallel, iter_errback
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.defer import mustbe_deferred, maybe_deferred, defer_result, \
+    process_chain, process_chain_both, process_parallel, iter_errback
 
 
 class MustbeDeferredTest(unittest.TestCase):
@@ -31,6 +32,41 @@ class MustbeDeferredTest(unittest.TestCase):
         steps.append(2) # add another value, that should be catched by assertEqual
         return dfd
 
+
+class MaybeDeferredTest(unittest.TestCase):
+
+    def test_success_function(self):
+        steps = []
+        def _append(v):
+            steps.append(v)
+            return steps
+
+        dfd = maybe_deferred(_append, 1)
+        self.assertTrue(dfd.called)
+        dfd.addCallback(self.assertEqual, [1])
+        steps.append(2)
+        return dfd
+
+    def test_failure(self):
+        def _raise(exc):
+            raise exc
+        for exc in (IgnoreRequest(), ValueError()):
+            dfd = maybe_deferred(_raise, exc)
+            self.assertTrue(dfd.called)
+            self.assertFailure(dfd, exc.__class__)
+
+    def test_unfired_deferred(self):
+        dfd = defer.Deferred()
+        self.assertIs(maybe_deferred(lambda: dfd), dfd)
+
+    def test_defer_result(self):
+        self.assertTrue(defer_result(1, inline=True).called)
+        self.assertFalse(defer_result(1).addCallback(self.assertEqual, 1).called)
+        failure = Failure(ValueError())
+        dfd = defer_result(failure, inline=True)
+        self.assertTrue(dfd.called)
+        return self.assertFailure(dfd, ValueError)
+
 def cb1(value, arg1, arg2):
     return "(cb1 %s %s %s)" % (value, arg1, arg2)
 def cb2(value, arg1, arg2):
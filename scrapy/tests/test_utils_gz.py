@@ -1,8 +1,10 @@
 import unittest
+import zlib
 from os.path import join
 
 from scrapy.tests import tests_datadir
-from scrapy.utils.gz import gunzip
+from scrapy.utils.gz import gunzip, decompress, Decompressor, \
+    DecompressionMaxSizeExceeded
 
 SAMPLEDIR = join(tests_datadir, 'compressed')
 
@@ -26,3 +28,51 @@ class GzTest(unittest.TestCase):
         with open(join(SAMPLEDIR, 'truncated-crc-error-short.gz'), 'rb') as f:
             text = gunzip(f.read())
             assert text.endswith('</html>')
+
+    def test_gunzip_maxsize(self):
+        with open(join(SAMPLEDIR, 'feed-sample1.xml.gz'), 'rb') as f:
+            data = f.read()
+        self.assertEqual(len(gunzip(data, maxsize=9950)), 9950)
+        self.assertRaises(DecompressionMaxSizeExceeded, gunzip, data, 9949)
+
+    def test_gunzip_multiple_members(self):
+        with open(join(SAMPLEDIR, 'feed-sample1.xml.gz'), 'rb') as f:
+            data = f.read()
+        self.assertEqual(gunzip(data + data), gunzip(data) * 2)
+
+
+class DecompressorTest(unittest.TestCase):
+
+    def _decompress_chunks(self, data, encoding, size=7):
+        decompressor = Decompressor(encoding)
+        chunks = [decompressor.decompress(data[i:i + size])
+                  for i in xrange(0, len(data), size)]
+        return ''.join(chunks) + decompressor.flush()
+
+    def test_chunks(self):
+        for filename, encoding in [('html-gzip.bin', 'gzip'),
+                                   ('html-rawdeflate.bin', 'deflate'),
+                                   ('html-zlibdeflate.bin', 'deflate'),
+                                   ('truncated-crc-error.gz', 'gzip')]:
+            with open(join(SAMPLEDIR, filename), 'rb') as f:
+                data = f.read()
+            for size in (1, 7, 1024):
+                self.assertEqual(self._decompress_chunks(data, encoding, size),
+                                 decompress(data, encoding))
+
+    def test_deflate(self):
+        with open(join(SAMPLEDIR, 'html-rawdeflate.bin'), 'rb') as f:
+            raw = decompress(f.read(), 'deflate')
+        with open(join(SAMPLEDIR, 'html-zlibdeflate.bin'), 'rb') as f:
+            self.assertEqual(decompress(f.read(), 'deflate'), raw)
+        assert raw.startswith('<!DOCTYPE')
+
+    def test_maxsize_bomb(self):
+        # 10MB of zeros compress to about 10KB
+        data = zlib.compress('\0' * 10 * 1024 * 1024)
+        decompressor = Decompressor('deflate', maxsize=1024)
+        self.assertRaises(DecompressionMaxSizeExceeded,
+                          decompressor.decompress, data)
+        self.assertEqual(decompressor.size, 1025)
+        self.assertEqual(decompressor.decompress(data), '')
+
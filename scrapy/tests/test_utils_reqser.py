@@ -1,8 +1,13 @@
+import os
+import shutil
+import datetime
+import tempfile
 import unittest
 
-from scrapy.http import Request
+from scrapy.http import Request, FormRequest
 from scrapy.spider import Spider
-from scrapy.utils.reqser import request_to_dict, request_from_dict
+from scrapy.utils.reqser import request_to_dict, request_from_dict, RequestCodec
+from scrapy.utils.request import request_fingerprint, _fingerprint_cache
 
 class RequestSerializationTest(unittest.TestCase):
 
@@ -67,6 +72,83 @@ class RequestSerializationTest(unittest.TestCase):
         self.assertRaises(ValueError, request_to_dict, r)
 
 
+class RequestCodecTest(RequestSerializationTest):
+
+    def setUp(self):
+        super(RequestCodecTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'names.json')
+        self.codec = RequestCodec(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _assert_serializes_ok(self, request, spider=None):
+        data = self.codec.encode(request, spider=spider)
+        request2 = self.codec.decode(data, spider=spider)
+        self._assert_same_request(request, request2)
+        self.assertIn(request2, _fingerprint_cache)
+        self.assertEqual(request_fingerprint(request2), request_fingerprint(request))
+        return data
+
+    def test_fast_path(self):
+        r = Request("http://www.example.com/a b", meta={'depth': 2, 'x': [u'y']},
+            dont_filter=True, priority=-3)
+        data = self._assert_serializes_ok(r)
+        self.assertEqual(data[:2], '\x02G')
+        r = Request("http://www.example.com", meta={'date': datetime.date(2014, 1, 1)})
+        data = self._assert_serializes_ok(r)
+        self.assertEqual(data[:2], '\x02P')
+        r = Request("http://www.example.com", headers={'Accept': 'text/html'})
+        data = self._assert_serializes_ok(r)
+        self.assertEqual(data[:2], '\x02P')
+
+    def test_form_request(self):
+        r = FormRequest("http://www.example.com", formdata={'a': '1'})
+        r2 = self.codec.decode(self._assert_serializes_ok(r))
+        self.assertIs(type(r2), FormRequest)
+        self.assertEqual(self.codec.names, ['scrapy.http.request.form.FormRequest'])
+
+    def test_request_subclass(self):
+        # subclasses are built with their constructor
+        data = self._assert_serializes_ok(CustomRequest("http://www.example.com"))
+        built = CustomRequest.built
+        r2 = self.codec.decode(data)
+        self.assertIs(type(r2), CustomRequest)
+        self.assertEqual(CustomRequest.built, built + 1)
+
+    def test_interned_names(self):
+        r = Request("http://www.example.com", callback=self.spider.parse_item,
+            errback=self.spider.handle_error)
+        data = self.codec.encode(r, spider=self.spider)
+        self.assertNotIn('parse_item', data)
+        self.assertEqual(self.codec.names, ['parse_item', 'handle_error'])
+        codec = RequestCodec(self.path)
+        r2 = codec.decode(data, spider=self.spider)
+        self._assert_same_request(r, r2)
+
+    def test_unknown_version(self):
+        data = chr(RequestCodec.version + 1) + \
+            self.codec.encode(Request("http://www.example.com"))[1:]
+        self.assertRaises(ValueError, self.codec.decode, data)
+
+    def test_unserializable_callback1(self):
+        r = Request("http://www.example.com", callback=lambda x: x)
+        self.assertRaises(ValueError, self.codec.encode, r)
+        self.assertRaises(ValueError, self.codec.encode, r, spider=self.spider)
+
+    def test_unserializable_callback2(self):
+        r = Request("http://www.example.com", callback=self.spider.parse_item)
+        self.assertRaises(ValueError, self.codec.encode, r)
+
+
+class CustomRequest(Request):
+    built = 0
+    def __init__(self, *args, **kwargs):
+        super(CustomRequest, self).__init__(*args, **kwargs)
+        CustomRequest.built += 1
+
+
 class TestSpider(Spider):
     name = 'test'
     def parse_item(self, response):
@@ -0,0 +1,65 @@
+import unittest
+
+from scrapy.http import Request
+from scrapy.spider import Spider
+from scrapy.statscol import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+from scrapy.utils.timings import add_timing, bucket_for, record_timings
+
+
+class TimingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = Spider('foo')
+        self.stats = MemoryStatsCollector(get_crawler())
+        self.stats.open_spider(self.spider)
+
+    def test_add_timing(self):
+        request = Request('http://example.com')
+        add_timing(request, 'dns', 0.5)
+        self.assertNotIn('timings', request.meta)
+        request.meta['timings'] = {}
+        add_timing(request, 'dns', 0.5)
+        add_timing(request, 'connect', 0.25)
+        self.assertEqual(request.meta['timings'], {'dns': 0.5, 'connect': 0.25})
+
+    def test_bucket_for(self):
+        self.assertEqual(bucket_for(0), 'le_0.001')
+        self.assertEqual(bucket_for(0.001), 'le_0.001')
+        self.assertEqual(bucket_for(0.002), 'le_0.005')
+        self.assertEqual(bucket_for(0.7), 'le_1')
+        self.assertEqual(bucket_for(60), 'le_60')
+        self.assertEqual(bucket_for(61), 'le_inf')
+
+    def test_record_timings(self):
+        for seconds in (0.2, 0.3, 2):
+            request = Request('http://example.com', meta={'download_slot': 'example.com',
+                                                          'timings': {}})
+            add_timing(request, 'ttfb', seconds)
+            record_timings(self.stats, request, self.spider)
+        stats = self.stats.get_stats(self.spider)
+        self.assertEqual(stats, {
+            'timings/ttfb/le_0.5': 2,
+            'timings/ttfb/le_5': 1,
+            'timings/ttfb/count': 3,
+            'timings/ttfb/total': 2.5,
+            'timings/ttfb/max': 2,
+        })
+
+    def test_record_timings_per_slot(self):
+        request = Request('http://example.com', meta={'download_slot': 'example.com',
+                                                      'timings': {}})
+        add_timing(request, 'body', 0.02)
+        record_timings(self.stats, request, self.spider, per_slot=True)
+        stats = self.stats.get_stats(self.spider)
+        self.assertEqual(stats['timings/body/le_0.05'], 1)
+        self.assertEqual(stats['timings/slots/example.com/body/le_0.05'], 1)
+        self.assertEqual(stats['timings/slots/example.com/body/count'], 1)
+
+    def test_record_timings_without_timings(self):
+        record_timings(self.stats, Request('http://example.com'), self.spider)
+        self.assertEqual(self.stats.get_stats(self.spider), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,12 @@
+import cgi
+import random
+import urllib
+import urlparse
 import unittest
 
 from scrapy.spider import Spider
-from scrapy.utils.url import url_is_from_any_domain, url_is_from_spider, canonicalize_url
+from scrapy.utils.url import url_is_from_any_domain, url_is_from_spider, canonicalize_url, \
+    safe_url_string, parse_url, _unquotepath, _canonicalize_cache
 
 __doctests__ = ['scrapy.utils.url']
 
@@ -165,6 +170,49 @@ class UrlUtilsTest(unittest.TestCase):
         self.assertEqual(canonicalize_url("http://foo.com/AC%2FDC/"),
                          "http://foo.com/AC%2FDC/")
 
+    def test_canonicalize_url_cache(self):
+        url = "http://www.example.com/do?c=1&b=2"
+        self.assertEqual(canonicalize_url(url), "http://www.example.com/do?b=2&c=1")
+        self.assertEqual(_canonicalize_cache[url], "http://www.example.com/do?b=2&c=1")
+        self.assertEqual(canonicalize_url(url), "http://www.example.com/do?b=2&c=1")
+        # only urls canonicalized with the default arguments are cached
+        url = "http://www.example.com/do?c=&b=2"
+        self.assertEqual(canonicalize_url(url, keep_blank_values=False),
+                         "http://www.example.com/do?b=2")
+        self.assertFalse(url in _canonicalize_cache)
+        self.assertEqual(canonicalize_url(urlparse.urlparse(url)),
+                         "http://www.example.com/do?b=2&c=")
+
+    def test_canonicalize_url_same_as_reference(self):
+        def reference(url, keep_blank_values=True, keep_fragments=False):
+            # canonicalize_url without caching and fast paths
+            scheme, netloc, path, params, query, fragment = parse_url(url)
+            keyvals = cgi.parse_qsl(query, keep_blank_values)
+            keyvals.sort()
+            query = urllib.urlencode(keyvals)
+            path = safe_url_string(_unquotepath(path)) or '/'
+            fragment = '' if not keep_fragments else fragment
+            return urlparse.urlunparse((scheme, netloc.lower(), path, params, query, fragment))
+
+        rnd = random.Random(0)
+        chars = 'aZ09/?#%&=;:@+.-_ \t\n\xa3[]~!*\'(),$|'
+        prefixes = ['http://www.Example.com', 'https://a.com:81', 'HTTP://a.com',
+            'ftp://a.com', 'http://u:P@a.com', 'http://', 'http:', 'http:///', 'http://[::1]', '']
+        for _ in range(5000):
+            url = rnd.choice(prefixes) + ''.join(rnd.choice(chars)
+                for _ in range(rnd.randint(0, 12)))
+            try:
+                expected = reference(url)
+            except ValueError:
+                self.assertRaises(ValueError, canonicalize_url, url)
+            else:
+                self.assertEqual(canonicalize_url(url), expected, url)
+                self.assertEqual(canonicalize_url(url), expected, url)
+                self.assertEqual(canonicalize_url(url, keep_blank_values=False),
+                                 reference(url, keep_blank_values=False), url)
+                self.assertEqual(canonicalize_url(url, keep_fragments=True),
+                                 reference(url, keep_fragments=True), url)
+
 
 if __name__ == "__main__":
     unittest.main()
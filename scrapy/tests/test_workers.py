@@ -0,0 +1,51 @@
+import unittest
+from datetime import datetime
+
+from scrapy.workers import worker_for, merge_stats
+
+
+class WorkerForTest(unittest.TestCase):
+
+    def test_stable(self):
+        keys = ['example.com', 'scrapy.org', 'localhost', '127.0.0.1']
+        self.assertEqual([worker_for(k, 4) for k in keys],
+                         [worker_for(k, 4) for k in keys])
+
+    def test_range(self):
+        workers = set(worker_for('site%d.com' % i, 3) for i in range(100))
+        self.assertEqual(workers, set([0, 1, 2]))
+
+    def test_single_worker(self):
+        self.assertEqual(worker_for('example.com', 1), 0)
+
+
+class MergeStatsTest(unittest.TestCase):
+
+    def test_merge(self):
+        s1 = {'item_scraped_count': 3, 'request_depth_max': 2,
+              'start_time': datetime(2014, 1, 1, 10),
+              'finish_time': datetime(2014, 1, 1, 12),
+              'finish_reason': 'finished', 'only_first': 1}
+        s2 = {'item_scraped_count': 4, 'request_depth_max': 5,
+              'start_time': datetime(2014, 1, 1, 9),
+              'finish_time': datetime(2014, 1, 1, 11),
+              'finish_reason': 'shutdown'}
+        self.assertEqual(merge_stats([s1, s2]), {
+            'item_scraped_count': 7,
+            'request_depth_max': 5,
+            'start_time': datetime(2014, 1, 1, 9),
+            'finish_time': datetime(2014, 1, 1, 12),
+            'finish_reason': ['finished', 'shutdown'],
+            'only_first': 1,
+        })
+
+    def test_agree(self):
+        stats = [{'finish_reason': 'finished'}, {'finish_reason': 'finished'}]
+        self.assertEqual(merge_stats(stats), {'finish_reason': 'finished'})
+
+    def test_empty(self):
+        self.assertEqual(merge_stats([]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
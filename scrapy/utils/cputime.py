@@ -0,0 +1,111 @@
+"""
+Accounting of the CPU and wall time spent in the middlewares, pipelines and
+spider callbacks, per component method.
+
+See documentation in docs/topics/extensions.rst
+"""
+
+from __future__ import print_function
+from time import clock, time
+from types import GeneratorType
+
+
+def callable_name(func):
+    """Return the name of func, prefixed with the class name for methods"""
+    obj = getattr(func, 'im_self', None)
+    name = getattr(func, '__name__', func.__class__.__name__)
+    if obj is None:
+        return name
+    return '%s.%s' % (obj.__class__.__name__, name)
+
+
+class _TimedMethod(object):
+    """Callable which times the calls to a method under a name, and still
+    looks like the method to the code reporting errors about it"""
+
+    def __init__(self, timer, func, name):
+        self.timer = timer
+        self.func = func
+        self.name = name
+        self.im_self = getattr(func, 'im_self', None)
+        self.im_func = getattr(func, 'im_func', func)
+        self.__name__ = getattr(func, '__name__', name)
+
+    def __call__(self, *args, **kwargs):
+        return self.timer.call(self.name, self.func, args, kwargs)
+
+
+class CPUTimer(object):
+    """Keep the number of calls, and the CPU and wall seconds spent in them,
+    per name.
+
+    Times are exclusive: the time of a timed call made by another timed call
+    is only accounted for the inner one. The generators returned by a timed
+    call (as spider callbacks and ``process_spider_output`` methods do) are
+    timed too, as most of their work is done when iterated.
+    """
+
+    def __init__(self):
+        # name -> [calls, cpu seconds, wall seconds]
+        self.times = {}
+        # [cpu, wall] seconds of the timed calls made by the running ones
+        self._stack = []
+
+    def wrap(self, func, name=None):
+        """Return a callable which times the calls to func"""
+        return _TimedMethod(self, func, name or callable_name(func))
+
+    def call(self, name, func, args=(), kwargs={}):
+        result = self._call(name, func, args, kwargs, True)
+        if isinstance(result, GeneratorType):
+            return self._iterate(name, result)
+        return result
+
+    def _call(self, name, func, args, kwargs, count):
+        inner = [0.0, 0.0]
+        self._stack.append(inner)
+        cpu, wall = clock(), time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            cpu, wall = clock() - cpu, time() - wall
+            self._stack.pop()
+            if self._stack:
+                outer = self._stack[-1]
+                outer[0] += cpu
+                outer[1] += wall
+            entry = self.times.get(name)
+            if entry is None:
+                entry = self.times[name] = [0, 0.0, 0.0]
+            entry[0] += count
+            entry[1] += cpu - inner[0]
+            entry[2] += wall - inner[1]
+
+    def _iterate(self, name, gen):
+        while True:
+            try:
+                value = self._call(name, next, (gen,), {}, False)
+            except StopIteration:
+                return
+            yield value
+
+    def flush(self, stats, spider=None):
+        """Copy the times to the stats"""
+        for name, (calls, cpu, wall) in self.times.iteritems():
+            key = 'cpustats/%s/' % name
+            stats.set_value(key + 'calls', calls, spider=spider)
+            stats.set_value(key + 'cpu', round(cpu, 6), spider=spider)
+            stats.set_value(key + 'wall', round(wall, 6), spider=spider)
+
+    def format_times(self):
+        """Return a report of the times, the most CPU consuming first"""
+        s = "%-60s %10s %10s %10s %10s\n" % ("Component", "calls", "cpu (s)",
+                                             "wall (s)", "cpu/call (us)")
+        times = sorted(self.times.iteritems(), key=lambda x: x[1][1], reverse=True)
+        for name, (calls, cpu, wall) in times:
+            s += "%-60s %10d %10.3f %10.3f %10.1f\n" % (name, calls, cpu, wall,
+                                                        cpu * 1000000 / max(calls, 1))
+        return s
+
+    def print_times(self):
+        print(self.format_times())
@@ -280,3 +280,49 @@ class LocalCache(OrderedDict):
         while len(self) >= self.limit:
             self.popitem(last=False)
         super(LocalCache, self).__setitem__(key, value)
+
+
+class GenerationalCache(object):
+    """Dictionary-like cache which keeps (at least) the ``limit`` most
+    recently used keys.
+
+    It approximates an LRU cache with two generations of plain dicts: keys
+    are set in the current generation, keys found in the previous one are
+    moved to the current one, and when the current generation is full it
+    replaces the previous one, dropping the keys not used since the last
+    replacement. Unlike in LocalCache, lookups only cost a dict lookup.
+
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.current = {}
+        self.previous = {}
+
+    def __getitem__(self, key):
+        try:
+            return self.current[key]
+        except KeyError:
+            value = self.previous.pop(key)
+            self[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        if len(self.current) >= self.limit:
+            self.previous = self.current
+            self.current = {}
+        else:
+            self.previous.pop(key, None)
+        self.current[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.current or key in self.previous
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
@@ -23,29 +23,40 @@ def defer_succeed(result):
     reactor.callLater(0, d.callback, result)
     return d
 
-def defer_result(result):
+def defer_result(result, inline=False):
+    """Return a Deferred for the given result, which fires in the next
+    reactor loop, or right away if inline is True"""
     if isinstance(result, defer.Deferred):
         return result
     elif isinstance(result, failure.Failure):
-        return defer_fail(result)
+        return defer.fail(result) if inline else defer_fail(result)
     else:
-        return defer_succeed(result)
+        return defer.succeed(result) if inline else defer_succeed(result)
 
 def mustbe_deferred(f, *args, **kw):
     """Same as twisted.internet.defer.maybeDeferred, but delay calling
     callback/errback to next reactor loop
     """
+    return _call_deferred(False, f, args, kw)
+
+def maybe_deferred(f, *args, **kw):
+    """Same as mustbe_deferred, but callback/errback are called right away if
+    f doesn't return a Deferred, like twisted.internet.defer.maybeDeferred
+    """
+    return _call_deferred(True, f, args, kw)
+
+def _call_deferred(inline, f, args, kw):
     try:
         result = f(*args, **kw)
     # FIXME: Hack to avoid introspecting tracebacks. This to speed up
     # processing of IgnoreRequest errors which are, by far, the most common
     # exception in Scrapy - see #125
     except IgnoreRequest as e:
-        return defer_fail(failure.Failure(e))
+        return defer_result(failure.Failure(e), inline)
     except:
-        return defer_fail(failure.Failure())
+        return defer_result(failure.Failure(), inline)
     else:
-        return defer_result(result)
+        return defer_result(result, inline)
 
 def parallel(iterable, count, callable, *args, **named):
     """Execute a callable over the objects in the given iterable, in parallel,
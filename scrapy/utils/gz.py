@@ -1,30 +1,166 @@
 import struct
+import zlib
 from cStringIO import StringIO
-from gzip import GzipFile
 
-def gunzip(data):
+
+class DecompressionMaxSizeExceeded(ValueError):
+    """The decompressed data is larger than the allowed maximum size"""
+
+
+class Decompressor(object):
+    """Incremental decompressor of gzip and deflate encoded data.
+
+    Like ``gunzip``, it is resilient to truncated data and CRC checksum
+    errors: CRC checksums are not verified and, once some data was
+    decompressed, errors stop decompression and the rest of the input is
+    ignored. Errors before that raise ``IOError``.
+
+    If ``maxsize`` is given, ``DecompressionMaxSizeExceeded`` is raised as soon
+    as the decompressed data would be larger, without decompressing the rest.
+    """
+
+    def __init__(self, encoding='gzip', maxsize=0):
+        self.gzip = encoding in ('gzip', 'x-gzip')
+        self.maxsize = maxsize
+        self.size = 0
+        self._dobj = None
+        self._buf = ''
+        self._state = 'header'
+
+    def decompress(self, data):
+        """Return the data decompressed from the given chunk of input"""
+        if self._state == 'done':
+            return ''
+        self._buf += data
+        output = []
+        while self._buf and self._state != 'done':
+            if self._state == 'header':
+                if not self._read_header():
+                    break
+            elif self._state == 'body':
+                data, self._buf = self._buf, ''
+                try:
+                    output.append(self._decompress(data))
+                except zlib.error as e:
+                    self._error('Invalid compressed data: %s' % e)
+                    break
+                if not self._dobj.unused_data:
+                    break
+                # end of the compressed stream
+                self._buf = self._dobj.unused_data
+                self._state = 'trailer' if self.gzip else 'done'
+            elif self._state == 'trailer':
+                # gzip files may have several members after the CRC32 and
+                # size of the previous one
+                if len(self._buf) < 8:
+                    break
+                self._buf = self._buf[8:]
+                self._state = 'header'
+        return ''.join(output)
+
+    def flush(self):
+        """Return the rest of the decompressed data, once all input was
+        given to ``decompress``"""
+        state, self._state = self._state, 'done'
+        if state == 'body':
+            return self._check_size(self._dobj.flush())
+        if state == 'header' and self._buf and not self.size:
+            raise IOError('Not a %s encoded body' % ('gzip' if self.gzip else 'deflate'))
+        return ''
+
+    def _read_header(self):
+        if not self.gzip:
+            if len(self._buf) < 2:
+                return False
+            self._dobj = zlib.decompressobj(_deflate_wbits(self._buf))
+        else:
+            try:
+                size = _gzip_header_size(self._buf)
+            except IOError as e:
+                self._error(str(e))
+                return False
+            if size is None:
+                return False
+            self._buf = self._buf[size:]
+            self._dobj = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._state = 'body'
+        return True
+
+    def _error(self, msg):
+        if not self.size:
+            raise IOError(msg)
+        self._state = 'done'
+        self._buf = ''
+
+    def _decompress(self, data):
+        if not self.maxsize:
+            return self._check_size(self._dobj.decompress(data))
+        # never decompress more than the allowed size (plus one byte, to
+        # tell when it's exceeded)
+        chunk = self._dobj.decompress(data, self.maxsize - self.size + 1)
+        return self._check_size(chunk)
+
+    def _check_size(self, chunk):
+        self.size += len(chunk)
+        if self.maxsize and self.size > self.maxsize:
+            self._state = 'done'
+            raise DecompressionMaxSizeExceeded(self.size)
+        return chunk
+
+
+def _gzip_header_size(data):
+    """Return the size of the gzip member header at the start of data, or
+    None if data is too short to contain it"""
+    if len(data) < 10:
+        return None
+    if data[:3] != '\x1f\x8b\x08':
+        raise IOError('Not a gzipped file')
+    flags = ord(data[3])
+    pos = 10
+    if flags & 4:  # FEXTRA
+        if len(data) < pos + 2:
+            return None
+        pos += 2 + struct.unpack('<H', data[pos:pos + 2])[0]
+    for flag in (8, 16):  # FNAME, FCOMMENT
+        if flags & flag:
+            end = data.find('\0', pos)
+            if end == -1:
+                return None
+            pos = end + 1
+    if flags & 2:  # FHCRC
+        pos += 2
+    return pos if len(data) >= pos else None
+
+
+def _deflate_wbits(data):
+    b0, b1 = ord(data[0]), ord(data[1])
+    if b0 & 0x0f == 8 and (b0 << 8 | b1) % 31 == 0:
+        return zlib.MAX_WBITS
+    # raw deflate content that may be sent by microsoft servers. For more
+    # information, see:
+    # http://carsten.codimi.de/gzip.yaws/
+    # http://www.port80software.com/200ok/archive/2005/10/31/868.aspx
+    # http://www.gzip.org/zlib/zlib_faq.html#faq38
+    return -zlib.MAX_WBITS
+
+
+def decompress(data, encoding, maxsize=0):
+    """Decompress the given gzip or deflate encoded data, see
+    ``Decompressor``"""
+    decompressor = Decompressor(encoding, maxsize)
+    output = StringIO()
+    output.write(decompressor.decompress(data))
+    output.write(decompressor.flush())
+    return output.getvalue()
+
+
+def gunzip(data, maxsize=0):
     """Gunzip the given data and return as much data as possible.
 
     This is resilient to CRC checksum errors.
     """
-    f = GzipFile(fileobj=StringIO(data))
-    output = ''
-    chunk = '.'
-    while chunk:
-        try:
-            chunk = f.read(8196)
-            output += chunk
-        except (IOError, EOFError, struct.error):
-            # complete only if there is some data, otherwise re-raise
-            # see issue 87 about catching struct.error
-            # some pages are quite small so output is '' and f.extrabuf
-            # contains the whole page content
-            if output or f.extrabuf:
-                output += f.extrabuf
-                break
-            else:
-                raise
-    return output
+    return decompress(data, 'gzip', maxsize)
+
 
 def is_gzipped(response):
     """Return True if the response is gzipped, or False otherwise"""
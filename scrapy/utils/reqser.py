@@ -2,7 +2,15 @@
 Helper functions for serializing (and deserializing) requests.
 """
 
+import os
+import json
+import marshal
+import cPickle as pickle
+from binascii import hexlify, unhexlify
+
 from scrapy.http import Request
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_fingerprint, _fingerprint_cache
 
 def request_to_dict(request, spider=None):
     """Convert Request object to a dict.
@@ -70,3 +78,99 @@ def _get_method(obj, name):
         return getattr(obj, name)
     except AttributeError:
         raise ValueError("Method %r not found in: %s" % (name, obj))
+
+
+class RequestCodec(object):
+    """Compact binary serialization of requests, used by the scheduler with
+    the ``Compact*DiskQueue`` disk queues.
+
+    Compared to pickling the result of ``request_to_dict``:
+
+    * callback and errback names, and the paths of Request subclasses, are
+      interned in a table, which is saved to ``path`` (if given) as new names
+      are found
+    * the request fingerprint is stored, so it's not computed again when the
+      request is deserialized
+    * GET requests without body, cookies or headers and with a meta which
+      only contains simple types are encoded with marshal
+
+    Serialized requests start with a version byte, and deserializing
+    requests of an unknown version raises ``ValueError``.
+    """
+
+    version = 2
+
+    def __init__(self, path=None):
+        self.path = path
+        self.names = []
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.names = [str(x) for x in json.load(f)]
+        self.nameids = dict((n, i) for i, n in enumerate(self.names))
+
+    def encode(self, request, spider=None):
+        cb = request.callback
+        if callable(cb):
+            cb = _find_method(spider, cb)
+        eb = request.errback
+        if callable(eb):
+            eb = _find_method(spider, eb)
+        cb, eb = self._intern(cb), self._intern(eb)
+        cls = None
+        if type(request) is not Request:
+            cls = self._intern('%s.%s' % (type(request).__module__,
+                                          type(request).__name__))
+        fp = unhexlify(request_fingerprint(request))
+        meta = request._meta or None
+        if request.method == 'GET' and not (request.body or request.cookies
+                or request.headers) and request._encoding == 'utf-8':
+            try:
+                data = marshal.dumps((cls, request.url, cb, eb, request.priority,
+                    request.dont_filter, fp, meta))
+            except ValueError:
+                pass
+            else:
+                return chr(self.version) + 'G' + data
+        try:
+            data = pickle.dumps((cls, request.url, cb, eb, request.priority,
+                request.dont_filter, fp, meta, request.method,
+                dict(request.headers), request.body, request.cookies,
+                request._encoding), protocol=2)
+        except (pickle.PicklingError, TypeError) as e:
+            raise ValueError(str(e))
+        return chr(self.version) + 'P' + data
+
+    def decode(self, data, spider=None):
+        if ord(data[0]) != self.version:
+            raise ValueError("Unsupported request serialization version: %d" % ord(data[0]))
+        if data[1] == 'G':
+            cls, url, cb, eb, priority, dont_filter, fp, meta = marshal.loads(data[2:])
+            kwargs = {}
+        else:
+            cls, url, cb, eb, priority, dont_filter, fp, meta, method, headers, \
+                body, cookies, encoding = pickle.loads(data[2:])
+            kwargs = dict(method=method, headers=headers, body=body,
+                cookies=cookies, encoding=encoding)
+        request_cls = load_object(self._name(cls)) if cls is not None else Request
+        cb, eb = self._name(cb), self._name(eb)
+        if spider:
+            cb = cb and _get_method(spider, cb)
+            eb = eb and _get_method(spider, eb)
+        request = request_cls(url=url, callback=cb, errback=eb, meta=meta,
+            priority=priority, dont_filter=dont_filter, **kwargs)
+        _fingerprint_cache[request] = {None: hexlify(fp)}
+        return request
+
+    def _intern(self, name):
+        if name is None:
+            return None
+        if name not in self.nameids:
+            self.nameids[name] = len(self.names)
+            self.names.append(name)
+            if self.path:
+                with open(self.path, 'w') as f:
+                    json.dump(self.names, f)
+        return self.nameids[name]
+
+    def _name(self, nameid):
+        return None if nameid is None else self.names[nameid]
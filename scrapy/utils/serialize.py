@@ -7,6 +7,7 @@ from twisted.internet import defer
 
 from scrapy.spider import Spider
 from scrapy.http import Request, Response
+from scrapy.http.mappedbody import MappedBody
 from scrapy.item import BaseItem
 
 
@@ -99,6 +100,8 @@ class ScrapyJSONEncoder(json.JSONEncoder):
             return str(o)
         elif isinstance(o, defer.Deferred):
             return str(o)
+        elif isinstance(o, MappedBody):
+            return str(o)
         elif isinstance(o, BaseItem):
             return dict(o)
         elif isinstance(o, Request):
@@ -0,0 +1,52 @@
+"""
+Helper functions for the timings of the phases a request goes through, kept in
+the ``timings`` request meta key.
+
+See documentation in docs/topics/request-response.rst
+"""
+
+# upper bounds (in seconds) of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+
+def get_timings(request):
+    """Return the timings of the request, or None if they aren't collected
+    (the engine only collects them with TIMINGS_STATS)"""
+    timings = request.meta.get('timings')
+    return timings if isinstance(timings, dict) else None
+
+
+def add_timing(request, phase, seconds):
+    """Record the seconds a request spent in the given phase, if its timings
+    are collected"""
+    timings = get_timings(request)
+    if timings is not None:
+        timings[phase] = seconds
+
+
+def bucket_for(seconds):
+    """Return the name of the histogram bucket for the given seconds"""
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return 'le_%g' % bound
+    return 'le_inf'
+
+
+def record_timings(stats, request, spider=None, per_slot=False):
+    """Add the timings of the request to the histograms in the stats, and
+    to the histograms of its download slot if per_slot is True"""
+    timings = get_timings(request)
+    if not timings:
+        return
+    prefixes = ['timings']
+    slot = request.meta.get('download_slot')
+    if per_slot and slot is not None:
+        prefixes.append('timings/slots/%s' % slot)
+    for phase, seconds in timings.iteritems():
+        bucket = bucket_for(seconds)
+        for prefix in prefixes:
+            key = '%s/%s/' % (prefix, phase)
+            stats.inc_value(key + bucket, spider=spider)
+            stats.inc_value(key + 'count', spider=spider)
+            stats.inc_value(key + 'total', seconds, spider=spider)
+            stats.max_value(key + 'max', seconds, spider=spider)
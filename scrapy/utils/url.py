@@ -5,6 +5,7 @@ library.
 Some of the functions that used to be imported from this module have been moved
 to the w3lib.url module. Always import those from there instead.
 """
+import re
 import posixpath
 import urlparse
 import urllib
@@ -12,7 +13,20 @@ import cgi
 
 # scrapy.utils.url was moved to w3lib.url and import * ensures this move doesn't break old code
 from w3lib.url import *
+from w3lib.url import _safe_chars
 from scrapy.utils.python import unicode_to_str
+from scrapy.utils.datatypes import GenerationalCache
+
+# canonicalized urls, by raw url
+_canonicalize_cache = GenerationalCache(10000)
+
+# http(s) urls without query, params, fragment or percent-escapes, whose path
+# is left untouched by safe_url_string
+_simple_url_re = re.compile(r'(https?)://([^/?#%%\[\]]+)((?:/[%s]*)?)\Z' %
+    re.escape(_safe_chars.translate(None, '%?#;')))
+_safe_path_re = re.compile(r'[%s]*\Z' % re.escape(_safe_chars.translate(None, '%')))
+# query arguments left untouched by unquoting and quoting them again
+_simple_query_re = re.compile(r'(?:[\w.-]*(?:=[\w.-]*)?(?:&|\Z))*\Z')
 
 
 def url_is_from_any_domain(url, domains):
@@ -52,16 +66,51 @@ def canonicalize_url(url, keep_blank_values=True, keep_fragments=False,
 
     For examples see the tests in scrapy.tests.test_utils_url
     """
-
+    if not keep_blank_values or keep_fragments:
+        return _canonicalize_url(url, keep_blank_values, keep_fragments)
+    try:
+        return _canonicalize_cache[url]
+    except KeyError:
+        curl = _canonicalize_cache[url] = _canonicalize_url(url)
+        return curl
+
+
+def _canonicalize_url(url, keep_blank_values=True, keep_fragments=False):
+    if isinstance(url, basestring):
+        m = _simple_url_re.match(unicode_to_str(url))
+        if m:
+            scheme, netloc, path = m.groups()
+            return '%s://%s%s' % (scheme, netloc.lower(), path or '/')
     scheme, netloc, path, params, query, fragment = parse_url(url)
-    keyvals = cgi.parse_qsl(query, keep_blank_values)
-    keyvals.sort()
-    query = urllib.urlencode(keyvals)
-    path = safe_url_string(_unquotepath(path)) or '/'
+    if query:
+        if _simple_query_re.match(query):
+            query = _canonicalize_simple_query(query, keep_blank_values)
+        else:
+            keyvals = cgi.parse_qsl(query, keep_blank_values)
+            keyvals.sort()
+            query = urllib.urlencode(keyvals)
+    if not _safe_path_re.match(path):
+        path = safe_url_string(_unquotepath(path))
+    path = path or '/'
     fragment = '' if not keep_fragments else fragment
     return urlparse.urlunparse((scheme, netloc.lower(), path, params, query, fragment))
 
 
+def _canonicalize_simple_query(query, keep_blank_values):
+    """Same as parsing the query with cgi.parse_qsl, sorting and encoding it
+    again, for queries matching _simple_query_re"""
+    keyvals = []
+    for field in query.split('&'):
+        if '=' in field:
+            key, value = field.split('=', 1)
+            if value or keep_blank_values:
+                keyvals.append((key, value))
+        elif field and keep_blank_values:
+            keyvals.append((field, ''))
+    keyvals.sort()
+    return '&'.join('%s=%s' % kv for kv in keyvals)
+
+
 def _unquotepath(path):
     for reserved in ('2f', '2F', '3f', '3F'):
         path = path.replace('%' + reserved, '%25' + reserved.upper())
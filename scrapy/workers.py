@@ -0,0 +1,376 @@
+"""
+Run a spider in several worker processes, to use more than one CPU core.
+
+Requests are sharded among the workers by download slot (usually the
+hostname), so every site is crawled by a single worker and the download
+delays and concurrency limits are honoured. Requests for sites owned by
+other workers are forwarded to them through the parent process, which also
+detects when all workers are idle, exports the items scraped by all of
+them and merges their stats.
+
+See documentation in docs/topics/practices.rst
+"""
+
+import os
+import sys
+import zlib
+import struct
+import signal
+import pprint
+import datetime
+import cPickle as pickle
+from os.path import join
+
+from twisted.internet import reactor, defer, process, protocol
+from twisted.internet.stdio import StandardIO
+from twisted.protocols.basic import Int32StringReceiver
+
+from scrapy import log, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.contrib.feedexport import FeedExporter
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import load_object
+from scrapy.utils.ossignal import install_shutdown_handlers, signal_names
+from scrapy.utils.reqser import request_to_dict, request_from_dict
+
+# message types (first byte of every message)
+_REQUEST = 'R' # worker -> parent: target worker + request, parent -> worker: request
+_IDLE = 'I' # worker -> parent: number of requests received
+_ITEM = 'T' # worker -> parent: scraped item
+_STATS = 'S' # worker -> parent: final stats
+_CLOSE = 'C' # parent -> worker: close reason
+
+_target = struct.Struct('!H')
+
+# file descriptors of the pipes between the parent and the workers
+_WORKER_READ_FD = 3
+_WORKER_WRITE_FD = 4
+
+
+def worker_for(key, count):
+    """Return the index of the worker which owns the given download slot
+    key, out of ``count`` workers"""
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return (zlib.crc32(str(key)) & 0xffffffff) % count
+
+
+def merge_stats(stats):
+    """Merge the stats of several workers: numbers are added up (except
+    ``*_max`` ones, where the largest is kept), the earliest ``start_time``
+    and latest ``finish_time`` are kept, and other values are kept if all
+    workers agree or listed otherwise"""
+    merged = {}
+    for key in set(k for s in stats for k in s):
+        values = [s[key] for s in stats if key in s]
+        if all(isinstance(v, (int, long, float)) for v in values):
+            merged[key] = max(values) if key.endswith('_max') else sum(values)
+        elif key == 'start_time':
+            merged[key] = min(values)
+        elif key == 'finish_time':
+            merged[key] = max(values)
+        elif all(v == values[0] for v in values):
+            merged[key] = values[0]
+        else:
+            merged[key] = sorted(set(values))
+    return merged
+
+
+class _Channel(Int32StringReceiver):
+
+    MAX_LENGTH = 2 ** 31
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def stringReceived(self, string):
+        self.handler.message_received(string)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        self.handler.connection_lost()
+
+
+class WorkerScheduler(object):
+    """Scheduler used by the worker processes. It forwards the requests for
+    download slots owned by other workers to them, and passes the rest (and
+    the ones forwarded by other workers) to the scheduler in the
+    ``WORKER_SCHEDULER`` setting.
+
+    The spider is kept open while it's idle, until the parent process finds
+    all workers idle and tells them to close. Start requests are generated
+    by all workers, and each one only keeps the ones it owns.
+    """
+
+    def __init__(self, crawler, scheduler, workerid, count):
+        self.crawler = crawler
+        self.scheduler = scheduler
+        self.workerid = workerid
+        self.count = count
+        self.stats = crawler.stats
+        self.sent = 0
+        self.received = 0
+        self.reported = None
+        self.closing = False
+        self.channel = _Channel(self)
+        self.disconnected = defer.Deferred()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        scheduler = load_object(settings['WORKER_SCHEDULER']).from_crawler(crawler)
+        o = cls(crawler, scheduler, settings.getint('WORKER_ID'),
+            settings.getint('WORKER_COUNT'))
+        crawler.signals.connect(o.spider_idle, signals.spider_idle)
+        crawler.signals.connect(o.spider_closed, signals.spider_closed)
+        if settings.getbool('WORKER_EXPORT_ITEMS'):
+            crawler.signals.connect(o.item_scraped, signals.item_scraped)
+        return o
+
+    def has_pending_requests(self):
+        return self.scheduler.has_pending_requests()
+
+    def open(self, spider):
+        self.spider = spider
+        slot = self.crawler.engine.slot
+        slot.start_requests = (r for r in slot.start_requests if self._owned(r))
+        StandardIO(self.channel, stdin=_WORKER_WRITE_FD, stdout=_WORKER_READ_FD)
+        return self.scheduler.open(spider)
+
+    def close(self, reason):
+        return self.scheduler.close(reason)
+
+    def enqueue_request(self, request):
+        owner = self._owner(request)
+        if owner != self.workerid:
+            try:
+                data = pickle.dumps(request_to_dict(request, self.spider), protocol=2)
+            except (ValueError, TypeError, pickle.PicklingError) as e:
+                log.msg(format="Unable to forward request to worker %(owner)d, "
+                        "crawling it here: %(request)s - reason: %(reason)s",
+                        level=log.ERROR, spider=self.spider, owner=owner,
+                        request=request, reason=e)
+            else:
+                self.channel.sendString(_REQUEST + _target.pack(owner) + data)
+                self.sent += 1
+                self.stats.inc_value('workers/forwarded', spider=self.spider)
+                return
+        return self.scheduler.enqueue_request(request)
+
+    def next_request(self):
+        return self.scheduler.next_request()
+
+    def __len__(self):
+        return len(self.scheduler)
+
+    def message_received(self, message):
+        kind, data = message[0], message[1:]
+        if kind == _REQUEST:
+            self.received += 1
+            if self.crawler.engine.slot is None:
+                return
+            request = request_from_dict(pickle.loads(data), self.spider)
+            self.stats.inc_value('workers/received', spider=self.spider)
+            self.crawler.engine.crawl(request, self.spider)
+        elif kind == _CLOSE:
+            self._close_spider(data)
+
+    def connection_lost(self):
+        self.disconnected.callback(None)
+        self._close_spider('shutdown')
+
+    def spider_idle(self, spider):
+        if self.closing:
+            return
+        slot = self.crawler.engine.slot
+        if slot.start_requests is not None:
+            # only start requests owned by other workers were left
+            slot.nextcall.schedule()
+        elif self.reported != (self.sent, self.received):
+            self.channel.sendString(_IDLE + pickle.dumps(self.received, protocol=2))
+            self.reported = (self.sent, self.received)
+        raise DontCloseSpider
+
+    def item_scraped(self, item, spider):
+        try:
+            data = pickle.dumps(item, protocol=2)
+        except Exception:
+            log.err(None, "Unable to send item to the parent process", spider=spider)
+        else:
+            self.channel.sendString(_ITEM + data)
+
+    def spider_closed(self, spider, reason):
+        self.closing = True
+        stats = self.stats.get_stats(spider)
+        self.channel.sendString(_STATS + pickle.dumps(stats, protocol=2))
+        self.channel.transport.loseConnection()
+        return self.disconnected
+
+    def _close_spider(self, reason):
+        if not self.closing and self.crawler.engine.slot is not None:
+            self.closing = True
+            self.crawler.engine.close_spider(self.spider, reason)
+
+    def _owned(self, request):
+        return self._owner(request) == self.workerid
+
+    def _owner(self, request):
+        key = request.meta.get('download_slot') or urlparse_cached(request).hostname or ''
+        return worker_for(key, self.count)
+
+
+class _WorkerProcess(protocol.ProcessProtocol):
+
+    def __init__(self, pool, workerid):
+        self.pool = pool
+        self.workerid = workerid
+        self.channel = _Channel(self)
+
+    def childDataReceived(self, fd, data):
+        if fd == _WORKER_READ_FD:
+            self.channel.dataReceived(data)
+
+    def message_received(self, message):
+        self.pool.message_received(self.workerid, message)
+
+    def connection_lost(self):
+        pass
+
+    def send(self, message):
+        self.transport.writeToChild(_WORKER_WRITE_FD,
+            struct.pack(self.channel.structFormat, len(message)) + message)
+
+    def processEnded(self, reason):
+        self.pool.worker_ended(self.workerid, reason.value.exitCode)
+
+
+class WorkerPool(object):
+    """Run the given spider in ``count`` worker processes (started with the
+    ``crawl`` command) and coordinate them"""
+
+    def __init__(self, settings, spider, spargs, count):
+        self.settings = settings
+        self.spider = spider
+        self.spargs = spargs
+        self.count = count
+        self.workers = {}
+        self.relayed = [0] * count # requests forwarded to each worker
+        self.idle = [None] * count # requests received by each idle worker
+        self.stats = {}
+        self.closing = False
+        self.exitcode = 0
+        try:
+            self.exporter = FeedExporter(settings)
+        except NotConfigured:
+            self.exporter = None
+
+    def start(self):
+        log.scrapy_info(self.settings)
+        self.sflo = log.start_from_settings(self.settings)
+        install_shutdown_handlers(self._signal_shutdown)
+        signal.signal(signal.SIGCHLD, self._sigchld)
+        if self.exporter:
+            self.exporter.open_spider(self.spider)
+        for workerid in range(self.count):
+            self._spawn(workerid)
+        process.reapAllProcesses()
+        reactor.run(installSignalHandlers=False) # blocking call
+
+    def message_received(self, workerid, message):
+        kind, data = message[0], message[1:]
+        if kind == _REQUEST:
+            target, = _target.unpack_from(data)
+            if target in self.workers:
+                self.workers[target].send(_REQUEST + data[_target.size:])
+                self.relayed[target] += 1
+            else:
+                log.msg(format="Dropped request for finished worker %(target)d",
+                        level=log.WARNING, target=target)
+        elif kind == _IDLE:
+            self.idle[workerid] = pickle.loads(data)
+            self._check_idle()
+        elif kind == _ITEM:
+            if self.exporter:
+                self.exporter.item_scraped(pickle.loads(data), self.spider)
+        elif kind == _STATS:
+            self.stats[workerid] = pickle.loads(data)
+
+    def worker_ended(self, workerid, exitcode):
+        del self.workers[workerid]
+        if exitcode:
+            self.exitcode = 1
+        log.msg(format="Worker %(workerid)d finished (exit code: %(exitcode)s)",
+                workerid=workerid, exitcode=exitcode)
+        if self.workers:
+            self._check_idle()
+        else:
+            self._finish()
+
+    def _spawn(self, workerid):
+        overrides = dict(self.settings.overrides)
+        overrides.update({
+            'WORKER_ID': workerid,
+            'WORKER_COUNT': self.count,
+            'WORKER_SCHEDULER': self.settings['SCHEDULER'],
+            'WORKER_EXPORT_ITEMS': self.exporter is not None,
+            'SCHEDULER': 'scrapy.workers.WorkerScheduler',
+            'FEED_URI': None,
+        })
+        if self.settings['JOBDIR']:
+            overrides['JOBDIR'] = join(self.settings['JOBDIR'], 'worker-%d' % workerid)
+        env = os.environ.copy()
+        env['SCRAPY_PICKLED_SETTINGS_TO_OVERRIDE'] = pickle.dumps(overrides)
+        args = [sys.executable, '-m', 'scrapy.cmdline', 'crawl', self.spider.name]
+        for name, value in self.spargs.iteritems():
+            args += ['-a', '%s=%s' % (name, value)]
+        worker = _WorkerProcess(self, workerid)
+        reactor.spawnProcess(worker, sys.executable, args, env, childFDs={
+            0: 0, 1: 1, 2: 2, _WORKER_READ_FD: 'r', _WORKER_WRITE_FD: 'w'})
+        self.workers[workerid] = worker
+
+    def _check_idle(self):
+        """Close the workers if all of them are idle and have received all
+        the requests forwarded to them"""
+        if all(self.idle[w] == self.relayed[w] for w in self.workers):
+            self._close_workers('finished')
+
+    def _close_workers(self, reason):
+        if not self.closing:
+            self.closing = True
+            for worker in self.workers.values():
+                worker.send(_CLOSE + reason)
+
+    def _finish(self):
+        stats = merge_stats(self.stats.values())
+        if self.exporter:
+            d = defer.maybeDeferred(self.exporter.close_spider, self.spider)
+        else:
+            d = defer.succeed(None)
+        d.addBoth(lambda _: log.msg("Dumping merged Scrapy stats of %d workers:\n%s" % \
+            (self.count, pprint.pformat(stats))))
+        d.addBoth(lambda _: self._stop_reactor())
+
+    def _sigchld(self, signum, _):
+        reactor.callFromThread(process.reapAllProcesses)
+
+    def _signal_shutdown(self, signum, _):
+        install_shutdown_handlers(self._signal_kill)
+        signame = signal_names[signum]
+        log.msg(format="Received %(signame)s, shutting down workers gracefully. "
+                "Send again to force ", level=log.INFO, signame=signame)
+        reactor.callFromThread(self._close_workers, 'shutdown')
+
+    def _signal_kill(self, signum, _):
+        install_shutdown_handlers(signal.SIG_IGN)
+        signame = signal_names[signum]
+        log.msg(format='Received %(signame)s twice, killing workers',
+                level=log.INFO, signame=signame)
+        for worker in self.workers.values():
+            reactor.callFromThread(worker.transport.signalProcess, 'KILL')
+
+    def _stop_reactor(self):
+        if self.sflo:
+            self.sflo.stop()
+        try:
+            reactor.stop()
+        except RuntimeError: # raised if already stopped or in shutdown stage
+            pass